@@ -9,12 +9,14 @@ from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.forms import UserChangeForm
-from backend.models import User
+from backend import search
+from backend.models import User, RegistrationKey, RevokedToken
+from backend.pagination import KeysetChangeList
 
 class UserAdmin(BaseUserAdmin):
 	form = UserChangeForm
 	fieldsets = (
-		(None, {'fields': ('username', 'email', 'password', 'first_name', 'last_name')}),
+		(None, {'fields': ('username', 'email', 'password', 'first_name', 'last_name', 'cohort')}),
 		(_('Permissions'), {'fields': ('is_active', 'is_staff', 'is_superuser', 'groups', 'user_permissions')}),
 		(_('Important dates'), {'fields': ('last_login', 'date_joined')}),
 		# (_('user_info'), {'fields': ('native_name', 'phone_no')}),
@@ -25,6 +27,35 @@ class UserAdmin(BaseUserAdmin):
 	list_display = ['username', 'email', 'first_name', 'last_name', 'is_staff', 'is_superuser']
 	search_fields = ('username', 'email', 'first_name', 'last_name')
 	ordering = ('username', )
+	keyset_field = 'username'
+	# counting every user on each page load costs as much as the scan the search index avoids
+	show_full_result_count = False
 
+	def get_changelist(self, request, **kwargs) :
+		return KeysetChangeList
 
-admin.site.register(User, UserAdmin)
\ No newline at end of file
+	def get_search_results(self, request, queryset, search_term) :
+		results = search.search(queryset, search_term)
+		if results is None :
+			return super().get_search_results(request, queryset, search_term)
+
+		return results, False
+
+
+class RegistrationKeyAdmin(admin.ModelAdmin):
+	list_display = ['key', 'label', 'seats_used', 'seat_limit', 'expires_at', 'is_active']
+	list_filter = ('is_active', )
+	search_fields = ('key', 'label')
+	readonly_fields = ('seats_used', 'created_at')
+	ordering = ('-created_at', )
+
+
+class RevokedTokenAdmin(admin.ModelAdmin):
+	list_display = ['jti', 'revoked_at', 'expires_at']
+	search_fields = ('jti', )
+	ordering = ('-revoked_at', )
+
+
+admin.site.register(User, UserAdmin)
+admin.site.register(RegistrationKey, RegistrationKeyAdmin)
+admin.site.register(RevokedToken, RevokedTokenAdmin)
\ No newline at end of file
@@ -0,0 +1,34 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+from django.apps import AppConfig
+from django.contrib.admin import apps as admin_apps
+from django.contrib.admin.checks import check_admin_app
+from django.core import checks
+from django.db.models.signals import post_migrate
+
+class BackendConfig(AppConfig) :
+	name = 'backend'
+
+	def ready(self) :
+		from . import signals
+		from .hashers import calibrate_if_needed
+		from .search import create_user_search_index
+
+		post_migrate.connect(create_user_search_index, sender=self)
+		calibrate_if_needed()
+
+class RoutedAdminConfig(admin_apps.AdminConfig) :
+	"""The admin, checking for the middleware it needs in its MIDDLEWARE_ROUTES chain, see backend.middleware"""
+	default = False
+
+	def ready(self) :
+		from .middleware import check_admin_middleware
+
+		# in place of AdminConfig.ready(), whose dependency checks only look in MIDDLEWARE
+		checks.register(check_admin_middleware, checks.Tags.admin)
+		checks.register(check_admin_app, checks.Tags.admin)
+		self.module.autodiscover()
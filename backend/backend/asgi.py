@@ -0,0 +1,13 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+application = get_asgi_application()
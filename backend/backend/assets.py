@@ -0,0 +1,99 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import os
+import re
+import mimetypes
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+
+from backend.cache import LRUCache
+from backend.compression import choose_encoding, etag_matches
+
+# webpack (through create-react-app) already puts a content hash in the names of the files it builds
+BUILD_HASH_RE = re.compile(r'\.[0-9a-f]{8,}\.')
+
+SUFFIXES = {'br' : '.br', 'gzip' : '.gz'}
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+_assets = LRUCache(4096)
+_hashed_names = None
+
+@receiver(setting_changed)
+def _reset(setting, **kwargs) :
+	global _hashed_names
+
+	if setting in ('STATIC_ROOT', 'STATICFILES_STORAGE') :
+		_assets.clear()
+		_hashed_names = None
+
+def _is_hashed(path) :
+	global _hashed_names
+
+	if _hashed_names is None :
+		_hashed_names = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+	return path in _hashed_names or BUILD_HASH_RE.search(os.path.basename(path)) is not None
+
+def _find(path) :
+	"""Returns what is needed to serve path: its variants by encoding, content type and cache policy"""
+	asset = _assets.get(path)
+
+	if asset is None :
+		try :
+			fullpath = safe_join(settings.STATIC_ROOT, path)
+		except SuspiciousFileOperation :
+			return None
+
+		if not os.path.isfile(fullpath) :
+			return None
+
+		variants = {}
+		for encoding, suffix in (('identity', ''), ) + tuple(SUFFIXES.items()) :
+			if os.path.isfile(fullpath + suffix) :
+				st = os.stat(fullpath + suffix)
+				variants[encoding] = (fullpath + suffix, '"%x-%x"' % (st.st_mtime_ns, st.st_size))
+
+		content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+		asset = (variants, content_type, IMMUTABLE if _is_hashed(path) else REVALIDATE)
+
+		# files under STATIC_ROOT only change when collectstatic runs, which is followed by a restart
+		if not settings.DEBUG :
+			_assets.set(path, asset)
+
+	return asset
+
+def serve(request, path) :
+	"""Serves collected static files, picking the precompressed sibling the client accepts"""
+	asset = _find(path)
+	if asset is None :
+		raise Http404("Static file does not exist")
+
+	variants, content_type, cache_control = asset
+	encoding = choose_encoding(request, variants)
+	fullpath, etag = variants[encoding]
+
+	if etag_matches(request, etag) :
+		response = HttpResponseNotModified()
+	else :
+		response = FileResponse(open(fullpath, 'rb'), content_type=content_type)
+		# FileResponse names the file it was given, assets are shown rather than downloaded
+		del response['Content-Disposition']
+		if encoding != 'identity' :
+			response['Content-Encoding'] = encoding
+
+	response['ETag'] = etag
+	response['Vary'] = 'Accept-Encoding'
+	response['Cache-Control'] = cache_control
+	return response
@@ -0,0 +1,218 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import json
+import math
+import logging
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth import authenticate, user_login_failed, _clean_credentials, _get_backends
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
+from django.shortcuts import render
+
+from backend import registration_keys
+from backend.hashing import HashPoolSaturated, ahash_password
+from backend.log import log_auth
+from backend.metrics import timed
+from backend.serealizers import RegisterUserSerializer
+from backend.spa import spa_shell
+from backend.throttling import check_throttles, throttled_message, UsernameRateThrottle, IPRateThrottle, GlobalRateThrottle
+from backend.usernames import username_filter
+from backend.utils import (
+	get_tokens_for_user,
+	is_secret_key_valid,
+	STATUS_CODE_2xx,
+	STATUS_CODE_4xx,
+	STATUS_CODE_5xx
+)
+from backend.views import (
+	serializer_error_message,
+	INVALID_SECRET_KEY_RESPONSE,
+	NO_SEATS_LEFT_RESPONSE,
+	USERNAME_TAKEN_RESPONSE,
+	REGISTRATION_FAILED_RESPONSE,
+	UNKNOWN_USERNAME_RESPONSE,
+	INCORRECT_DETAILS_RESPONSE,
+	SERVER_BUSY_RESPONSE
+)
+
+# Async versions of the auth and frontend views, used in place of the ones in backend.views when ASYNC_VIEWS is set.
+# Django 3.2 has no async ORM, so database work is batched into as few sync_to_async calls as possible and hashing waits
+# on the hash pool (or a thread of its own) without holding the thread the ORM runs on.
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_CLASSES = [UsernameRateThrottle, IPRateThrottle, GlobalRateThrottle]
+
+def _response(data, status, headers=None) :
+	# the same compact body DRF's JSONRenderer writes
+	response = JsonResponse(data, status=status, json_dumps_params={'separators' : (',', ':'), 'ensure_ascii' : False})
+
+	for name, value in (headers or {}).items() :
+		response[name] = value
+
+	return response
+
+def _method_not_allowed(request, allowed) :
+	response = _response({"detail" : 'Method "%s" not allowed.' % request.method}, STATUS_CODE_4xx.METHOD_NOT_ALLOWED.value)
+	response['Allow'] = ', '.join(allowed)
+	return response
+
+async def _throttled(request) :
+	"""Returns a 429 response if the request is over a limit, before anything is hashed"""
+	if settings.THROTTLING['SHARED_CACHE'] :
+		wait = await sync_to_async(check_throttles)(request, THROTTLE_CLASSES)
+	else :
+		# the in-process buckets never block, so there is no need for a thread
+		wait = check_throttles(request, THROTTLE_CLASSES)
+
+	if wait is None :
+		return None
+
+	wait = math.ceil(wait or 1)
+	return _response({"message" : throttled_message(wait)}, STATUS_CODE_4xx.TOO_MANY_REQUESTS.value, {"Retry-After" : str(wait)})
+
+async def _authenticate(request, user, password) :
+	"""
+	authenticate() for a user already loaded. When every backend can check passwords without a thread they are tried in
+	turn here, sending user_login_failed as authenticate() does, otherwise authenticate() runs in a thread.
+	"""
+	backends = _get_backends(return_tuples=True)
+
+	if not all(hasattr(backend, 'aauthenticate') for backend, backend_path in backends) :
+		return await sync_to_async(authenticate)(request, user=user, password=password)
+
+	for backend, backend_path in backends :
+		authenticated = await backend.aauthenticate(request, user=user, password=password)
+
+		if authenticated is not None :
+			authenticated.backend = backend_path
+			return authenticated
+
+	await sync_to_async(user_login_failed.send)(sender=authenticate.__module__, credentials=_clean_credentials({'user' : user, 'password' : password}), request=request)
+	return None
+
+def _validate_registration(req) :
+	"""Returns (serializer, error response) for a registration, checking the secret key and the serializer in one go"""
+	if not is_secret_key_valid(req["secret_key"]) :
+		log_auth('register', 'invalid_secret_key', req.get("username"), logging.WARNING)
+		return None, INVALID_SECRET_KEY_RESPONSE.response()
+
+	serealizer = RegisterUserSerializer(data=req)
+
+	with timed('auth_step_duration_seconds', step='validate') :
+		valid = serealizer.is_valid()
+
+	if not valid :
+		log_auth('register', 'invalid', req.get("username"))
+		return None, _response({"message": serializer_error_message(serealizer)}, STATUS_CODE_4xx.BAD_REQUEST.value)
+
+	return serealizer, None
+
+def _create_user(serealizer, secret_key, password_hash) :
+	try :
+		with transaction.atomic() :
+			if not registration_keys.claim_seats(secret_key) :
+				log_auth('register', 'no_seats_left', serealizer.validated_data.get('username'), logging.WARNING)
+				return None, NO_SEATS_LEFT_RESPONSE.response()
+
+			with timed('auth_step_duration_seconds', step='create') :
+				return serealizer.save(password_hash=password_hash, cohort=registration_keys.cohort(secret_key)), None
+
+	except IntegrityError :
+		# registered by someone else since the username was validated
+		log_auth('register', 'username_taken', serealizer.validated_data.get('username'))
+		return None, USERNAME_TAKEN_RESPONSE.response()
+
+async def register(request) :
+	if request.method != 'POST' :
+		return _method_not_allowed(request, ['POST', 'OPTIONS'])
+
+	throttled = await _throttled(request)
+	if throttled is not None :
+		return throttled
+
+	try :
+		req = json.loads(request.body.decode('utf-8'))
+
+		serealizer, error = await sync_to_async(_validate_registration)(req)
+		if error is not None :
+			return error
+
+		password_hash = await ahash_password(serealizer.validated_data['password'])
+
+		ret_user, error = await sync_to_async(_create_user)(serealizer, req["secret_key"], password_hash)
+		if error is not None :
+			return error
+
+		log_auth('register', 'created', ret_user.username)
+		return _response({
+			"tokens" : get_tokens_for_user(ret_user),
+			"username" : ret_user.username
+		}, STATUS_CODE_2xx.CREATED.value)
+
+	except HashPoolSaturated :
+		log_auth('register', 'server_busy', None, logging.WARNING)
+		return SERVER_BUSY_RESPONSE.response()
+
+	except Exception :
+		logger.exception("Registration failed")
+		return REGISTRATION_FAILED_RESPONSE.response()
+
+async def login(request) :
+	if request.method != 'PUT' :
+		return _method_not_allowed(request, ['PUT', 'OPTIONS'])
+
+	throttled = await _throttled(request)
+	if throttled is not None :
+		return throttled
+
+	try :
+		req = json.loads(request.body.decode('utf-8'))
+
+		user = await sync_to_async(username_filter.get_user)(req['username'])
+
+		if user is None :
+			log_auth('login', 'unknown_username', req['username'], logging.WARNING)
+			return UNKNOWN_USERNAME_RESPONSE.response()
+
+		with timed('auth_step_duration_seconds', step='authenticate') :
+			user = await _authenticate(request, user, req['password'])
+
+		if user :
+			log_auth('login', 'success', user.username)
+			return _response({
+				"tokens" : get_tokens_for_user(user),
+				"username" : user.username
+			}, STATUS_CODE_2xx.ACCEPTED.value)
+
+		else :
+			log_auth('login', 'incorrect_password', req['username'], logging.WARNING)
+			return INCORRECT_DETAILS_RESPONSE.response()
+
+	except HashPoolSaturated :
+		log_auth('login', 'server_busy', None, logging.WARNING)
+		return SERVER_BUSY_RESPONSE.response()
+
+	except Exception :
+		logger.exception("Login failed")
+		return INCORRECT_DETAILS_RESPONSE.response()
+
+async def frontend(request) :
+	if request.method not in ('GET', 'HEAD') :
+		return _method_not_allowed(request, ['GET', 'HEAD'])
+
+	if settings.SPA_SHELL_PRECOMPILED :
+		return spa_shell.response(request)
+
+	return render(request, 'index.html')
+
+# csrf_exempt's wrapper is not a coroutine function in Django 3.2, so the flag it sets is set directly
+register.csrf_exempt = True
+login.csrf_exempt = True
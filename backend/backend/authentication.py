@@ -0,0 +1,82 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import time
+import hashlib
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from backend.cache import LRUCache
+from backend.user_cache import user_cache
+
+_tokens = None
+
+def _get_tokens() :
+	global _tokens
+
+	if _tokens is None :
+		_tokens = LRUCache(settings.ACCESS_TOKEN_CACHE['MAX_SIZE'])
+
+	return _tokens
+
+def forget_user_tokens(user) :
+	"""Drops every cached token belonging to a user, so that their next request is fully verified again"""
+	user_id = getattr(user, api_settings.USER_ID_FIELD)
+	legacy_claim = settings.LEGACY_USER_ID_CLAIM
+
+	_get_tokens().delete_matching(lambda token : token.get(api_settings.USER_ID_CLAIM) == user_id or (
+		legacy_claim is not None and token.get(legacy_claim) == user.username
+	))
+
+class CachedJWTAuthentication(JWTAuthentication) :
+	"""
+	JWTAuthentication that remembers access tokens it has already verified, keyed by a digest of the raw token,
+	so that repeat requests with the same token skip the signature check and claim parsing. Entries expire with the
+	token, or sooner if ACCESS_TOKEN_LIFETIME has been shortened since it was issued.
+	"""
+
+	def get_validated_token(self, raw_token) :
+		tokens = _get_tokens()
+		digest = hashlib.blake2b(raw_token, digest_size=20).digest()
+
+		validated_token = tokens.get(digest)
+		if validated_token is not None :
+			return validated_token
+
+		validated_token = super().get_validated_token(raw_token)
+
+		now = time.time()
+		lifetime = api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+
+		expires_at = min(validated_token['exp'], now + lifetime)
+		if 'iat' in validated_token :
+			expires_at = min(expires_at, validated_token['iat'] + lifetime)
+
+		if expires_at > now :
+			tokens.set(digest, validated_token, expires_at=expires_at)
+
+		return validated_token
+
+	def get_user(self, validated_token) :
+		legacy_claim = settings.LEGACY_USER_ID_CLAIM
+
+		if api_settings.USER_ID_CLAIM in validated_token :
+			user = user_cache.get_user_by_id(validated_token[api_settings.USER_ID_CLAIM])
+		elif legacy_claim is not None and legacy_claim in validated_token :
+			user = user_cache.get_user(validated_token[legacy_claim])
+		else :
+			raise InvalidToken(_('Token contained no recognizable user identification'))
+
+		if user is None :
+			raise AuthenticationFailed(_('User not found'), code='user_not_found')
+		if not user.is_active :
+			raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+		return user
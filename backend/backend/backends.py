@@ -0,0 +1,111 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import threading
+import concurrent.futures
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import get_hasher, identify_hasher
+from django.db import connection
+
+from backend.hashing import hash_password, verify_password, averify_password
+from backend.user_cache import user_cache
+
+UserModel = get_user_model()
+
+_rehash_executor = None
+_rehash_lock = threading.Lock()
+_rehashing = set()
+
+def _get_rehash_executor() :
+	global _rehash_executor
+
+	if _rehash_executor is None :
+		with _rehash_lock :
+			if _rehash_executor is None :
+				_rehash_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='rehash')
+
+	return _rehash_executor
+
+def rehash_password(username, encoded, password, user_id=None) :
+	"""Replaces a user's password hash with one at the current cost, unless the password was changed in the meantime"""
+	try :
+		if UserModel._default_manager.filter(username=username, password=encoded).update(password=hash_password(password)) :
+			# update() sends no post_save, so the cached copies have to be dropped here
+			user_cache.invalidate(username, user_id)
+	finally :
+		with _rehash_lock :
+			_rehashing.discard(username)
+
+def _rehash_in_background(username, encoded, password, user_id) :
+	try :
+		rehash_password(username, encoded, password, user_id)
+	finally :
+		connection.close()
+
+class PooledModelBackend(ModelBackend) :
+	"""ModelBackend that checks passwords through backend.hashing, so bcrypt can run on the hash pool instead of the request thread"""
+
+	def authenticate(self, request, username=None, password=None, user=None, **kwargs) :
+		"""Callers that have already loaded the user can pass it as user= to save fetching the same row again"""
+		if user is None :
+			if username is None :
+				username = kwargs.get(UserModel.USERNAME_FIELD)
+			if username is None or password is None :
+				return None
+
+			try :
+				user = UserModel._default_manager.get_by_natural_key(username)
+			except UserModel.DoesNotExist :
+				# hash anyway so that unknown usernames take as long as known ones, as ModelBackend does
+				hash_password(password)
+				return None
+
+		elif password is None :
+			return None
+
+		if verify_password(password, user.password) and self.user_can_authenticate(user) :
+			self.upgrade_password(user, password)
+			return user
+
+		return None
+
+	async def aauthenticate(self, request, user, password) :
+		"""authenticate() for async views, for a user they have already loaded"""
+		if password is None or not await averify_password(password, user.password) or not self.user_can_authenticate(user) :
+			return None
+
+		if self.needs_upgrade(user) :
+			await sync_to_async(self.upgrade_password)(user, password)
+
+		return user
+
+	def needs_upgrade(self, user) :
+		preferred = get_hasher()
+		return identify_hasher(user.password).algorithm != preferred.algorithm or preferred.must_update(user.password)
+
+	def upgrade_password(self, user, password) :
+		"""
+		Rehashes passwords stored with another algorithm or cost, see backend.hashers. With ASYNC_REHASH this happens
+		after the login has been answered, so a change of cost does not slow the logins that carry it out.
+		"""
+		if not self.needs_upgrade(user) :
+			return
+
+		with _rehash_lock :
+			# a user logging in repeatedly before the first rehash lands only needs it once
+			if user.username in _rehashing :
+				return
+			_rehashing.add(user.username)
+
+		if settings.PASSWORD_HASH_CALIBRATION['ASYNC_REHASH'] :
+			_get_rehash_executor().submit(_rehash_in_background, user.username, user.password, password, user.pk)
+		else :
+			rehash_password(user.username, user.password, password, user.pk)
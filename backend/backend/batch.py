@@ -0,0 +1,138 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import io
+import json
+import logging
+
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.urls import resolve, Resolver404
+
+from backend.utils import STATUS_CODE_4xx, STATUS_CODE_5xx
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+# sub-requests may not batch further or reach the cookie authenticated admin
+EXCLUDED_PATHS = ('/batch/', '/admin/')
+
+_handler = None
+
+@receiver(setting_changed)
+def _reset(setting, **kwargs) :
+	global _handler
+
+	if setting in ('MIDDLEWARE', 'MIDDLEWARE_ROUTES') :
+		_handler = None
+
+def _get_handler() :
+	"""A handler with the MIDDLEWARE the server runs, so sub-requests are logged, measured and routed like any other"""
+	global _handler
+
+	if _handler is None :
+		handler = BaseHandler()
+		handler.load_middleware()
+		_handler = handler
+
+	return _handler
+
+class BatchError(ValueError) :
+	pass
+
+def parse_batch(body) :
+	"""Reads a batch ({"requests": [{"method": ..., "path": ..., "body": ...}, ...]}) with paths relative to the API root"""
+	try :
+		req = json.loads(body.decode('utf-8'))
+	except ValueError :
+		raise BatchError("Batch could not be read, please supply JSON")
+
+	if not isinstance(req, dict) or not isinstance(req.get('requests'), list) or not req['requests'] :
+		raise BatchError("Batch must contain a list of requests")
+
+	if len(req['requests']) > settings.BATCH_REQUESTS['MAX_REQUESTS'] :
+		raise BatchError("Batch is too large, it must contain at most %d requests" % settings.BATCH_REQUESTS['MAX_REQUESTS'])
+
+	entries = []
+	for entry in req['requests'] :
+		if not isinstance(entry, dict) or entry.get('method') not in METHODS :
+			raise BatchError("Each request must have a method, one of %s" % ', '.join(METHODS))
+
+		path = entry.get('path')
+		if not isinstance(path, str) or not path.startswith('/') or path.startswith(EXCLUDED_PATHS) :
+			raise BatchError("Each request must have a path in the API, other than a batch or the admin")
+
+		entries.append((entry['method'], path, entry.get('body')))
+
+	return entries
+
+def _sub_request(request, method, path, body, root) :
+	path, _, query = path.partition('?')
+	data = json.dumps(body).encode('utf-8') if body is not None else b''
+
+	# headers such as Authorization and the client's address carry over from the batch
+	environ = {key : value for key, value in request.META.items() if isinstance(value, str)}
+	environ.update({
+		'REQUEST_METHOD' : method,
+		'SCRIPT_NAME' : '',
+		'PATH_INFO' : root + path,
+		'QUERY_STRING' : query,
+		'CONTENT_TYPE' : 'application/json',
+		'CONTENT_LENGTH' : str(len(data)),
+		'wsgi.input' : io.BytesIO(data),
+		'wsgi.url_scheme' : request.scheme,
+	})
+
+	return WSGIRequest(environ)
+
+def _result(response) :
+	if response.streaming :
+		response.close()
+		return {"status" : STATUS_CODE_4xx.BAD_REQUEST.value, "headers" : {}, "body" : {"message" : "Streamed responses cannot be batched"}}
+
+	if hasattr(response, 'render') :
+		response.render()
+
+	content_type = response.get('Content-Type', '')
+	body = response.content.decode(response.charset)
+	if content_type.startswith('application/json') and body :
+		body = json.loads(body)
+
+	headers = {name : value for name, value in response.items() if name not in ('Content-Type', 'Content-Length')}
+	return {"status" : response.status_code, "headers" : headers, "body" : body}
+
+def run_batch(request, entries, root) :
+	"""
+	Runs each sub-request through the middleware and the view at root + its path, in order, returning their results.
+	The batch's user, authenticated once for the whole batch, is handed to every sub-request, which then skip checking
+	the token again.
+	"""
+	results = []
+
+	for method, path, body in entries :
+		sub_request = _sub_request(request, method, path, body, root)
+
+		if request.user.is_authenticated :
+			sub_request._force_auth_user = request.user
+			sub_request._force_auth_token = request.auth
+
+		try :
+			resolve(sub_request.path_info)
+		except Resolver404 :
+			results.append({"status" : STATUS_CODE_4xx.NOT_FOUND.value, "headers" : {}, "body" : {"message" : "Not found"}})
+			continue
+
+		try :
+			results.append(_result(_get_handler().get_response(sub_request)))
+		except Exception :
+			logger.exception("Batched %s %s failed", method, path)
+			results.append({"status" : STATUS_CODE_5xx.INTERNAL_SERVER_ERROR.value, "headers" : {}, "body" : {"message" : "Request failed"}})
+
+	return results
@@ -0,0 +1,195 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import json
+import math
+import time
+import uuid
+import queue
+import random
+import threading
+import urllib.error
+import urllib.request
+import concurrent.futures
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from backend.urls import NAMESPACE
+
+BENCHMARK_PASSWORD = "bench^&*678dghjasdja"
+SCENARIOS = ('login', 'register', 'refresh', 'frontend')
+
+class InProcessTransport :
+	"""Sends requests through django.test.Client in this process, counting the queries each one makes"""
+
+	def __init__(self) :
+		self._local = threading.local()
+
+	def request(self, method, path, body=None, content_type="application/json") :
+		client = getattr(self._local, 'client', None)
+		if client is None :
+			client = self._local.client = Client()
+
+		with CaptureQueriesContext(connection) as context :
+			response = client.generic(method, path, body or '', content_type=content_type)
+			content = b''.join(response.streaming_content) if response.streaming else response.content
+
+		return response.status_code, content, len(context.captured_queries)
+
+class HTTPTransport :
+	"""Sends requests to a running server, query counts are not available from outside the process"""
+
+	def __init__(self, base_url) :
+		self.base_url = base_url.rstrip('/')
+
+	def request(self, method, path, body=None, content_type="application/json") :
+		data = body.encode('utf-8') if body is not None else None
+		request = urllib.request.Request(self.base_url + path, data=data, method=method, headers={"Content-Type" : content_type})
+
+		try :
+			with urllib.request.urlopen(request) as response :
+				return response.status, response.read(), None
+		except urllib.error.HTTPError as e :
+			return e.code, e.read(), None
+
+def percentile(values, fraction) :
+	if not values :
+		return None
+
+	# nearest rank
+	ordered = sorted(values)
+	return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def percentile_ms(values, fraction) :
+	value = percentile(values, fraction)
+	return value * 1000 if value is not None else None
+
+class Benchmark :
+	def __init__(self, transport, secret_key, population=100) :
+		self.transport = transport
+		self.secret_key = secret_key
+		self.run_id = uuid.uuid4().hex[:8]
+		self.usernames = ["bench-%s-%d" % (self.run_id, i) for i in range(population)]
+		self.refresh_tokens = []
+		self._free_tokens = None
+		self._counter = iter(range(10 ** 9))
+		self._counter_lock = threading.Lock()
+
+	def seed(self) :
+		"""Registers the user population through the bulk registration endpoint, keeping a refresh token per user"""
+		for i in range(0, len(self.usernames), 500) :
+			users = [{"username" : username, "password" : BENCHMARK_PASSWORD} for username in self.usernames[i:i + 500]]
+			status, content, _ = self.transport.request('POST', '/' + NAMESPACE + '/auth/register/bulk/', json.dumps({"users" : users, "secret_key" : self.secret_key}))
+
+			if status != 200 :
+				raise RuntimeError("Could not seed benchmark users (%d): %s" % (status, content[:200]))
+
+			for line in content.decode('utf-8').splitlines() :
+				result = json.loads(line)
+				if result['status'] != 201 :
+					raise RuntimeError("Could not seed benchmark user %s: %s" % (result['username'], result.get('message')))
+				self.refresh_tokens.append(result['tokens']['refresh'])
+
+	def _next(self) :
+		with self._counter_lock :
+			return next(self._counter)
+
+	def make_request(self, scenario) :
+		if scenario == 'login' :
+			body = {"username" : random.choice(self.usernames), "password" : BENCHMARK_PASSWORD}
+			return 'PUT', '/' + NAMESPACE + '/auth/login/', json.dumps(body), None
+
+		if scenario == 'register' :
+			body = {"username" : "bench-%s-new-%d" % (self.run_id, self._next()), "password" : BENCHMARK_PASSWORD, "secret_key" : self.secret_key}
+			return 'POST', '/' + NAMESPACE + '/auth/register/', json.dumps(body), None
+
+		if scenario == 'refresh' :
+			# refresh tokens are rotated and work once, so each chain of them is only used by one request at a time and
+			# handed the new token once that request is answered
+			slot = self._free_tokens.get()
+			return 'POST', '/' + NAMESPACE + '/auth/refresh_tokens/', json.dumps({"refresh" : self.refresh_tokens[slot]}), slot
+
+		if scenario == 'frontend' :
+			return 'GET', '/', None, None
+
+		raise ValueError("Unknown scenario: %s" % scenario)
+
+	def run(self, scenario, requests, concurrency) :
+		latencies = []
+		queries = []
+		errors = 0
+		lock = threading.Lock()
+
+		if scenario == 'refresh' :
+			self._free_tokens = queue.Queue()
+			for slot in range(len(self.refresh_tokens)) :
+				self._free_tokens.put(slot)
+
+		def send(_) :
+			nonlocal errors
+			method, path, body, slot = self.make_request(scenario)
+
+			try :
+				start = time.perf_counter()
+				status, content, query_count = self.transport.request(method, path, body)
+				elapsed = time.perf_counter() - start
+
+				if slot is not None and status == 200 :
+					self.refresh_tokens[slot] = json.loads(content).get('refresh', self.refresh_tokens[slot])
+			except Exception :
+				# a request that got no response at all, such as a refused connection, counts as an error without a latency
+				with lock :
+					errors += 1
+				return
+			finally :
+				if slot is not None :
+					self._free_tokens.put(slot)
+
+			with lock :
+				latencies.append(elapsed)
+				if query_count is not None :
+					queries.append(query_count)
+				if status >= 400 :
+					errors += 1
+
+		start = time.perf_counter()
+		with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor :
+			list(executor.map(send, range(requests)))
+		duration = time.perf_counter() - start
+
+		return {
+			"requests" : requests,
+			"concurrency" : concurrency,
+			"errors" : errors,
+			"duration_s" : duration,
+			"throughput_rps" : requests / duration if duration else None,
+			"p50_ms" : percentile_ms(latencies, 0.50),
+			"p95_ms" : percentile_ms(latencies, 0.95),
+			"p99_ms" : percentile_ms(latencies, 0.99),
+			"mean_queries" : sum(queries) / len(queries) if queries else None,
+		}
+
+def find_regressions(results, baseline, max_regression) :
+	"""Compares results to a baseline run, returning a description of every scenario that got more than max_regression worse"""
+	regressions = []
+
+	for scenario, result in results.items() :
+		previous = baseline.get(scenario)
+		if previous is None :
+			continue
+
+		if previous.get('throughput_rps') and result['throughput_rps'] is not None and result['throughput_rps'] < previous['throughput_rps'] * (1 - max_regression) :
+			regressions.append("%s throughput fell from %.1f to %.1f requests/s" % (scenario, previous['throughput_rps'], result['throughput_rps']))
+
+		if previous.get('p95_ms') and result['p95_ms'] is not None and result['p95_ms'] > previous['p95_ms'] * (1 + max_regression) :
+			regressions.append("%s p95 latency rose from %.1f to %.1f ms" % (scenario, previous['p95_ms'], result['p95_ms']))
+
+		if previous.get('mean_queries') is not None and result['mean_queries'] is not None and result['mean_queries'] > previous['mean_queries'] :
+			regressions.append("%s queries per request rose from %.2f to %.2f" % (scenario, previous['mean_queries'], result['mean_queries']))
+
+	return regressions
@@ -0,0 +1,48 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import math
+import hashlib
+
+class BloomFilter :
+	"""Fixed size Bloom filter over strings, answers "definitely not present" or "possibly present" """
+
+	def __init__(self, capacity, error_rate=0.01) :
+		capacity = max(1, capacity)
+
+		self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+		self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+		self.capacity = capacity
+		self.count = 0
+		self.bits = bytearray((self.num_bits + 7) // 8)
+
+	@classmethod
+	def from_buffer(cls, bits, num_bits, num_hashes, count=0) :
+		"""Wraps bits written out by an earlier filter (a memory map for example) without copying them"""
+		bloom = cls.__new__(cls)
+		bloom.num_bits = num_bits
+		bloom.num_hashes = num_hashes
+		bloom.capacity = count
+		bloom.count = count
+		bloom.bits = bits
+		return bloom
+
+	def _positions(self, item) :
+		digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+		h1 = int.from_bytes(digest[:8], 'little')
+		h2 = int.from_bytes(digest[8:], 'little') | 1
+
+		return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+	def add(self, item) :
+		for position in self._positions(item) :
+			self.bits[position >> 3] |= 1 << (position & 7)
+
+		self.count += 1
+
+	def __contains__(self, item) :
+		bits = self.bits
+		return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
@@ -0,0 +1,69 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import time
+import threading
+
+from collections import OrderedDict
+
+class LRUCache :
+	"""Thread safe, size bounded, least recently used cache whose entries can also expire"""
+
+	def __init__(self, max_size, ttl=None) :
+		self.max_size = max_size
+		self.ttl = ttl
+		self.hits = 0
+		self.misses = 0
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key, default=None) :
+		with self._lock :
+			entry = self._entries.get(key)
+
+			if entry is None :
+				self.misses += 1
+				return default
+
+			value, expires_at = entry
+			if expires_at is not None and expires_at <= time.time() :
+				del self._entries[key]
+				self.misses += 1
+				return default
+
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return value
+
+	def set(self, key, value, ttl=None, expires_at=None) :
+		"""Stores value until expires_at (a unix timestamp), for ttl seconds, or for the cache's default ttl"""
+		if expires_at is None :
+			ttl = self.ttl if ttl is None else ttl
+			expires_at = time.time() + ttl if ttl is not None else None
+
+		with self._lock :
+			self._entries[key] = (value, expires_at)
+			self._entries.move_to_end(key)
+
+			while len(self._entries) > self.max_size :
+				self._entries.popitem(last=False)
+
+	def delete(self, key) :
+		with self._lock :
+			self._entries.pop(key, None)
+
+	def delete_matching(self, predicate) :
+		"""Removes every entry whose value satisfies predicate, this walks the whole cache so is meant for rare events"""
+		with self._lock :
+			for key in [key for key, (value, _) in self._entries.items() if predicate(value)] :
+				del self._entries[key]
+
+	def clear(self) :
+		with self._lock :
+			self._entries.clear()
+
+	def __len__(self) :
+		return len(self._entries)
@@ -0,0 +1,64 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import gzip
+
+from django.utils.http import parse_etags
+
+try :
+	import brotli
+except ImportError : # brotli is optional, without it only gzip variants are built
+	brotli = None
+
+# in order of preference when a client accepts several
+ENCODINGS = ('br', 'gzip')
+
+def compress(body, encoding) :
+	if encoding == 'br' :
+		return brotli.compress(body, quality=11)
+	if encoding == 'gzip' :
+		return gzip.compress(body, compresslevel=9, mtime=0)
+
+	raise ValueError("Unsupported encoding: %s" % encoding)
+
+def available_encodings() :
+	return [encoding for encoding in ENCODINGS if encoding != 'br' or brotli is not None]
+
+def choose_encoding(request, available) :
+	"""Picks the preferred encoding from available that the request's Accept-Encoding allows, or 'identity'"""
+	accepted = {}
+
+	for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(',') :
+		coding, _, params = part.strip().partition(';')
+		quality = 1.0
+
+		params = params.strip()
+		if params.startswith('q=') :
+			try :
+				quality = float(params[2:])
+			except ValueError :
+				quality = 0.0
+
+		if coding :
+			accepted[coding.strip().lower()] = quality
+
+	for encoding in ENCODINGS :
+		if encoding in available and accepted.get(encoding, accepted.get('*', 0.0)) > 0 :
+			return encoding
+
+	return 'identity'
+
+def etag_matches(request, etag) :
+	"""Weak comparison of etag against If-None-Match, as used for conditional GETs"""
+	header = request.META.get('HTTP_IF_NONE_MATCH')
+	if not header :
+		return False
+
+	etags = parse_etags(header)
+	if '*' in etags :
+		return True
+
+	return etag.replace('W/', '', 1) in [candidate.replace('W/', '', 1) for candidate in etags]
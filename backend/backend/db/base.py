@@ -0,0 +1,66 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import re
+
+from urllib.request import pathname2url
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+# applied to every new connection, OPTIONS['pragmas'] adds to or overrides these
+DEFAULT_PRAGMAS = {
+	'journal_mode': 'WAL',
+	'synchronous': 'NORMAL',
+	'busy_timeout': 5000,
+	'cache_size': -20000,
+	'mmap_size': 268435456,
+	'temp_store': 'MEMORY',
+}
+
+PRAGMA_NAME_RE = re.compile(r'^[a-z_]+$')
+PRAGMA_VALUE_RE = re.compile(r'^(-?\d+|[A-Za-z_]+)$')
+
+class DatabaseWrapper(base.DatabaseWrapper) :
+	"""
+	SQLite backend tuned for a web server: WAL journalling so readers do not block the writer, a busy timeout instead of
+	immediate "database is locked" errors, and larger page and mmap caches. With OPTIONS['read_only'] the database file
+	is opened read only, for use as a read connection by backend.routers.ReadReplicaRouter.
+
+	Transactions take the write lock when they begin, as SQLite gives up on a transaction that read before it writes
+	without waiting out the busy timeout if another connection wrote in the meantime.
+	"""
+	read_only = False
+
+	def get_connection_params(self) :
+		kwargs = super().get_connection_params()
+
+		pragmas = dict(DEFAULT_PRAGMAS, **kwargs.pop('pragmas', {}))
+		read_only = self.read_only = kwargs.pop('read_only', False)
+
+		if read_only and not self.is_in_memory_db() :
+			kwargs['database'] = 'file:%s?mode=ro' % pathname2url(kwargs['database'])
+			# the journal mode belongs to the database file and can only be changed by a writer
+			pragmas.pop('journal_mode', None)
+			pragmas['query_only'] = 1
+
+		for name, value in pragmas.items() :
+			if not PRAGMA_NAME_RE.match(name) or not PRAGMA_VALUE_RE.match(str(value)) :
+				raise ImproperlyConfigured("Invalid SQLite pragma: %s = %s" % (name, value))
+
+		self.pragmas = pragmas
+		return kwargs
+
+	def get_new_connection(self, conn_params) :
+		conn = super().get_new_connection(conn_params)
+
+		for name, value in self.pragmas.items() :
+			conn.execute('PRAGMA %s = %s' % (name, value))
+
+		return conn
+
+	def _start_transaction_under_autocommit(self) :
+		self.cursor().execute("BEGIN" if self.read_only else "BEGIN IMMEDIATE")
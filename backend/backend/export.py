@@ -0,0 +1,118 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import csv
+import json
+import zlib
+import datetime
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from backend.models import User
+
+# username comes first and rows are in username order, so the last username received is where to resume from
+FIELDS = ('username', 'email', 'first_name', 'last_name', 'cohort', 'is_active', 'date_joined', 'last_login')
+
+CONTENT_TYPES = {
+	'csv' : 'text/csv; charset=utf-8',
+	'ndjson' : 'application/x-ndjson',
+}
+
+BOOLEANS = {'true' : True, '1' : True, 'false' : False, '0' : False}
+
+class ExportError(ValueError) :
+	pass
+
+def _parse_moment(name, value) :
+	moment = parse_datetime(value)
+
+	if moment is None :
+		day = parse_date(value)
+		if day is None :
+			raise ExportError("%s must be an ISO 8601 date or date and time" % name)
+		moment = datetime.datetime.combine(day, datetime.time.min)
+
+	if timezone.is_naive(moment) :
+		moment = timezone.make_aware(moment, timezone.utc)
+
+	return moment
+
+def parse_filters(params) :
+	"""Reads the export's filters from query parameters, as keyword arguments for User.objects.filter"""
+	filters = {}
+
+	if params.get('joined_after') :
+		filters['date_joined__gte'] = _parse_moment('joined_after', params['joined_after'])
+	if params.get('joined_before') :
+		filters['date_joined__lt'] = _parse_moment('joined_before', params['joined_before'])
+
+	if params.get('is_active') :
+		if params['is_active'].lower() not in BOOLEANS :
+			raise ExportError("is_active must be true or false")
+		filters['is_active'] = BOOLEANS[params['is_active'].lower()]
+
+	if 'cohort' in params :
+		filters['cohort'] = params['cohort']
+
+	if params.get('after') :
+		filters['username__gt'] = params['after']
+
+	return filters
+
+def export_rows(filters) :
+	"""Yields matching users as tuples of FIELDS, read in chunks from a single query so that memory use stays flat"""
+	rows = User.objects.filter(**filters).order_by('username').values_list(*FIELDS)
+	return rows.iterator(chunk_size=settings.USER_EXPORT['CHUNK_SIZE'])
+
+class _Line :
+	"""File-like object for csv.writer that hands back each line instead of storing it"""
+	def write(self, value) :
+		return value
+
+def _csv_lines(rows) :
+	writer = csv.writer(_Line())
+	yield writer.writerow(FIELDS)
+
+	for row in rows :
+		yield writer.writerow(['' if value is None else value.isoformat() if isinstance(value, datetime.datetime) else value for value in row])
+
+def _ndjson_lines(rows) :
+	for row in rows :
+		yield json.dumps(dict(zip(FIELDS, row)), cls=DjangoJSONEncoder) + "\n"
+
+def _batches(lines) :
+	"""Joins lines into batches of CHUNK_SIZE, so that the response is written and compressed in blocks rather than per row"""
+	batch = []
+
+	for line in lines :
+		batch.append(line)
+
+		if len(batch) >= settings.USER_EXPORT['CHUNK_SIZE'] :
+			yield ''.join(batch).encode('utf-8')
+			batch = []
+
+	if batch :
+		yield ''.join(batch).encode('utf-8')
+
+def _gzip(blocks) :
+	compressor = zlib.compressobj(settings.USER_EXPORT['GZIP_LEVEL'], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+	for block in blocks :
+		# flushed after every block, so that whatever arrived before a dropped connection decompresses to whole rows
+		yield compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+	yield compressor.flush()
+
+def export_stream(extension, filters, gzip=False) :
+	"""Yields the bytes of an export of the users matching filters, as csv or ndjson"""
+	rows = export_rows(filters)
+	lines = _csv_lines(rows) if extension == 'csv' else _ndjson_lines(rows)
+	blocks = _batches(lines)
+
+	return _gzip(blocks) if gzip else blocks
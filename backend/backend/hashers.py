@@ -0,0 +1,120 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import os
+import json
+import math
+import time
+import socket
+import threading
+
+from django.conf import settings
+from django.contrib.auth.hashers import BCryptSHA256PasswordHasher, PBKDF2PasswordHasher
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+CALIBRATION_PASSWORD = "calibration^&*678dghjasdja"
+
+_calibration = None
+_calibration_lock = threading.Lock()
+
+@receiver(setting_changed)
+def _reset(setting, **kwargs) :
+	global _calibration
+
+	if setting == 'PASSWORD_HASH_CALIBRATION' :
+		_calibration = None
+
+def get_calibration() :
+	"""The costs written by calibrate(), read once per process, or {} when the host has not been calibrated"""
+	global _calibration
+
+	if _calibration is None :
+		with _calibration_lock :
+			if _calibration is None :
+				try :
+					with open(settings.PASSWORD_HASH_CALIBRATION['FILE']) as f :
+						_calibration = json.load(f)
+				except (OSError, ValueError) :
+					_calibration = {}
+
+	return _calibration
+
+class CalibratedBCryptSHA256PasswordHasher(BCryptSHA256PasswordHasher) :
+	"""bcrypt_sha256 with the rounds picked by calibrate_hashers, existing hashes are upgraded as their users log in"""
+
+	@property
+	def rounds(self) :
+		return get_calibration().get(self.algorithm, {}).get('rounds', BCryptSHA256PasswordHasher.rounds)
+
+class CalibratedPBKDF2PasswordHasher(PBKDF2PasswordHasher) :
+	"""pbkdf2_sha256 with the iterations picked by calibrate_hashers"""
+
+	@property
+	def iterations(self) :
+		return get_calibration().get(self.algorithm, {}).get('iterations', PBKDF2PasswordHasher.iterations)
+
+def _time(hasher, repeats=3) :
+	salt = hasher.salt()
+	timings = []
+
+	for _ in range(repeats) :
+		start = time.perf_counter()
+		hasher.encode(CALIBRATION_PASSWORD, salt)
+		timings.append(time.perf_counter() - start)
+
+	return sorted(timings)[repeats // 2]
+
+def calibrate_bcrypt(target) :
+	"""Returns the rounds whose hash time is closest to target seconds, each extra round doubles the time"""
+	hasher = BCryptSHA256PasswordHasher()
+	hasher.rounds = 8
+	base = _time(hasher)
+
+	rounds = max(settings.PASSWORD_HASH_CALIBRATION['MIN_BCRYPT_ROUNDS'], min(31, hasher.rounds + round(math.log2(target / base))))
+	return rounds, base * 2 ** (rounds - hasher.rounds)
+
+def calibrate_pbkdf2(target) :
+	"""Returns the iterations, to the nearest 10000, that take about target seconds, the time grows linearly with them"""
+	hasher = PBKDF2PasswordHasher()
+	hasher.iterations = 20000
+	base = _time(hasher)
+
+	iterations = max(settings.PASSWORD_HASH_CALIBRATION['MIN_PBKDF2_ITERATIONS'], 10000, int(round(hasher.iterations * target / base, -4)))
+	return iterations, base * iterations / hasher.iterations
+
+def calibrate(target_ms=None, write=True) :
+	"""Benchmarks this host and records the costs that make a password check take about target_ms"""
+	global _calibration
+
+	target_ms = target_ms or settings.PASSWORD_HASH_CALIBRATION['TARGET_MS']
+	rounds, bcrypt_time = calibrate_bcrypt(target_ms / 1000)
+	iterations, pbkdf2_time = calibrate_pbkdf2(target_ms / 1000)
+
+	calibration = {
+		"target_ms" : target_ms,
+		"host" : socket.gethostname(),
+		"cpu_count" : os.cpu_count(),
+		"calibrated_at" : timezone.now().isoformat(),
+		BCryptSHA256PasswordHasher.algorithm : {"rounds" : rounds, "estimated_ms" : bcrypt_time * 1000},
+		PBKDF2PasswordHasher.algorithm : {"iterations" : iterations, "estimated_ms" : pbkdf2_time * 1000},
+	}
+
+	if write :
+		path = settings.PASSWORD_HASH_CALIBRATION['FILE']
+		with open(path + '.tmp', 'w') as f :
+			json.dump(calibration, f, indent=4)
+		os.replace(path + '.tmp', path)
+
+		with _calibration_lock :
+			_calibration = calibration
+
+	return calibration
+
+def calibrate_if_needed() :
+	if settings.PASSWORD_HASH_CALIBRATION['ON_STARTUP'] and not get_calibration() :
+		calibrate()
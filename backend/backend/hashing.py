@@ -0,0 +1,141 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import os
+import atexit
+import asyncio
+import threading
+import concurrent.futures
+
+import django
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, check_password
+
+from backend.metrics import timed
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = None
+
+class HashPoolSaturated(Exception) :
+	pass
+
+def _init_worker() :
+	# workers started with spawn (rather than fork) need django set up before they can hash
+	os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+	django.setup()
+
+def get_hash_pool() :
+	global _pool
+
+	if _pool is None :
+		with _pool_lock :
+			if _pool is None :
+				_pool = concurrent.futures.ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_POOL['WORKERS'], initializer=_init_worker)
+				atexit.register(_pool.shutdown)
+
+	return _pool
+
+def _get_slots() :
+	global _slots
+
+	if _slots is None :
+		with _pool_lock :
+			if _slots is None :
+				_slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_POOL['WORKERS'] + settings.PASSWORD_HASH_POOL['QUEUE_DEPTH'])
+
+	return _slots
+
+def submit(fn, *args, blocking=False) :
+	"""
+	Queues fn on the hash pool. When the queue is full this raises HashPoolSaturated straight away, or with blocking
+	waits for a place.
+	"""
+	slots = _get_slots()
+
+	if not slots.acquire(blocking=blocking) :
+		raise HashPoolSaturated()
+
+	try :
+		future = get_hash_pool().submit(fn, *args)
+	except Exception :
+		slots.release()
+		raise
+
+	future.add_done_callback(lambda _ : slots.release())
+	return future
+
+def _run(fn, *args) :
+	# unlike _arun this holds the calling thread while the pool works, for at most TIMEOUT seconds
+	if not settings.PASSWORD_HASH_POOL['ENABLED'] :
+		return fn(*args)
+
+	try :
+		return submit(fn, *args).result(timeout=settings.PASSWORD_HASH_POOL['TIMEOUT'])
+	except concurrent.futures.TimeoutError :
+		raise HashPoolSaturated()
+
+def hash_password(password) :
+	with timed('password_hash_duration_seconds', operation='hash') :
+		return _run(make_password, password)
+
+def verify_password(password, encoded) :
+	with timed('password_hash_duration_seconds', operation='verify') :
+		return _run(check_password, password, encoded)
+
+async def _arun(fn, *args) :
+	"""_run for async views, waiting for the pool without holding a thread. Inline hashing goes to a thread of its own"""
+	if not settings.PASSWORD_HASH_POOL['ENABLED'] :
+		# not thread sensitive, so hashes run side by side rather than queueing on the one thread kept for the ORM
+		return await sync_to_async(fn, thread_sensitive=False)(*args)
+
+	try :
+		return await asyncio.wait_for(asyncio.wrap_future(submit(fn, *args)), timeout=settings.PASSWORD_HASH_POOL['TIMEOUT'])
+	except asyncio.TimeoutError :
+		raise HashPoolSaturated()
+
+async def ahash_password(password) :
+	with timed('password_hash_duration_seconds', operation='hash') :
+		return await _arun(make_password, password)
+
+async def averify_password(password, encoded) :
+	with timed('password_hash_duration_seconds', operation='verify') :
+		return await _arun(check_password, password, encoded)
+
+def _make_password_chunk(passwords) :
+	return [make_password(password) for password in passwords]
+
+def make_passwords(passwords) :
+	"""
+	Hashes a list of raw passwords, spreading the work across the hash pool when it is worth it. Chunks take places in
+	the same queue as logins, waiting for them rather than failing, but never more places than there are workers so
+	that the rest of the queue stays free for logins and registrations.
+	"""
+	workers = settings.PASSWORD_HASH_POOL['WORKERS']
+
+	with timed('password_hash_duration_seconds', operation='hash_batch') :
+		if workers <= 1 or len(passwords) <= 1 :
+			return _make_password_chunk(passwords)
+
+		chunksize = max(1, len(passwords) // (workers * 4))
+		in_flight = threading.Semaphore(workers)
+		futures = []
+
+		for i in range(0, len(passwords), chunksize) :
+			in_flight.acquire()
+			try :
+				future = submit(_make_password_chunk, passwords[i:i + chunksize], blocking=True)
+			except Exception :
+				in_flight.release()
+				raise
+
+			# called after submit's own callback has given back the chunk's place in the queue
+			future.add_done_callback(lambda _ : in_flight.release())
+			futures.append(future)
+
+		return [password for future in futures for password in future.result()]
@@ -0,0 +1,243 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import os
+import re
+import copy
+import json
+import time
+import queue
+import random
+import weakref
+import asyncio
+import logging
+import datetime
+import contextvars
+
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from backend.metrics import increment
+
+request_logger = logging.getLogger('backend.requests')
+auth_logger = logging.getLogger('backend.auth')
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+
+# ids handed to us by a proxy are kept if they look like ids, so that log lines can be followed across services
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# attributes every LogRecord has, anything else on a record was passed in extra and is written as a field
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', logging.INFO, '', 0, '', None, None))) | {'message', 'asctime', 'request_id'}
+
+def get_request_id() :
+	return _request_id.get()
+
+class RequestIdFilter(logging.Filter) :
+	"""Stamps records with the id of the request being handled when they were logged"""
+
+	def filter(self, record) :
+		record.request_id = _request_id.get()
+		return True
+
+class SamplingFilter(logging.Filter) :
+	"""
+	Keeps only a fraction of high volume events, given by rates as {event: fraction}. Records logged without an event,
+	of an event not in rates, or at WARNING and above are always kept.
+	"""
+
+	def __init__(self, rates=None) :
+		super().__init__()
+		self.rates = rates or {}
+
+	def filter(self, record) :
+		if record.levelno >= logging.WARNING :
+			return True
+
+		rate = self.rates.get(getattr(record, 'event', None), 1.0)
+		return rate >= 1.0 or random.random() < rate
+
+class JSONFormatter(logging.Formatter) :
+	"""Formats records as one JSON object per line, with any extra fields alongside the message"""
+
+	def format(self, record) :
+		entry = {
+			'time' : datetime.datetime.fromtimestamp(record.created, tz=datetime.timezone.utc).isoformat(timespec='milliseconds'),
+			'level' : record.levelname,
+			'logger' : record.name,
+			'message' : record.getMessage(),
+			'request_id' : getattr(record, 'request_id', None),
+		}
+
+		for key, value in vars(record).items() :
+			if key not in RECORD_ATTRIBUTES :
+				entry[key] = value
+
+		if record.exc_info :
+			entry['exception'] = self.formatException(record.exc_info)
+		elif record.exc_text :
+			entry['exception'] = record.exc_text
+
+		return json.dumps(entry, default=str)
+
+# handlers to restart in processes forked from this one, held weakly so that replaced handlers can be freed
+_handlers = weakref.WeakSet()
+
+def _after_fork_in_child() :
+	for handler in list(_handlers) :
+		handler._restart()
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+class QueuedJSONFileHandler(QueueHandler) :
+	"""
+	Hands records to a background thread that writes them to a rotating file as JSON lines, so that logging never waits
+	on the disk and rotation never pauses a request. The queue is bounded, when it is full records are dropped and
+	counted in log_records_dropped_total rather than blocking. Processes forked from this one get their own thread,
+	writing to a file of their own named with their pid, as each process rotates the files it writes on its own.
+	"""
+
+	def __init__(self, filename, max_bytes=50 * 1024 * 1024, backup_count=5, queue_size=10000) :
+		super().__init__(queue.Queue(queue_size))
+		self.filename = filename
+		self.max_bytes = max_bytes
+		self.backup_count = backup_count
+		self.queue_size = queue_size
+		self.dropped = 0
+
+		self.target = self._target(filename)
+
+		self.listener = None
+		self._start()
+		_handlers.add(self)
+
+	def _target(self, filename) :
+		os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+		target = RotatingFileHandler(filename, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding='utf-8', delay=True)
+		target.setFormatter(JSONFormatter())
+		return target
+
+	def _start(self) :
+		self.listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+		self.listener.start()
+
+	def _restart(self) :
+		if self.listener is None :
+			return
+
+		# the thread did not survive the fork, and the queue's lock may have been held by it when the fork happened
+		self.queue = queue.Queue(self.queue_size)
+
+		root, extension = os.path.splitext(self.filename)
+		self.target.close()
+		self.target = self._target('%s.%d%s' % (root, os.getpid(), extension))
+		self._start()
+
+	def prepare(self, record) :
+		# only the cheap part of formatting happens on the logging thread, the JSON is built by the listener
+		record = copy.copy(record)
+		record.msg = record.getMessage()
+		record.args = None
+
+		if record.exc_info :
+			record.exc_text = logging.Formatter().formatException(record.exc_info)
+			record.exc_info = None
+
+		return record
+
+	def enqueue(self, record) :
+		try :
+			self.queue.put_nowait(record)
+		except queue.Full :
+			self.dropped += 1
+			increment('log_records_dropped_total', ())
+
+	def flush(self) :
+		"""Waits for the records queued so far to be written"""
+		if self.listener is not None and self.listener._thread is not None :
+			self.listener.stop()
+			self._start()
+
+	def close(self) :
+		if self.listener is not None and self.listener._thread is not None :
+			self.listener.stop()
+		self.listener = None
+		self.target.close()
+		super().close()
+
+def _request_level(status) :
+	if status >= 500 :
+		return logging.ERROR
+	if status >= 400 :
+		return logging.WARNING
+	return logging.INFO
+
+def log_auth(action, outcome, username, level=logging.INFO) :
+	auth_logger.log(level, "%s %s", action, outcome, extra={'event' : 'auth', 'action' : action, 'outcome' : outcome, 'username' : username})
+
+class RequestLogMiddleware :
+	"""
+	Gives each request an id, taken from an X-Request-ID header when there is a usable one, that every record logged
+	while handling it carries and that is returned in the response's X-Request-ID. Logs a request event once the
+	response is ready, with its status and how long it took.
+	"""
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response) :
+		self.get_response = get_response
+		self._async = asyncio.iscoroutinefunction(get_response)
+
+		if self._async :
+			# how Django's MiddlewareMixin marks itself as a coroutine function
+			self._is_coroutine = asyncio.coroutines._is_coroutine
+
+	def request_id(self, request) :
+		request_id = request.META.get('HTTP_X_REQUEST_ID', '')
+		return request_id if REQUEST_ID_PATTERN.match(request_id) else os.urandom(8).hex()
+
+	def __call__(self, request) :
+		if self._async :
+			return self.__acall__(request)
+
+		request_id = self.request_id(request)
+		token = _request_id.set(request_id)
+
+		start = time.perf_counter()
+		try :
+			response = self.get_response(request)
+			self.log(request, response, time.perf_counter() - start)
+		finally :
+			_request_id.reset(token)
+
+		response['X-Request-ID'] = request_id
+		return response
+
+	async def __acall__(self, request) :
+		request_id = self.request_id(request)
+		token = _request_id.set(request_id)
+
+		start = time.perf_counter()
+		try :
+			response = await self.get_response(request)
+			self.log(request, response, time.perf_counter() - start)
+		finally :
+			_request_id.reset(token)
+
+		response['X-Request-ID'] = request_id
+		return response
+
+	def log(self, request, response, elapsed) :
+		match = request.resolver_match
+
+		request_logger.log(_request_level(response.status_code), "%s %s %d", request.method, request.path, response.status_code, extra={
+			'event' : 'request',
+			'method' : request.method,
+			'path' : request.path,
+			'route' : match.route if match is not None else None,
+			'status' : response.status_code,
+			'duration_ms' : round(elapsed * 1000, 3),
+		})
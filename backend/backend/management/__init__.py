@@ -0,0 +1 @@
+# comment added so that git can notice the file correctly
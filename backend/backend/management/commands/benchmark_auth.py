@@ -0,0 +1,83 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import os
+import json
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from backend.benchmark import Benchmark, InProcessTransport, HTTPTransport, SCENARIOS, find_regressions
+
+def _format(value, spec) :
+	# runs with no answered requests have no latencies to report
+	return spec % value if value is not None else "n/a"
+
+class Command(BaseCommand) :
+	help = "Load tests the authentication and frontend routes, reporting throughput, latency percentiles and query counts"
+
+	def add_arguments(self, parser) :
+		parser.add_argument('--url', help="Base URL of a running server, by default requests are made in process against a throwaway database")
+		parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="Comma separated subset of: %s" % ', '.join(SCENARIOS))
+		parser.add_argument('--requests', type=int, default=200, help="Requests per scenario")
+		parser.add_argument('--concurrency', type=int, default=8)
+		parser.add_argument('--users', type=int, default=100, help="Size of the user population logged in as")
+		parser.add_argument('--secret-key', default=None, help="Registration secret key, defaults to the first of REGISTRATION_SECRET_KEYS")
+		parser.add_argument('--output', help="Write the results as JSON to this file")
+		parser.add_argument('--baseline', help="Fail if the results are worse than this earlier --output file")
+		parser.add_argument('--max-regression', type=float, default=0.2, help="Allowed fraction of slowdown against --baseline")
+
+	def handle(self, *args, **options) :
+		scenarios = [scenario.strip() for scenario in options['scenarios'].split(',') if scenario.strip()]
+		unknown = set(scenarios) - set(SCENARIOS)
+		if unknown :
+			raise CommandError("Unknown scenarios: %s" % ', '.join(sorted(unknown)))
+
+		secret_key = options['secret_key'] or (settings.REGISTRATION_SECRET_KEYS[0] if settings.REGISTRATION_SECRET_KEYS else None)
+
+		if options['url'] :
+			results = self.run(HTTPTransport(options['url']), secret_key, scenarios, options)
+		else :
+			results = self.run_in_process(secret_key, scenarios, options)
+
+		for scenario, result in results.items() :
+			self.stdout.write("%-9s %7s req/s  p50 %7s ms  p95 %7s ms  p99 %7s ms  errors %d  queries %s" % (
+				scenario, _format(result['throughput_rps'], "%.1f"), _format(result['p50_ms'], "%.1f"), _format(result['p95_ms'], "%.1f"),
+				_format(result['p99_ms'], "%.1f"), result['errors'], _format(result['mean_queries'], "%.2f")
+			))
+
+		if options['output'] :
+			with open(options['output'], 'w') as f :
+				json.dump(results, f, indent=4)
+
+		if options['baseline'] :
+			with open(options['baseline']) as f :
+				regressions = find_regressions(results, json.load(f), options['max_regression'])
+
+			if regressions :
+				raise CommandError("Performance regressed:\n" + "\n".join(regressions))
+
+	def run(self, transport, secret_key, scenarios, options) :
+		benchmark = Benchmark(transport, secret_key, population=options['users'])
+		benchmark.seed()
+
+		return {scenario : benchmark.run(scenario, options['requests'], options['concurrency']) for scenario in scenarios}
+
+	def run_in_process(self, secret_key, scenarios, options) :
+		# a file rather than sqlite's shared in-memory database, which fails concurrent writers instead of making them wait
+		directory = tempfile.mkdtemp()
+		old_name = connection.settings_dict['NAME']
+		connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+
+		try :
+			connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+			return self.run(InProcessTransport(), secret_key, scenarios, options)
+		finally :
+			connection.creation.destroy_test_db(old_name, verbosity=0)
+			shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,47 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import os
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.validators import build_index
+
+class Command(BaseCommand) :
+	help = "Builds the index used by BreachedPasswordValidator from a list of breached passwords, one per line"
+
+	def add_arguments(self, parser) :
+		parser.add_argument('source', help="Password list to read, or - for standard input")
+		parser.add_argument('--output', default=None, help="Where to write the index, defaults to BREACHED_PASSWORD_INDEX")
+		parser.add_argument('--sha1', action='store_true', help="Lines are hex SHA-1 hashes, optionally followed by :count (the Have I Been Pwned format)")
+		parser.add_argument('--bloom-error-rate', type=float, default=0.001, help="False positive rate of the Bloom prefilter, 0 to leave it out")
+		parser.add_argument('--run-size', type=int, default=1000000, help="Passwords sorted in memory at a time")
+
+	def handle(self, *args, **options) :
+		output = options['output'] or str(settings.BREACHED_PASSWORD_INDEX)
+
+		if options['source'] == '-' :
+			source = sys.stdin.buffer
+		elif os.path.isfile(options['source']) :
+			source = open(options['source'], 'rb')
+		else :
+			raise CommandError("%s does not exist" % options['source'])
+
+		start = time.perf_counter()
+		try :
+			count = build_index(source, output, bloom_error_rate=options['bloom_error_rate'], run_size=options['run_size'], hashed=options['sha1'])
+		except ValueError as e :
+			raise CommandError("Could not read the password list: %s" % e)
+		finally :
+			if source is not sys.stdin.buffer :
+				source.close()
+
+		self.stdout.write("Indexed %d passwords into %s (%d bytes) in %.1fs, restart the server processes to use it" % (
+			count, output, os.path.getsize(output), time.perf_counter() - start
+		))
@@ -0,0 +1,30 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand) :
+	help = "Collects the frontend build into STATIC_ROOT with content hashed names, a manifest and precompressed variants"
+
+	def handle(self, *args, **options) :
+		if not os.path.isdir(settings.STATIC_DIR) :
+			raise CommandError("%s does not exist, run npm run build in the frontend first" % settings.STATIC_DIR)
+
+		call_command('collectstatic', interactive=False, clear=True, verbosity=options['verbosity'])
+
+		totals = {'': 0, '.gz': 0, '.br': 0}
+		for name in staticfiles_storage.load_manifest().values() :
+			for suffix in totals :
+				path = staticfiles_storage.path(name + suffix)
+				if os.path.isfile(path) :
+					totals[suffix] += os.path.getsize(path)
+
+		self.stdout.write("Hashed assets: %d bytes, gzip: %d bytes, brotli: %d bytes" % (totals[''], totals['.gz'], totals['.br']))
@@ -0,0 +1,29 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+from django.conf import settings
+from django.contrib.auth.hashers import BCryptSHA256PasswordHasher, PBKDF2PasswordHasher
+from django.core.management.base import BaseCommand
+
+from backend.hashers import calibrate
+
+class Command(BaseCommand) :
+	help = "Benchmarks password hashing on this host and records the bcrypt rounds and PBKDF2 iterations that take about the target time"
+
+	def add_arguments(self, parser) :
+		parser.add_argument('--target-ms', type=int, default=None, help="Time a password check should take, defaults to PASSWORD_HASH_CALIBRATION's TARGET_MS")
+		parser.add_argument('--dry-run', action='store_true', help="Only print the costs, without writing them")
+
+	def handle(self, *args, **options) :
+		calibration = calibrate(options['target_ms'], write=not options['dry_run'])
+
+		bcrypt = calibration[BCryptSHA256PasswordHasher.algorithm]
+		pbkdf2 = calibration[PBKDF2PasswordHasher.algorithm]
+		self.stdout.write("bcrypt_sha256: %d rounds (about %.0fms)" % (bcrypt['rounds'], bcrypt['estimated_ms']))
+		self.stdout.write("pbkdf2_sha256: %d iterations (about %.0fms)" % (pbkdf2['iterations'], pbkdf2['estimated_ms']))
+
+		if not options['dry_run'] :
+			self.stdout.write("Written to %s, restart the server processes to use it. Passwords are rehashed as users log in" % settings.PASSWORD_HASH_CALIBRATION['FILE'])
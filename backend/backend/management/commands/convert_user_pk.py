@@ -0,0 +1,135 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from backend.models import User
+from backend.search import create_search_index
+
+OLD_SUFFIX = '__old'
+
+def _columns(cursor, connection, table) :
+	return [column.name for column in connection.introspection.get_table_description(cursor, table)]
+
+def _user_foreign_keys(model) :
+	return [field for field in model._meta.local_fields if field.is_relation and field.remote_field.model is User]
+
+def related_models(connection) :
+	"""Installed models with a foreign key to users whose tables exist, including many to many tables"""
+	tables = set(connection.introspection.table_names())
+	models = []
+
+	for model in apps.get_models(include_auto_created=True) :
+		if model is not User and model._meta.managed and model._meta.db_table in tables and _user_foreign_keys(model) :
+			models.append(model)
+
+	return models
+
+class Command(BaseCommand) :
+	help = (
+		"Converts a database created while the username was the users' primary key to the integer primary key, "
+		"numbering users by the order they joined and repointing every foreign key to them"
+	)
+
+	def add_arguments(self, parser) :
+		parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help="Database to convert")
+
+	def set_aside(self, editor, cursor, table) :
+		"""Renames a table out of the way, dropping its indexes and triggers so that their names can be reused"""
+		cursor.execute("SELECT type, name FROM sqlite_master WHERE tbl_name = %s AND type IN ('index', 'trigger') AND sql IS NOT NULL", [table])
+		for kind, name in cursor.fetchall() :
+			editor.execute("DROP %s %s" % (kind.upper(), editor.quote_name(name)))
+
+		editor.execute("ALTER TABLE %s RENAME TO %s" % (editor.quote_name(table), editor.quote_name(table + OLD_SUFFIX)))
+
+	def copy_rows(self, editor, old_columns, model) :
+		"""Copies the set aside rows of model into its new table, looking up the new id of each user they refer to"""
+		table = model._meta.db_table
+		columns, values, joins, params = [], [], [], []
+
+		for field in model._meta.local_concrete_fields :
+			if model is User and field is User._meta.pk :
+				continue
+
+			column = field.column
+
+			if field.is_relation and field.remote_field.model is User :
+				alias = 'user_%d' % len(joins)
+				joins.append("%s JOIN %s %s ON %s.%s = old.%s" % (
+					'LEFT' if field.null else 'INNER', editor.quote_name(User._meta.db_table), alias, alias,
+					editor.quote_name(User._meta.get_field('username').column), editor.quote_name(column),
+				))
+				values.append('%s.%s' % (alias, editor.quote_name(User._meta.pk.column)))
+			elif column in old_columns :
+				values.append('old.%s' % editor.quote_name(column))
+			elif field.has_default() :
+				values.append('%s')
+				params.append(field.get_db_prep_save(field.get_default(), editor.connection))
+			else :
+				raise CommandError("%s.%s is new and has no default, run migrate before converting" % (table, column))
+
+			columns.append(editor.quote_name(column))
+
+		# users are numbered in the order they joined
+		order = " ORDER BY old.date_joined, old.username" if model is User else ""
+
+		editor.execute("INSERT INTO %s (%s) SELECT %s FROM %s old %s%s" % (
+			editor.quote_name(table), ', '.join(columns), ', '.join(values), editor.quote_name(table + OLD_SUFFIX), ' '.join(joins), order
+		), params)
+
+	def repoint_admin_log(self, editor) :
+		"""The admin's history records which user was changed by primary key, as text"""
+		if not apps.is_installed('django.contrib.admin') :
+			return
+
+		from django.contrib.admin.models import LogEntry
+		from django.contrib.contenttypes.models import ContentType
+
+		content_type = ContentType.objects.db_manager(editor.connection.alias).get_for_model(User, for_concrete_model=False)
+		editor.execute("UPDATE %s SET object_id = (SELECT CAST(id AS TEXT) FROM %s WHERE username = object_id) WHERE content_type_id = %%s AND object_id IN (SELECT username FROM %s)" % (
+			editor.quote_name(LogEntry._meta.db_table), editor.quote_name(User._meta.db_table), editor.quote_name(User._meta.db_table)
+		), [content_type.pk])
+
+	def handle(self, *args, **options) :
+		connection = connections[options['database']]
+		if connection.vendor != 'sqlite' :
+			raise CommandError("Only SQLite databases can be converted")
+
+		with connection.cursor() as cursor :
+			if User._meta.pk.column in _columns(cursor, connection, User._meta.db_table) :
+				self.stdout.write("Users already have an integer primary key")
+				return
+
+		related = related_models(connection)
+		# many to many tables are made along with the user table
+		through = {field.remote_field.through for field in User._meta.local_many_to_many}
+
+		with connection.schema_editor() as editor, connection.cursor() as cursor :
+			old_columns = {}
+
+			for model in [User] + related :
+				old_columns[model] = set(_columns(cursor, connection, model._meta.db_table))
+				self.set_aside(editor, cursor, model._meta.db_table)
+
+			editor.create_model(User)
+			for model in related :
+				if model not in through :
+					editor.create_model(model)
+
+			for model in [User] + related :
+				self.copy_rows(editor, old_columns[model], model)
+
+			for model in [User] + related :
+				editor.execute("DROP TABLE %s" % editor.quote_name(model._meta.db_table + OLD_SUFFIX))
+
+			self.repoint_admin_log(editor)
+
+		create_search_index(User, options['database'])
+
+		self.stdout.write("Converted users and %s" % ', '.join(model._meta.db_table for model in related))
+		self.stdout.write("Regenerate the backend app's migrations to match, the new initial migration is already applied")
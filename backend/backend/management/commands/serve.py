@@ -0,0 +1,207 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import os
+import sys
+import time
+import builtins
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+# modules the first request would otherwise import, in roughly the order it would import them
+HOT_MODULES = (
+	'backend.urls',
+	'backend.views',
+	'backend.async_views',
+	'rest_framework.views',
+	'rest_framework.response',
+	'rest_framework_simplejwt.tokens',
+	'rest_framework_simplejwt.authentication',
+	'django.contrib.auth.password_validation',
+	'django.contrib.auth.hashers',
+	'django.template.loader',
+	'bcrypt',
+)
+
+class ImportTimer :
+	"""Records the time spent importing each module for the first time, less the time spent in the modules it imports"""
+
+	def __init__(self) :
+		self.times = {}
+		self._stack = []
+		self._import = None
+
+	def __enter__(self) :
+		self._import = builtins.__import__
+		builtins.__import__ = self._timed_import
+		return self
+
+	def __exit__(self, *exc_info) :
+		builtins.__import__ = self._import
+
+	def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0) :
+		if level or name in sys.modules :
+			return self._import(name, globals, locals, fromlist, level)
+
+		self._stack.append(0.0)
+		start = time.perf_counter()
+
+		try :
+			return self._import(name, globals, locals, fromlist, level)
+		finally :
+			elapsed = time.perf_counter() - start
+			children = self._stack.pop()
+			self.times[name] = self.times.get(name, 0.0) + elapsed - children
+
+			if self._stack :
+				self._stack[-1] += elapsed
+
+def import_hot_modules() :
+	for name in HOT_MODULES :
+		try :
+			__import__(name)
+		except ImportError : # optional dependencies such as bcrypt
+			pass
+
+def warm_validators() :
+	from django.contrib.auth import password_validation
+
+	# building the validators reads the common password list, validating once opens the breached password index
+	try :
+		password_validation.validate_password("warm up the validators")
+	except ValidationError :
+		pass
+
+def warm_hashers() :
+	from django.contrib.auth.hashers import get_hashers
+
+	for hasher in get_hashers() :
+		if hasher.library :
+			hasher._load_library()
+
+def warm_spa_shell() :
+	from backend.spa import spa_shell
+
+	if os.path.isfile(spa_shell.path) :
+		spa_shell.variants()
+
+def warm_templates() :
+	from django.template.loader import get_template
+
+	if os.path.isfile(os.path.join(settings.TEMPLATE_DIR, 'index.html')) :
+		get_template('index.html')
+
+def warm_url_resolvers() :
+	from django.urls import get_resolver, reverse
+
+	get_resolver().check()
+	reverse('authentication-login')
+
+def warm_database() :
+	from backend.revocation import revocation_store
+	from backend.usernames import username_filter
+
+	for connection in connections.all() :
+		connection.ensure_connection()
+
+	username_filter.warm()
+	revocation_store.is_revoked('')
+
+WARMUP_STEPS = (
+	("imports", import_hot_modules),
+	("password validators", warm_validators),
+	("password hashers", warm_hashers),
+	("SPA shell", warm_spa_shell),
+	("templates", warm_templates),
+	("URL resolvers", warm_url_resolvers),
+	("database", warm_database),
+)
+
+def warm_up() :
+	"""Runs the warm up steps, returning the seconds each took and the self time of each module they imported"""
+	steps = []
+
+	with ImportTimer() as timer :
+		for name, step in WARMUP_STEPS :
+			start = time.perf_counter()
+			step()
+			steps.append((name, time.perf_counter() - start))
+
+	# connections opened here must not be shared with the forked workers
+	connections.close_all()
+
+	return steps, timer.times
+
+def _open_connections(server, worker) :
+	for connection in connections.all() :
+		connection.ensure_connection()
+
+class Command(BaseCommand) :
+	help = "Imports and warms every hot path component, then serves the WSGI application from preforked workers"
+
+	def add_arguments(self, parser) :
+		parser.add_argument('--bind', default='127.0.0.1:8000', help="Address to listen on, as host:port")
+		parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes")
+		parser.add_argument('--threads', type=int, default=1, help="Threads per worker process")
+		parser.add_argument('--top', type=int, default=15, help="Number of modules listed in the import time breakdown")
+		parser.add_argument('--threads-only', action='store_true', help="Serve with threads of this process, without gunicorn's workers")
+		parser.add_argument('--dry-run', action='store_true', help="Only warm up and report, without serving")
+
+	def handle(self, *args, **options) :
+		host, _, port = options['bind'].rpartition(':')
+		if not host or not port.isdigit() :
+			raise CommandError("--bind must be host:port")
+
+		start = time.perf_counter()
+		steps, imports = warm_up()
+
+		from django.core.wsgi import get_wsgi_application
+		application = get_wsgi_application()
+
+		self.stdout.write("Warmed up in %.0fms" % ((time.perf_counter() - start) * 1000))
+		for name, elapsed in steps :
+			self.stdout.write("  %-20s %8.1fms" % (name, elapsed * 1000))
+
+		self.stdout.write("Slowest imports (self time):")
+		for name, elapsed in sorted(imports.items(), key=lambda item : item[1], reverse=True)[:options['top']] :
+			self.stdout.write("  %-40s %8.1fms" % (name, elapsed * 1000))
+
+		if options['dry_run'] :
+			return
+
+		if options['threads_only'] :
+			from django.core.servers.basehttp import run
+
+			self.stdout.write("Serving on %s with threads of a single process" % options['bind'])
+			run(host.strip('[]'), int(port), application, ipv6=host.startswith('['), threading=True)
+			return
+
+		try :
+			from gunicorn.app.base import BaseApplication
+		except ImportError :
+			raise CommandError("gunicorn is not installed, install it (see requirements.txt) or pass --threads-only to serve from this process")
+
+		config = {
+			'bind' : options['bind'],
+			'workers' : options['workers'],
+			'threads' : options['threads'],
+			# the workers are forked from this warmed up process, sharing its imports and caches copy on write
+			'preload_app' : True,
+			'post_fork' : _open_connections,
+		}
+
+		class PreloadedApplication(BaseApplication) :
+			def load_config(self) :
+				for key, value in config.items() :
+					self.cfg.set(key, value)
+
+			def load(self) :
+				return application
+
+		PreloadedApplication().run()
@@ -0,0 +1,138 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import os
+import re
+import stat
+import mimetypes
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from backend.compression import etag_matches
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+class RangeFile :
+	"""Read only view of length bytes of an open file starting at start, so FileResponse streams just that part"""
+
+	def __init__(self, f, start, length) :
+		f.seek(start)
+		self.file = f
+		self.remaining = length
+
+	def read(self, size=-1) :
+		if self.remaining <= 0 :
+			return b''
+
+		size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+		data = self.file.read(size)
+		self.remaining -= len(data)
+		return data
+
+	def close(self) :
+		self.file.close()
+
+def parse_range(header, size) :
+	"""Returns (start, end) for a single byte range, None when there is no usable range, or raises ValueError if unsatisfiable"""
+	matches = RANGE_RE.match(header.strip()) if header else None
+
+	# multiple ranges are allowed to be answered with the whole file
+	if matches is None or matches[1] == matches[2] == '' :
+		return None
+
+	if matches[1] == '' :
+		suffix = int(matches[2])
+		# nothing of an empty file can be sent
+		if suffix == 0 or size == 0 :
+			raise ValueError("Empty suffix range")
+		return max(0, size - suffix), size - 1
+
+	start = int(matches[1])
+	end = int(matches[2]) if matches[2] else size - 1
+
+	if start >= size or end < start :
+		raise ValueError("Range not satisfiable")
+
+	return start, min(end, size - 1)
+
+def _if_range_allows(request, etag, last_modified) :
+	if_range = request.META.get('HTTP_IF_RANGE')
+	# If-Range uses strong comparison, so a weak validator never matches
+	return if_range is None or if_range == etag or if_range == last_modified
+
+def _offload(path, fullpath) :
+	backend = settings.MEDIA_SENDFILE['BACKEND']
+	response = HttpResponse(content_type=mimetypes.guess_type(fullpath)[0] or 'application/octet-stream')
+
+	if backend == 'x-accel-redirect' :
+		response['X-Accel-Redirect'] = settings.MEDIA_SENDFILE['URL_PREFIX'] + path
+	elif backend == 'x-sendfile' :
+		response['X-Sendfile'] = fullpath
+	else :
+		raise ValueError("Unknown MEDIA_SENDFILE backend: %s" % backend)
+
+	return response
+
+def serve(request, path, document_root=None) :
+	"""
+	Serves a media file with ETag/Last-Modified validation and single range requests. Whole files are passed to the
+	server's wsgi.file_wrapper so it can use sendfile, and MEDIA_SENDFILE can hand the transfer to the front end server
+	entirely (nginx's X-Accel-Redirect or Apache's X-Sendfile).
+	"""
+	try :
+		fullpath = safe_join(document_root or settings.MEDIA_ROOT, path)
+		st = os.stat(fullpath)
+	except (SuspiciousFileOperation, OSError) :
+		raise Http404("Media file does not exist")
+
+	if not stat.S_ISREG(st.st_mode) :
+		raise Http404("Media file does not exist")
+
+	etag = '"%x-%x"' % (st.st_mtime_ns, st.st_size)
+	last_modified = http_date(st.st_mtime)
+
+	if 'HTTP_IF_NONE_MATCH' in request.META :
+		not_modified = etag_matches(request, etag)
+	else :
+		not_modified = not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), st.st_mtime, st.st_size)
+
+	if not_modified :
+		response = HttpResponseNotModified()
+
+	elif settings.MEDIA_SENDFILE['BACKEND'] :
+		response = _offload(path, fullpath)
+
+	else :
+		content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+		byte_range = None
+
+		if _if_range_allows(request, etag, last_modified) :
+			try :
+				byte_range = parse_range(request.META.get('HTTP_RANGE'), st.st_size)
+			except ValueError :
+				response = HttpResponse(status=416)
+				response['Content-Range'] = 'bytes */%d' % st.st_size
+				return response
+
+		if byte_range is None :
+			response = FileResponse(open(fullpath, 'rb'), content_type=content_type)
+		else :
+			start, end = byte_range
+			response = FileResponse(RangeFile(open(fullpath, 'rb'), start, end - start + 1), status=206, content_type=content_type)
+			response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, st.st_size)
+			response['Content-Length'] = end - start + 1
+
+		response['Accept-Ranges'] = 'bytes'
+
+	response['ETag'] = etag
+	response['Last-Modified'] = last_modified
+	response['Cache-Control'] = 'public, max-age=%d' % settings.MEDIA_CACHE_MAX_AGE
+	return response
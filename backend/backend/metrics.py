@@ -0,0 +1,313 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import os
+import re
+import time
+import hmac
+import random
+import weakref
+import asyncio
+import cProfile
+import functools
+import ipaddress
+import threading
+import contextvars
+
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+HELP = {
+	'http_request_duration_seconds' : ('histogram', "Time spent handling requests, by route"),
+	'http_response_size_bytes' : ('histogram', "Size of non streaming response bodies, by route"),
+	'db_queries_total' : ('counter', "SQL queries made, by route"),
+	'db_query_duration_seconds_total' : ('counter', "Time spent in SQL queries, by route"),
+	'password_hash_duration_seconds' : ('histogram', "Time spent hashing or checking passwords, including any wait for the hash pool"),
+	'auth_step_duration_seconds' : ('histogram', "Time spent in steps of the authentication views"),
+	'log_records_dropped_total' : ('counter', "Log records dropped because the log queue was full"),
+}
+
+class ThreadMetrics :
+	"""Metrics recorded by a single thread, only ever written by that thread so no locking is needed"""
+
+	def __init__(self) :
+		self.counters = {}
+		self.histograms = {}
+
+class _ThreadExit :
+	"""Kept only in a thread's local storage, so that it is freed, and its finalizer run, when the thread exits"""
+
+_registries = set()
+# metrics of threads that have exited, so that servers starting a thread per request do not keep a registry for each
+_retired = ThreadMetrics()
+_registries_lock = threading.Lock()
+_local = threading.local()
+
+def _merge(counters, histograms, registry) :
+	# dict.copy() is atomic under the GIL, so the owning thread can keep writing while we read
+	for key, value in registry.counters.copy().items() :
+		counters[key] = counters.get(key, 0) + value
+
+	for key, (buckets, counts, total, count) in registry.histograms.copy().items() :
+		merged = histograms.get(key)
+		if merged is None :
+			merged = histograms[key] = [buckets, [0] * len(buckets), 0.0, 0]
+
+		merged[1] = [a + b for a, b in zip(merged[1], counts)]
+		merged[2] += total
+		merged[3] += count
+
+def _retire(registry) :
+	with _registries_lock :
+		_merge(_retired.counters, _retired.histograms, registry)
+		_registries.discard(registry)
+
+def _registry() :
+	registry = getattr(_local, 'registry', None)
+
+	if registry is None :
+		registry = _local.registry = ThreadMetrics()
+		_local.exit = _ThreadExit()
+		weakref.finalize(_local.exit, _retire, registry)
+
+		# the only lock taken, once per thread, so that a scrape can find this thread's numbers
+		with _registries_lock :
+			_registries.add(registry)
+
+	return registry
+
+def increment(name, labels, amount=1) :
+	counters = _registry().counters
+	key = (name, labels)
+	counters[key] = counters.get(key, 0) + amount
+
+def observe(name, labels, value, buckets=DURATION_BUCKETS) :
+	histograms = _registry().histograms
+	key = (name, labels)
+
+	histogram = histograms.get(key)
+	if histogram is None :
+		histogram = histograms[key] = [buckets, [0] * len(buckets), 0.0, 0]
+
+	counts = histogram[1]
+	for i, bound in enumerate(buckets) :
+		if value <= bound :
+			counts[i] += 1
+			break
+
+	histogram[2] += value
+	histogram[3] += 1
+
+@contextmanager
+def timed(name, **labels) :
+	start = time.perf_counter()
+	try :
+		yield
+	finally :
+		observe(name, tuple(sorted(labels.items())), time.perf_counter() - start)
+
+def timed_function(name, **labels) :
+	def decorator(fn) :
+		@functools.wraps(fn)
+		def wrapper(*args, **kwargs) :
+			with timed(name, **labels) :
+				return fn(*args, **kwargs)
+		return wrapper
+	return decorator
+
+def _escape(value) :
+	return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels) :
+	if not labels :
+		return ''
+	return '{' + ','.join('%s="%s"' % (name, _escape(value)) for name, value in labels) + '}'
+
+def _collect() :
+	counters = {}
+	histograms = {}
+
+	# held throughout so that a thread retiring meanwhile is counted exactly once
+	with _registries_lock :
+		for registry in [_retired] + list(_registries) :
+			_merge(counters, histograms, registry)
+
+	return counters, histograms
+
+def _gauges() :
+	from backend.user_cache import user_cache
+
+	stats = user_cache.stats()
+	yield 'user_cache_hits_total', 'counter', "User cache hits", [((('tier', 'local'), ), stats['local']['hits']), ((('tier', 'shared'), ), stats['shared']['hits'])]
+	yield 'user_cache_misses_total', 'counter', "User cache misses", [((('tier', 'local'), ), stats['local']['misses']), ((('tier', 'shared'), ), stats['shared']['misses'])]
+
+def render() :
+	"""Renders every thread's metrics, summed, in the Prometheus text exposition format"""
+	counters, histograms = _collect()
+	lines = []
+	described = set()
+
+	def describe(name, kind=None, description=None) :
+		if name not in described :
+			kind, description = (kind, description) if kind else HELP.get(name, ('untyped', name))
+			lines.append('# HELP %s %s' % (name, description))
+			lines.append('# TYPE %s %s' % (name, kind))
+			described.add(name)
+
+	for (name, labels), value in sorted(counters.items()) :
+		describe(name)
+		lines.append('%s%s %s' % (name, _format_labels(labels), repr(float(value))))
+
+	for (name, labels), (buckets, counts, total, count) in sorted(histograms.items()) :
+		describe(name)
+
+		cumulative = 0
+		for bound, bucket_count in zip(buckets, counts) :
+			cumulative += bucket_count
+			lines.append('%s_bucket%s %d' % (name, _format_labels(labels + (('le', repr(float(bound))), )), cumulative))
+
+		lines.append('%s_bucket%s %d' % (name, _format_labels(labels + (('le', '+Inf'), )), count))
+		lines.append('%s_sum%s %s' % (name, _format_labels(labels), repr(total)))
+		lines.append('%s_count%s %d' % (name, _format_labels(labels), count))
+
+	for name, kind, description, samples in _gauges() :
+		describe(name, kind, description)
+		for labels, value in samples :
+			lines.append('%s%s %s' % (name, _format_labels(labels), repr(float(value))))
+
+	return '\n'.join(lines) + '\n'
+
+def _may_scrape(request) :
+	token = settings.METRICS['TOKEN']
+	if token and hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer ' + token) :
+		return True
+
+	# behind proxies every request arrives from one of theirs, so the address says nothing about the client
+	if settings.METRICS['ALLOW_INTERNAL'] and not settings.REST_FRAMEWORK.get('NUM_PROXIES') :
+		try :
+			address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+		except ValueError :
+			return False
+
+		return address.is_private or address.is_loopback
+
+	return False
+
+def metrics_view(request) :
+	if not _may_scrape(request) :
+		return HttpResponseForbidden("Metrics are only served to internal addresses or with the metrics token", content_type='text/plain; charset=utf-8')
+
+	return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class QueryCounter :
+	def __init__(self) :
+		self.count = 0
+		self.duration = 0.0
+
+# the counter of the request being handled, a context variable so that it follows async views into sync_to_async threads
+_queries = contextvars.ContextVar('backend_metrics_queries', default=None)
+
+def count_queries(execute, sql, params, many, context) :
+	queries = _queries.get()
+	if queries is None :
+		return execute(sql, params, many, context)
+
+	start = time.perf_counter()
+	try :
+		return execute(sql, params, many, context)
+	finally :
+		queries.count += 1
+		queries.duration += time.perf_counter() - start
+
+def install_query_counter(connection) :
+	"""Called for every new database connection, see backend.signals"""
+	if count_queries not in connection.execute_wrappers :
+		connection.execute_wrappers.append(count_queries)
+
+class MetricsMiddleware :
+	"""
+	Records latency, response size and SQL use per route, and with PROFILE_SAMPLE_RATE profiles a sample of requests.
+	Works in both sync and async stacks, async requests are not profiled as cProfile only sees the event loop's thread.
+	"""
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response) :
+		self.get_response = get_response
+		self._async = asyncio.iscoroutinefunction(get_response)
+
+		if self._async :
+			# how Django's MiddlewareMixin marks itself as a coroutine function
+			self._is_coroutine = asyncio.coroutines._is_coroutine
+
+	def __call__(self, request) :
+		if self._async :
+			return self.__acall__(request)
+
+		if not settings.METRICS['ENABLED'] :
+			return self.get_response(request)
+
+		queries = QueryCounter()
+		token = _queries.set(queries)
+		profiler = cProfile.Profile() if random.random() < settings.METRICS['PROFILE_SAMPLE_RATE'] else None
+
+		start = time.perf_counter()
+		if profiler is not None :
+			profiler.enable()
+		try :
+			response = self.get_response(request)
+		finally :
+			if profiler is not None :
+				profiler.disable()
+			_queries.reset(token)
+
+		route = self.record(request, response, queries, time.perf_counter() - start)
+
+		if profiler is not None :
+			self.dump_profile(profiler, route)
+
+		return response
+
+	async def __acall__(self, request) :
+		if not settings.METRICS['ENABLED'] :
+			return await self.get_response(request)
+
+		queries = QueryCounter()
+		token = _queries.set(queries)
+
+		start = time.perf_counter()
+		try :
+			response = await self.get_response(request)
+		finally :
+			_queries.reset(token)
+
+		self.record(request, response, queries, time.perf_counter() - start)
+		return response
+
+	def record(self, request, response, queries, elapsed) :
+		match = request.resolver_match
+		route = match.route if match is not None else 'unmatched'
+
+		observe('http_request_duration_seconds', (('method', request.method), ('route', route), ('status', response.status_code)), elapsed)
+		increment('db_queries_total', (('route', route), ), queries.count)
+		increment('db_query_duration_seconds_total', (('route', route), ), queries.duration)
+
+		if not response.streaming :
+			observe('http_response_size_bytes', (('route', route), ), len(response.content), buckets=SIZE_BUCKETS)
+
+		return route
+
+	def dump_profile(self, profiler, route) :
+		directory = settings.METRICS['PROFILE_DIR']
+		os.makedirs(directory, exist_ok=True)
+
+		name = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+		profiler.dump_stats(os.path.join(directory, '%s-%d-%d.prof' % (name, time.time() * 1000, threading.get_ident())))
@@ -0,0 +1,155 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import asyncio
+
+from django.conf import settings
+from django.contrib.admin.checks import check_dependencies, _contains_subclass
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.exception import convert_exception_to_response
+from django.urls import reverse, NoReverseMatch
+from django.utils.module_loading import import_string
+
+# the middleware the admin's checks look for in MIDDLEWARE, by the id of the error each raises
+ADMIN_MIDDLEWARE = {
+	'admin.E408' : 'django.contrib.auth.middleware.AuthenticationMiddleware',
+	'admin.E409' : 'django.contrib.messages.middleware.MessageMiddleware',
+	'admin.E410' : 'django.contrib.sessions.middleware.SessionMiddleware',
+}
+
+def _routes() :
+	return sorted(settings.MIDDLEWARE_ROUTES.items(), key=lambda route : len(route[0]), reverse=True)
+
+def route_middleware(path) :
+	"""The middleware a request to path runs through, those in MIDDLEWARE followed by its route's chain"""
+	if not _contains_subclass('backend.middleware.RouteMiddleware', settings.MIDDLEWARE) :
+		return list(settings.MIDDLEWARE)
+
+	for prefix, paths in _routes() :
+		if path.startswith(prefix) :
+			return settings.MIDDLEWARE + list(paths)
+
+	return list(settings.MIDDLEWARE)
+
+def check_admin_middleware(**kwargs) :
+	"""The admin's dependency checks, looking for the middleware it needs in its route's chain rather than in MIDDLEWARE"""
+	try :
+		middleware = route_middleware(reverse('admin:index'))
+	except NoReverseMatch :
+		middleware = settings.MIDDLEWARE
+
+	return [
+		error for error in check_dependencies(**kwargs)
+		if error.id not in ADMIN_MIDDLEWARE or not _contains_subclass(ADMIN_MIDDLEWARE[error.id], middleware)
+	]
+
+class MiddlewareChain(BaseHandler) :
+	"""
+	A list of middleware wrapped around get_response once, the same way Django's handler builds the MIDDLEWARE chain,
+	along with the process_view, process_template_response and process_exception hooks of its middleware.
+	"""
+
+	def __init__(self, paths, get_response, is_async=False) :
+		self.view_middleware = []
+		self.template_response_middleware = []
+		self.exception_middleware = []
+
+		handler = get_response
+		handler_is_async = is_async
+
+		for path in reversed(paths) :
+			middleware = import_string(path)
+			middleware_can_sync = getattr(middleware, 'sync_capable', True)
+			middleware_can_async = getattr(middleware, 'async_capable', False)
+
+			if not middleware_can_sync and not middleware_can_async :
+				raise ImproperlyConfigured("Middleware %s must have at least one of sync_capable/async_capable set to True." % path)
+
+			middleware_is_async = middleware_can_async if handler_is_async or not middleware_can_sync else False
+
+			try :
+				adapted_handler = self.adapt_method_mode(middleware_is_async, handler, handler_is_async)
+				instance = middleware(adapted_handler)
+			except MiddlewareNotUsed :
+				continue
+
+			if instance is None :
+				raise ImproperlyConfigured("Middleware factory %s returned None." % path)
+
+			# the hooks are called by RouteMiddleware's own, which Django always runs synchronously or adapts itself
+			if hasattr(instance, 'process_view') :
+				self.view_middleware.insert(0, self.adapt_method_mode(False, instance.process_view))
+			if hasattr(instance, 'process_template_response') :
+				self.template_response_middleware.append(self.adapt_method_mode(False, instance.process_template_response))
+			if hasattr(instance, 'process_exception') :
+				self.exception_middleware.append(self.adapt_method_mode(False, instance.process_exception))
+
+			handler = convert_exception_to_response(instance)
+			handler_is_async = middleware_is_async
+
+		self.handler = self.adapt_method_mode(is_async, handler, handler_is_async)
+
+	def __call__(self, request) :
+		return self.handler(request)
+
+class RouteMiddleware :
+	"""
+	Runs each request through the middleware chain of the longest MIDDLEWARE_ROUTES prefix matching its path, so that
+	the token API skips the session, CSRF and message middleware that only the admin and the frontend need. Each chain
+	is built once, when the handler loads its middleware.
+	"""
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response) :
+		self._async = asyncio.iscoroutinefunction(get_response)
+
+		if self._async :
+			# how Django's MiddlewareMixin marks itself as a coroutine function
+			self._is_coroutine = asyncio.coroutines._is_coroutine
+
+		self.routes = [(prefix, MiddlewareChain(paths, get_response, self._async)) for prefix, paths in _routes()]
+		self.default = MiddlewareChain([], get_response, self._async)
+
+	def chain(self, request) :
+		chain = getattr(request, '_middleware_chain', None)
+		if chain is not None :
+			return chain
+
+		chain = self.default
+		for prefix, candidate in self.routes :
+			if request.path_info.startswith(prefix) :
+				chain = candidate
+				break
+
+		request._middleware_chain = chain
+		return chain
+
+	def __call__(self, request) :
+		return self.chain(request)(request)
+
+	def process_view(self, request, view_func, view_args, view_kwargs) :
+		for process_view in self.chain(request).view_middleware :
+			response = process_view(request, view_func, view_args, view_kwargs)
+			if response is not None :
+				return response
+
+		return None
+
+	def process_template_response(self, request, response) :
+		for process_template_response in self.chain(request).template_response_middleware :
+			response = process_template_response(request, response)
+
+		return response
+
+	def process_exception(self, request, exception) :
+		for process_exception in self.chain(request).exception_middleware :
+			response = process_exception(request, exception)
+			if response is not None :
+				return response
+
+		return None
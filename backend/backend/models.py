@@ -6,12 +6,51 @@
 
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 
 class User(AbstractUser):
-	username = models.CharField(max_length=128, unique=True, primary_key=True, db_index=True)
+	# foreign keys to users store and join on this rather than the username, databases created while the username was
+	# the primary key are converted by the convert_user_pk command
+	id = models.BigAutoField(primary_key=True)
+	username = models.CharField(max_length=128, unique=True)
+	# indexed so that the username filter can cheaply catch up on recent registrations
+	date_joined = models.DateTimeField(_('date joined'), default=timezone.now, db_index=True)
+	# label of the registration key the user signed up with, so that a class can be exported on its own
+	cohort = models.CharField(max_length=128, blank=True, db_index=True)
 
 	USERNAME_FIELD = 'username'
 	REQUIRED_FIELDS = []
 	
+	@classmethod
+	def from_db(cls, db, field_names, values) :
+		user = super().from_db(db, field_names, values)
+		# remembered so that a rename can be told apart from other saves, see backend.signals
+		user._loaded_username = user.__dict__.get('username')
+		return user
+
 	def __str__(self) :
 		return self.username
+
+class RegistrationKey(models.Model):
+	"""Secret key handed out to a class so that its students can register, optionally limited in time and seats"""
+	key = models.CharField(max_length=128, unique=True)
+	label = models.CharField(max_length=128, blank=True)
+	expires_at = models.DateTimeField(null=True, blank=True)
+	seat_limit = models.PositiveIntegerField(null=True, blank=True)
+	seats_used = models.PositiveIntegerField(default=0)
+	is_active = models.BooleanField(default=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	def __str__(self) :
+		return self.label or self.key
+
+class RevokedToken(models.Model):
+	"""Refresh token that may no longer be used, kept until the time it would have expired anyway"""
+	jti = models.CharField(max_length=64, primary_key=True)
+	expires_at = models.DateTimeField(db_index=True)
+	# indexed so that other processes can cheaply catch up on recent revocations
+	revoked_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+	def __str__(self) :
+		return self.jti
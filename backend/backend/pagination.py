@@ -0,0 +1,80 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+from django.contrib.admin.views.main import ChangeList, PAGE_VAR
+
+# query parameters holding the key of the last row of the previous page, or the first row of the next one
+CURSOR_VAR = 'cursor'
+BEFORE_VAR = 'before'
+
+class KeysetChangeList(ChangeList) :
+	"""
+	Admin changelist that pages by the model admin's keyset_field when the list is sorted by it, seeking to the rows
+	after the cursor through the index rather than counting past them with OFFSET, so that every page costs the same
+	as the first. Other sortings page as usual.
+	"""
+
+	def __init__(self, request, *args, **kwargs) :
+		self.cursor = request.GET.get(CURSOR_VAR)
+		self.before = request.GET.get(BEFORE_VAR)
+		self.keyset = False
+		self.next_url = None
+		self.previous_url = None
+		super().__init__(request, *args, **kwargs)
+
+	def get_filters_params(self, params=None) :
+		lookup_params = super().get_filters_params(params)
+		lookup_params.pop(CURSOR_VAR, None)
+		lookup_params.pop(BEFORE_VAR, None)
+		return lookup_params
+
+	def uses_keyset(self) :
+		field = getattr(self.model_admin, 'keyset_field', None)
+		if field is None or self.show_all :
+			return False
+
+		# the keyset has to be unique and the only ordering, otherwise rows sharing a key would be skipped
+		orderings = [[field], ['pk']] if self.model._meta.pk.name == field else [[field]]
+		return list(dict.fromkeys(self.queryset.query.order_by)) in orderings
+
+	def get_results(self, request) :
+		"""Fetches one page past the cursor, in place of the parent's COUNT and OFFSET, when the keyset can be used"""
+		if not self.uses_keyset() :
+			return super().get_results(request)
+
+		self.keyset = True
+		field = self.model_admin.keyset_field
+		per_page = self.list_per_page
+
+		if self.before is not None :
+			rows = list(self.queryset.filter(**{field + '__lt' : self.before}).order_by('-' + field)[:per_page + 1])
+			has_previous = len(rows) > per_page
+			has_next = True
+			rows = rows[:per_page][::-1]
+		else :
+			queryset = self.queryset
+			if self.cursor is not None :
+				queryset = queryset.filter(**{field + '__gt' : self.cursor})
+
+			rows = list(queryset[:per_page + 1])
+			has_previous = self.cursor is not None
+			has_next = len(rows) > per_page
+			rows = rows[:per_page]
+
+		# nothing is counted, so counts shown are of this page, and the numbered pages and "Show all" are left out
+		self.result_count = len(rows)
+		self.show_full_result_count = self.model_admin.show_full_result_count
+		self.full_result_count = self.root_queryset.count() if self.show_full_result_count else None
+		self.show_admin_actions = not self.show_full_result_count or bool(self.full_result_count)
+		self.result_list = rows
+		self.can_show_all = False
+		self.multi_page = False
+		self.paginator = self.model_admin.get_paginator(request, self.queryset, per_page)
+
+		if rows and has_next :
+			self.next_url = self.get_query_string({CURSOR_VAR : getattr(rows[-1], field)}, [BEFORE_VAR, PAGE_VAR])
+		if rows and has_previous :
+			self.previous_url = self.get_query_string({BEFORE_VAR : getattr(rows[0], field)}, [CURSOR_VAR, PAGE_VAR])
@@ -0,0 +1,102 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from backend.cache import LRUCache
+from backend.models import RegistrationKey
+
+_MISSING = object()
+
+_index = None
+
+def _get_index() :
+	global _index
+
+	if _index is None :
+		_index = LRUCache(settings.REGISTRATION_KEY_CACHE['MAX_SIZE'])
+
+	return _index
+
+def _lookup(key) :
+	"""Returns the cached (pk, expires_at, seat_limit, is_active, label) of a key, or None if there is no such key"""
+	index = _get_index()
+	entry = index.get(key, _MISSING)
+
+	if entry is _MISSING :
+		entry = RegistrationKey.objects.filter(key=key).values_list('pk', 'expires_at', 'seat_limit', 'is_active', 'label').first()
+		# unknown keys are remembered for less time, so a key created in another process is usable soon after
+		ttl = settings.REGISTRATION_KEY_CACHE['TTL'] if entry is not None else settings.REGISTRATION_KEY_CACHE['NEGATIVE_TTL']
+		index.set(key, entry, ttl=ttl)
+
+	return entry
+
+def invalidate() :
+	_get_index().clear()
+
+def is_valid(key) :
+	if not isinstance(key, str) or not key :
+		return False
+
+	if key in settings.REGISTRATION_SECRET_KEYS :
+		return True
+
+	entry = _lookup(key)
+	if entry is None :
+		return False
+
+	_, expires_at, _, is_active, _ = entry
+	return is_active and (expires_at is None or expires_at > timezone.now())
+
+def cohort(key) :
+	"""
+	Name of the group that registered with key: its label, or for unlabelled keys "key-<pk>" so that the secret itself
+	never reaches the admin or exports. Blank for the keys in settings
+	"""
+	entry = _lookup(key) if key not in settings.REGISTRATION_SECRET_KEYS else None
+	if entry is None :
+		return ''
+
+	return entry[4] or 'key-%d' % entry[0]
+
+def claim_seats(key, count=1) :
+	"""
+	Atomically takes up to count seats from a key, returning how many were taken. Should be called inside the
+	transaction that creates the users, so that the seats are given back if that fails.
+	"""
+	if key in settings.REGISTRATION_SECRET_KEYS :
+		return count
+
+	entry = _lookup(key)
+	if entry is None :
+		return 0
+
+	pk, _, seat_limit, _, _ = entry
+	keys = RegistrationKey.objects.filter(pk=pk)
+
+	if seat_limit is None :
+		keys.update(seats_used=F('seats_used') + count)
+		return count
+
+	while count > 0 :
+		# the seat check happens in the UPDATE itself, so concurrent registrations cannot oversubscribe a key
+		if keys.filter(seats_used__lte=F('seat_limit') - count).update(seats_used=F('seats_used') + count) :
+			return count
+
+		remaining = keys.values_list('seat_limit', 'seats_used').first()
+		count = min(count, remaining[0] - remaining[1]) if remaining is not None else 0
+
+	return 0
+
+def release_seats(key, count) :
+	if count <= 0 or key in settings.REGISTRATION_SECRET_KEYS :
+		return
+
+	entry = _lookup(key)
+	if entry is not None :
+		RegistrationKey.objects.filter(pk=entry[0], seats_used__gte=count).update(seats_used=F('seats_used') - count)
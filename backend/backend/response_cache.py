@@ -0,0 +1,134 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import hashlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
+
+from backend.cache import LRUCache
+from backend.compression import etag_matches
+from backend.utils import STATUS_CODE_2xx
+
+_responses = None
+
+@receiver(setting_changed)
+def _reset(setting, **kwargs) :
+	global _responses
+
+	if setting == 'RESPONSE_CACHE' :
+		_responses = None
+
+def _get_responses() :
+	global _responses
+
+	if _responses is None :
+		_responses = LRUCache(settings.RESPONSE_CACHE['MAX_SIZE'])
+
+	return _responses
+
+def clear() :
+	_get_responses().clear()
+
+def stats() :
+	responses = _get_responses()
+	return {"enabled" : settings.RESPONSE_CACHE['ENABLED'], "hits" : responses.hits, "misses" : responses.misses, "size" : len(responses)}
+
+class PrerenderedResponse(HttpResponse) :
+	"""A response with a body rendered ahead of time, which keeps the data it was rendered from in .data as DRF's Response does"""
+
+	def __init__(self, content, data=None, content_type='application/json', status=None, headers=None) :
+		super().__init__(content, content_type=content_type, status=status, headers=headers)
+		self.data = data
+
+class Prerendered :
+	"""
+	A payload rendered once, by default with the JSONRenderer DRF would have used. Each call to response() gives a new
+	PrerenderedResponse sharing the same body, since middleware add their own headers to the responses they are given.
+	"""
+
+	def __init__(self, data, status, headers=None, content=None, content_type='application/json') :
+		self.data = data
+		self.status = status
+		self.headers = dict(headers or {})
+		self.content = JSONRenderer().render(data) if content is None else content
+		self.content_type = content_type
+
+	def response(self) :
+		return PrerenderedResponse(self.content, self.data, self.content_type, self.status, self.headers)
+
+class CachedResponseMixin :
+	"""
+	For APIViews whose GET responses are the same for every caller. Successful responses are rendered once and kept
+	for cache_ttl seconds, keyed by path, query string and the request headers named in cache_vary, then served with
+	an ETag straight from memory, skipping authentication, content negotiation and rendering. Matching conditional
+	GETs get a 304. As hits never reach the permission and throttle checks, only views open to anyone may use it.
+	"""
+	cache_ttl = 60
+	# the Accept header picks the renderer
+	cache_vary = ('Accept',)
+
+	def __init_subclass__(cls, **kwargs) :
+		super().__init_subclass__(**kwargs)
+
+		if any(permission is not AllowAny for permission in getattr(cls, 'permission_classes', ())) or getattr(cls, 'throttle_classes', ()) :
+			raise ImproperlyConfigured("%s cannot cache its responses, cached responses skip its permission and throttle checks" % cls.__qualname__)
+
+	def cache_key(self, request, *args, **kwargs) :
+		headers = tuple(request.headers.get(header, '') for header in self.cache_vary)
+		return (type(self).__module__, type(self).__qualname__, request.path, request.META.get('QUERY_STRING', '')) + headers
+
+	def prerender(self, response) :
+		"""Renders response into a Prerendered that can be served again, or returns None if it should not be kept"""
+		if response.streaming or response.cookies or response.status_code != STATUS_CODE_2xx.SUCCESS.value :
+			return None
+
+		if hasattr(response, 'render') :
+			response.render()
+
+		patch_vary_headers(response, self.cache_vary)
+
+		headers = {name : value for name, value in response.items() if name not in ('Content-Type', 'Content-Length')}
+		headers['ETag'] = '"%s"' % hashlib.sha256(response.content).hexdigest()[:32]
+
+		return Prerendered(getattr(response, 'data', None), response.status_code, headers, response.content, response['Content-Type'])
+
+	def cached_response(self, request, entry) :
+		if not etag_matches(request, entry.headers['ETag']) :
+			return entry.response()
+
+		response = HttpResponseNotModified()
+		for name in ('ETag', 'Vary') :
+			if name in entry.headers :
+				response[name] = entry.headers[name]
+
+		return response
+
+	def dispatch(self, request, *args, **kwargs) :
+		if not settings.RESPONSE_CACHE['ENABLED'] or request.method not in ('GET', 'HEAD') :
+			return super().dispatch(request, *args, **kwargs)
+
+		responses = _get_responses()
+		key = self.cache_key(request, *args, **kwargs)
+
+		entry = responses.get(key)
+		if entry is None :
+			response = super().dispatch(request, *args, **kwargs)
+
+			entry = self.prerender(response)
+			if entry is None :
+				return response
+
+			responses.set(key, entry, ttl=self.cache_ttl)
+
+		return self.cached_response(request, entry)
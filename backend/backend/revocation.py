@@ -0,0 +1,145 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import time
+import heapq
+import threading
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from backend.user_cache import user_cache
+
+# rows are stamped with revoked_at before they commit, so each catch up re-reads a little history to not miss slow commits
+SYNC_OVERLAP = timedelta(minutes=1)
+
+class RevocationStore :
+	"""
+	Revoked refresh tokens by jti, held in a dict so that checking a token is a single lookup, and persisted as
+	RevokedToken rows so that revocations survive restarts and reach other processes. Other processes' revocations are
+	picked up at most once every SYNC_INTERVAL seconds, but a rotated token can still only be used once anywhere, as
+	revoking it is an insert that only one request can win. Entries are dropped once their token has expired.
+	"""
+
+	def __init__(self) :
+		self._revoked = {}
+		self._expiry = []
+		self._lock = threading.Lock()
+		self._synced_at = None
+		self._checked_at = 0.0
+		self._purged_at = 0.0
+
+	def _remember(self, jti, expires_at) :
+		with self._lock :
+			if jti not in self._revoked :
+				self._revoked[jti] = expires_at
+				heapq.heappush(self._expiry, (expires_at, jti))
+
+	def _forget_expired(self, now) :
+		with self._lock :
+			while self._expiry and self._expiry[0][0] <= now :
+				_, jti = heapq.heappop(self._expiry)
+				self._revoked.pop(jti, None)
+
+	def _sync(self) :
+		from backend.models import RevokedToken
+
+		now = time.monotonic()
+		if self._synced_at is not None and now - self._checked_at < settings.TOKEN_REVOCATION['SYNC_INTERVAL'] :
+			return
+
+		self._checked_at = now
+		synced_at = timezone.now()
+
+		rows = RevokedToken.objects.filter(expires_at__gt=synced_at)
+		if self._synced_at is not None :
+			rows = rows.filter(revoked_at__gte=self._synced_at - SYNC_OVERLAP)
+
+		for jti, expires_at in rows.values_list('jti', 'expires_at') :
+			self._remember(jti, expires_at.timestamp())
+
+		self._synced_at = synced_at
+		self._forget_expired(time.time())
+
+		if now - self._purged_at >= settings.TOKEN_REVOCATION['PURGE_INTERVAL'] :
+			self._purged_at = now
+			RevokedToken.objects.filter(expires_at__lte=synced_at).delete()
+
+	def is_revoked(self, jti) :
+		self._sync()
+
+		expires_at = self._revoked.get(jti)
+		return expires_at is not None and expires_at > time.time()
+
+	def revoke(self, jti, expires_at) :
+		"""Revokes a token expiring at the unix time expires_at, returning False if it had already been revoked"""
+		from backend.models import RevokedToken
+
+		try :
+			with transaction.atomic() :
+				RevokedToken(jti=jti, expires_at=datetime.fromtimestamp(expires_at, tz=dt_timezone.utc)).save(force_insert=True)
+		except IntegrityError :
+			self._remember(jti, expires_at)
+			return False
+
+		self._remember(jti, expires_at)
+		return True
+
+	def reset(self) :
+		with self._lock :
+			self._revoked = {}
+			self._expiry = []
+			self._synced_at = None
+
+revocation_store = RevocationStore()
+
+def upgrade_user_claim(refresh) :
+	"""Names the user of a token issued with LEGACY_USER_ID_CLAIM by id, so that tokens refreshed from it do too"""
+	legacy_claim = settings.LEGACY_USER_ID_CLAIM
+	if legacy_claim is None or api_settings.USER_ID_CLAIM in refresh or legacy_claim not in refresh :
+		return
+
+	user = user_cache.get_user(refresh[legacy_claim])
+	if user is None :
+		raise TokenError("Token user no longer exists")
+
+	refresh[api_settings.USER_ID_CLAIM] = getattr(user, api_settings.USER_ID_FIELD)
+	del refresh[legacy_claim]
+
+class RotatingTokenRefreshSerializer(TokenRefreshSerializer) :
+	"""
+	TokenRefreshSerializer that checks the revocation store instead of simplejwt's token_blacklist app, which costs
+	queries on every refresh. With ROTATE_REFRESH_TOKENS and BLACKLIST_AFTER_ROTATION each refresh token works once.
+	"""
+
+	def validate(self, attrs) :
+		refresh = RefreshToken(attrs['refresh'])
+		jti = refresh[api_settings.JTI_CLAIM]
+
+		if revocation_store.is_revoked(jti) :
+			raise TokenError("Token has been revoked")
+
+		upgrade_user_claim(refresh)
+		data = {'access' : str(refresh.access_token)}
+
+		if api_settings.ROTATE_REFRESH_TOKENS :
+			# revoked first, so that of two requests racing with the same token only one gets a new one
+			if api_settings.BLACKLIST_AFTER_ROTATION and not revocation_store.revoke(jti, refresh['exp']) :
+				raise TokenError("Token has been revoked")
+
+			refresh.set_jti()
+			refresh.set_exp()
+			data['refresh'] = str(refresh)
+
+		return data
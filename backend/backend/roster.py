@@ -0,0 +1,167 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import io
+import csv
+import json
+
+import django.contrib.auth.password_validation as validators
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from backend import registration_keys
+from backend.models import User
+from backend.hashing import make_passwords
+from backend.usernames import username_filter
+from backend.utils import (
+	get_tokens_for_user,
+	format_error_messages,
+	STATUS_CODE_2xx,
+	STATUS_CODE_4xx
+)
+
+# sqlite refuses statements with more than 999 parameters
+LOOKUP_BATCH_SIZE = 900
+
+class RosterError(ValueError) :
+	pass
+
+def parse_roster(request) :
+	"""Reads a roster from either a JSON body ({"secret_key": ..., "users": [...]}) or a CSV body with username and password columns"""
+	content_type = request.content_type or ''
+	body = request.body.decode('utf-8')
+
+	if content_type.startswith('text/csv') :
+		secret_key = request.GET.get('secret_key')
+		reader = csv.DictReader(io.StringIO(body))
+
+		if reader.fieldnames is None or 'username' not in reader.fieldnames or 'password' not in reader.fieldnames :
+			raise RosterError("Roster CSV must have a header row with username and password columns")
+
+		rows = [{'username': row['username'], 'password': row['password']} for row in reader]
+
+	else :
+		try :
+			req = json.loads(body)
+		except ValueError :
+			raise RosterError("Roster could not be read, please supply JSON or CSV")
+
+		if not isinstance(req, dict) or not isinstance(req.get('users'), list) :
+			raise RosterError("Roster must contain a list of users")
+
+		secret_key = req.get('secret_key')
+		rows = [row if isinstance(row, dict) else {} for row in req['users']]
+
+	if len(rows) == 0 :
+		raise RosterError("Roster does not contain any users")
+
+	if len(rows) > settings.BULK_REGISTRATION['MAX_ROWS'] :
+		raise RosterError("Roster is too large, it must contain at most %d users" % settings.BULK_REGISTRATION['MAX_ROWS'])
+
+	return secret_key, rows
+
+def _row_error(index, username, message) :
+	return {"row" : index, "username" : username, "status" : STATUS_CODE_4xx.BAD_REQUEST.value, "message" : message}
+
+def _validate_row(row) :
+	username = User.normalize_username(str(row.get('username') or '').strip())
+	password = str(row.get('password') or '')
+
+	if not username :
+		return username, password, ["Username may not be blank."]
+	if len(username) > User._meta.get_field('username').max_length :
+		return username, password, ["Username is too long."]
+	if not password :
+		return username, password, ["Password may not be blank."]
+
+	try :
+		validators.validate_password(password=password, user=User(username=username))
+	except ValidationError as e :
+		return username, password, list(e.messages)
+
+	return username, password, []
+
+def _existing_usernames(usernames) :
+	existing = set()
+	usernames = [username for username in usernames if username_filter.might_exist(username)]
+
+	for i in range(0, len(usernames), LOOKUP_BATCH_SIZE) :
+		existing.update(User.objects.filter(username__in=usernames[i:i + LOOKUP_BATCH_SIZE]).values_list('username', flat=True))
+
+	return existing
+
+def _insert_chunk(users) :
+	"""Inserts a chunk of users, returning the ones that could not be created because their username was taken in the meantime"""
+	try :
+		with transaction.atomic() :
+			User.objects.bulk_create(users)
+		return set()
+
+	except IntegrityError :
+		# someone registered one of the names between our lookup and the insert, fall back to one row at a time
+		taken = set()
+
+		for user in users :
+			try :
+				with transaction.atomic() :
+					user.save(force_insert=True)
+			except IntegrityError :
+				taken.add(user.username)
+
+		return taken
+
+def register_roster(rows, secret_key) :
+	"""Validates, hashes and creates the users in a roster, yielding a result dict per row as each chunk is committed"""
+	candidates = []
+	seen = set()
+
+	for index, row in enumerate(rows) :
+		username, password, errors = _validate_row(row)
+
+		if not errors and username in seen :
+			errors = ["Username appears more than once in the roster."]
+
+		if errors :
+			yield _row_error(index, username, format_error_messages(errors))
+			continue
+
+		seen.add(username)
+		candidates.append((index, username, password))
+
+	existing = _existing_usernames([username for _, username, _ in candidates])
+
+	remaining = []
+	for index, username, password in candidates :
+		if username in existing :
+			yield _row_error(index, username, "User with username already exists")
+		else :
+			remaining.append((index, username, password))
+
+	chunk_size = settings.BULK_REGISTRATION['CHUNK_SIZE']
+	cohort = registration_keys.cohort(secret_key)
+
+	for i in range(0, len(remaining), chunk_size) :
+		chunk = remaining[i:i + chunk_size]
+		hashed = make_passwords([password for _, _, password in chunk])
+
+		users = [User(username=username, password=password_hash, cohort=cohort) for (_, username, _), password_hash in zip(chunk, hashed)]
+
+		with transaction.atomic() :
+			seated = registration_keys.claim_seats(secret_key, len(users))
+			taken = _insert_chunk(users[:seated])
+			registration_keys.release_seats(secret_key, len(taken))
+
+		for position, ((index, username, _), user) in enumerate(zip(chunk, users)) :
+			if position >= seated :
+				yield _row_error(index, username, "There are no places left for this secret key")
+			elif username in taken :
+				yield _row_error(index, username, "User with username already exists")
+			else :
+				# bulk_create does not send post_save, so the filter has to be told about the new names here
+				username_filter.add(username)
+				yield {"row" : index, "username" : username, "status" : STATUS_CODE_2xx.CREATED.value, "tokens" : get_tokens_for_user(user)}
@@ -0,0 +1,32 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = 'replica'
+
+class ReadReplicaRouter :
+	"""
+	Sends reads to the 'replica' database and writes to 'default' when DATABASE_READ_REPLICA is on. Reads made inside a
+	transaction on 'default' stay there, so that they see the transaction's own writes.
+	"""
+
+	def db_for_read(self, model, **hints) :
+		if not settings.DATABASE_READ_REPLICA or connections[DEFAULT_DB_ALIAS].in_atomic_block :
+			return DEFAULT_DB_ALIAS
+
+		return REPLICA_DB_ALIAS
+
+	def db_for_write(self, model, **hints) :
+		return DEFAULT_DB_ALIAS
+
+	def allow_relation(self, obj1, obj2, **hints) :
+		# both aliases are the same data
+		return True
+
+	def allow_migrate(self, db, app_label, model_name=None, **hints) :
+		return db == DEFAULT_DB_ALIAS
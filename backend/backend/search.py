@@ -0,0 +1,92 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+from django.db import connections, DatabaseError
+from django.db.models.expressions import RawSQL
+
+# columns searched by the admin, the index is an FTS5 table over them using the trigram tokenizer, which matches any
+# substring of three or more characters like icontains does, but from an index rather than by scanning every row
+SEARCH_COLUMNS = ('username', 'email', 'first_name', 'last_name')
+MIN_TERM_LENGTH = 3
+
+def _index_table(model) :
+	return model._meta.db_table + '_search'
+
+def _statements(model) :
+	table = model._meta.db_table
+	index = _index_table(model)
+	columns = ', '.join(SEARCH_COLUMNS)
+	new = ', '.join('new.' + column for column in SEARCH_COLUMNS)
+	old = ', '.join('old.' + column for column in SEARCH_COLUMNS)
+
+	insert = "INSERT INTO %s(rowid, %s) VALUES (new.rowid, %s);" % (index, columns, new)
+	delete = "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.rowid, %s);" % (index, index, columns, old)
+
+	return {
+		index : "CREATE VIRTUAL TABLE %s USING fts5(%s, content='%s', content_rowid='rowid', tokenize='trigram')" % (index, columns, table),
+		index + '_ai' : "CREATE TRIGGER %s_ai AFTER INSERT ON %s BEGIN %s END" % (index, table, insert),
+		index + '_ad' : "CREATE TRIGGER %s_ad AFTER DELETE ON %s BEGIN %s END" % (index, table, delete),
+		# only changes to the searched columns touch the index, not logins updating last_login or password rehashes
+		index + '_au' : "CREATE TRIGGER %s_au AFTER UPDATE OF %s ON %s BEGIN %s %s END" % (index, columns, table, delete, insert),
+	}
+
+def create_search_index(model, using='default') :
+	"""
+	Creates the index and the triggers that keep it in step with the table, filling it from the table if anything had to
+	be created. Returns whether the index is usable, it is not on databases other than SQLite or without FTS5.
+	"""
+	connection = connections[using]
+	if connection.vendor != 'sqlite' :
+		return False
+
+	with connection.cursor() as cursor :
+		cursor.execute("SELECT name FROM sqlite_master WHERE name LIKE %s", [_index_table(model) + '%'])
+		existing = {row[0] for row in cursor.fetchall()}
+
+		statements = _statements(model)
+		missing = [name for name in statements if name not in existing]
+
+		try :
+			for name in missing :
+				cursor.execute(statements[name])
+		except DatabaseError :
+			# SQLite built without FTS5 or older than 3.34, which added the trigram tokenizer
+			return False
+
+		if missing :
+			index = _index_table(model)
+			cursor.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (index, index))
+
+	return True
+
+def create_user_search_index(sender, using='default', **kwargs) :
+	"""post_migrate receiver, migrations are generated per deployment so the index cannot live in one"""
+	from backend.models import User
+
+	create_search_index(User, using)
+
+def fts_query(search_term) :
+	"""Turns a search into an FTS5 query matching rows that contain every term, or None if a term is too short to look up"""
+	terms = search_term.split()
+
+	if not terms or any(len(term) < MIN_TERM_LENGTH for term in terms) :
+		return None
+
+	return ' '.join('"%s"' % term.replace('"', '""') for term in terms)
+
+def search(queryset, search_term) :
+	"""Filters queryset to rows matching search_term through the index, or returns None when it cannot be used"""
+	query = fts_query(search_term)
+	if query is None or connections[queryset.db].vendor != 'sqlite' :
+		return None
+
+	model = queryset.model
+	index = _index_table(model)
+	sql = "SELECT %s FROM %s WHERE rowid IN (SELECT rowid FROM %s WHERE %s MATCH %%s)" % (
+		model._meta.pk.column, model._meta.db_table, index, index
+	)
+
+	return queryset.filter(pk__in=RawSQL(sql, [query]))
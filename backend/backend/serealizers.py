@@ -8,6 +8,8 @@ import django.contrib.auth.password_validation as validators
 import rest_framework.exceptions as exceptions
 
 from . import models
+from .hashing import hash_password
+from .usernames import username_filter
 from rest_framework import serializers
 
 class RegisterUserSerializer(serializers.ModelSerializer):
@@ -27,8 +29,9 @@ class RegisterUserSerializer(serializers.ModelSerializer):
 		errors = dict() 
 
 		try:
-			existing_users = models.User.objects.filter(username=username)
-			if len(existing_users) != 0 :
+			# the filter rules most new names out without a query, a name it lets through that then turns out to be
+			# taken is caught by the unique constraint when the user is saved
+			if username_filter.might_exist(username) and models.User.objects.filter(username=username).exists() :
 				errors['username'] = ["User with username already exists."]
 		
 		except Exception as e: 
@@ -42,6 +45,8 @@ class RegisterUserSerializer(serializers.ModelSerializer):
 		return super(RegisterUserSerializer, self).validate(data)
 
 	def create(self, validated_data):
-		user = models.User.objects.create_user(**validated_data)
+		user = models.User(username=models.User.normalize_username(validated_data['username']), cohort=validated_data.get('cohort', ''))
+		# async views hash before saving, so that the hashing does not hold the thread the ORM runs on
+		user.password = validated_data.get('password_hash') or hash_password(validated_data['password'])
 		user.save()
 		return user
\ No newline at end of file
@@ -41,7 +41,7 @@ ALLOWED_HOSTS = [
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    'backend.apps.RoutedAdminConfig',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -53,7 +53,16 @@ INSTALLED_APPS = [
 	'backend'
 ]
 
+# Middleware every request runs through, CORS first so that preflights are answered before anything else happens. The
+# rest depends on the route, see MIDDLEWARE_ROUTES
 MIDDLEWARE = [
+	'corsheaders.middleware.CorsMiddleware',
+	'backend.log.RequestLogMiddleware',
+	'backend.metrics.MetricsMiddleware',
+	'backend.middleware.RouteMiddleware',
+]
+
+SESSION_MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,20 +70,35 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-	'corsheaders.middleware.CorsMiddleware',
 ]
 
+# Middleware chains by path prefix, the longest prefix matching a request picks its chain. The token API authenticates
+# with JWTs in DRF rather than with sessions, so it skips the cookie, CSRF and message middleware the admin and SPA use
+MIDDLEWARE_ROUTES = {
+	'/api/admin/': SESSION_MIDDLEWARE,
+	'/api/': ['django.middleware.security.SecurityMiddleware', 'django.middleware.common.CommonMiddleware'],
+	'/static/': ['django.middleware.security.SecurityMiddleware'],
+	'/': SESSION_MIDDLEWARE,
+}
+
 # JWT Authentication settings
 REST_FRAMEWORK = {
 	'DEFAULT_AUTHENTICATION_CLASSES': [
-		'rest_framework_simplejwt.authentication.JWTAuthentication',
+		'backend.authentication.CachedJWTAuthentication',
 	],
+	# clients are identified by REMOTE_ADDR, behind proxies set this to how many of them add to X-Forwarded-For
+	'NUM_PROXIES': 0,
+}
+
+# Already verified access tokens kept by CachedJWTAuthentication, each entry is dropped when its token expires
+ACCESS_TOKEN_CACHE = {
+	'MAX_SIZE': 10000,
 }
 
 SIMPLE_JWT = {
 	'ACCESS_TOKEN_LIFETIME': timedelta(minutes=20),
 	'REFRESH_TOKEN_LIFETIME': timedelta(weeks=1),
-	'ROTATE_REFRESH_TOKENS': False,
+	'ROTATE_REFRESH_TOKENS': True,
 	'BLACKLIST_AFTER_ROTATION': True,
 	'UPDATE_LAST_LOGIN': False,
 
@@ -86,8 +110,8 @@ SIMPLE_JWT = {
 
 	'AUTH_HEADER_TYPES': ('Bearer',),
 	'AUTH_HEADER_NAME': 'HTTP_AUTHORIZATION',
-	'USER_ID_FIELD': 'username',
-	'USER_ID_CLAIM': 'user_username',
+	'USER_ID_FIELD': 'id',
+	'USER_ID_CLAIM': 'user_id',
 	'USER_AUTHENTICATION_RULE': 'rest_framework_simplejwt.authentication.default_user_authentication_rule',
 
 	'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
@@ -100,6 +124,17 @@ SIMPLE_JWT = {
 	'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# Claim naming the user by username in tokens issued before users had an integer primary key. These tokens are still
+# accepted and refreshing one gives tokens with the user's id, so this can be None once REFRESH_TOKEN_LIFETIME has passed
+LEGACY_USER_ID_CLAIM = 'user_username'
+
+# Revoked refresh tokens (see backend.revocation). Revocations made by other processes are seen within SYNC_INTERVAL
+# seconds, and rows for tokens that have expired anyway are deleted every PURGE_INTERVAL seconds
+TOKEN_REVOCATION = {
+	'SYNC_INTERVAL': 5,
+	'PURGE_INTERVAL': 60 * 60,
+}
+
 CORS_ORIGIN_ALLOW_ALL = True
 
 # Root configuration for frontend templates
@@ -108,11 +143,25 @@ ROOT_URLCONF = 'backend.urls'
 TEMPLATE_DIR = os.path.join(BASE_DIR, 'frontend_build')
 STATIC_DIR = os.path.join(BASE_DIR, 'frontend_build')
 STATICFILES_DIRS = [STATIC_DIR, ]
+STATIC_ROOT = os.path.join(BASE_DIR, 'static_build')
+# manage.py build_static collects the frontend build with hashed names and .gz/.br siblings for backend.assets to serve,
+# until it has been run files are served and referred to by their own names
+STATICFILES_STORAGE = 'backend.storage.PrecompressedManifestStaticFilesStorage'
 MEDIA_DIR = os.path.join(BASE_DIR, 'media')
 MEDIA_ROOT = MEDIA_DIR
 STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
 
+# How long browsers may reuse media files before revalidating them
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24
+
+# Hand media downloads to the front end server instead of streaming them from Django, BACKEND is None,
+# 'x-accel-redirect' (nginx, files are requested from URL_PREFIX + path) or 'x-sendfile' (Apache, lighttpd)
+MEDIA_SENDFILE = {
+	'BACKEND': None,
+	'URL_PREFIX': '/protected-media/',
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -129,19 +178,65 @@ TEMPLATES = [
     },
 ]
 
+# Serve the frontend's index.html from memory (gzip and, if the brotli package is installed, brotli compressed) instead
+# of rendering it as a template on every request
+SPA_SHELL_PRECOMPILED = False
+
 WSGI_APPLICATION = 'backend.wsgi.application'
+ASGI_APPLICATION = 'backend.asgi.application'
+
+# Route logins, registrations and the frontend to the async views in backend.async_views, for when the project is
+# served by an ASGI server (uvicorn backend.asgi:application). Under WSGI the sync views are cheaper
+ASYNC_VIEWS = False
 
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Send reads to a second, read only connection (see backend.routers), so they never wait behind registrations
+DATABASE_READ_REPLICA = False
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'backend.db',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            'pragmas': {
+                'synchronous': 'NORMAL',
+                'busy_timeout': 20000,
+            },
+        },
     }
 }
 
+if DATABASE_READ_REPLICA :
+	DATABASES['replica'] = dict(DATABASES['default'], OPTIONS=dict(DATABASES['default']['OPTIONS'], read_only=True), TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['backend.routers.ReadReplicaRouter']
+
+# Caches, 'shared' is file based so that it can be shared between worker processes without an external service
+CACHES = {
+	'default': {
+		'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+	},
+	'shared': {
+		'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+		'LOCATION': os.path.join(BASE_DIR, 'cache'),
+	},
+}
+
+# Cache of User rows used by logins and token authentication. SHARED_CACHE names an alias in CACHES to share loads
+# between processes, without their password hashes. Changes made in other processes, password changes included, reach
+# this process' local tier within LOCAL_TTL seconds
+USER_CACHE = {
+	'ENABLED': False,
+	'LOCAL_SIZE': 10000,
+	'LOCAL_TTL': 5,
+	'SHARED_CACHE': None,
+	'SHARED_TTL': 300,
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -156,18 +251,149 @@ AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
     },
+    {
+        'NAME': 'backend.validators.BreachedPasswordValidator',
+    },
     {
         'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
     },
 ]
 
+# Index of breached passwords, written by manage.py build_breached_index. Passwords are not checked against it until it exists
+BREACHED_PASSWORD_INDEX = os.path.join(BASE_DIR, 'breached_passwords.idx')
+
+AUTHENTICATION_BACKENDS = [
+	'backend.backends.PooledModelBackend',
+]
+
 PASSWORD_HASHERS = [
-	'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+	'backend.hashers.CalibratedBCryptSHA256PasswordHasher',
 	'django.contrib.auth.hashers.BCryptPasswordHasher',
-	'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+	'backend.hashers.CalibratedPBKDF2PasswordHasher',
 	'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
 ]
 
+# Hash costs for this host, picked by manage.py calibrate_hashers (or at startup with ON_STARTUP) so that checking a
+# password takes about TARGET_MS, and written to FILE. Stored hashes at another cost are redone as users log in, in a
+# background thread when ASYNC_REHASH is set
+PASSWORD_HASH_CALIBRATION = {
+	'FILE': os.path.join(BASE_DIR, 'hasher_calibration.json'),
+	'TARGET_MS': 250,
+	'MIN_BCRYPT_ROUNDS': 10,
+	'MIN_PBKDF2_ITERATIONS': 100000,
+	'ON_STARTUP': False,
+	'ASYNC_REHASH': True,
+}
+
+# Password hashing worker processes. Bulk registration always spreads its hashing over the pool, when ENABLED
+# logins and registrations also hash there, failing with a 503 once QUEUE_DEPTH requests are already waiting
+PASSWORD_HASH_POOL = {
+	'ENABLED': False,
+	'WORKERS': os.cpu_count() or 1,
+	'QUEUE_DEPTH': 64,
+	'TIMEOUT': 10,
+}
+
+# In-process Bloom filter of usernames that lets registrations skip the database for names that do not exist. Names
+# registered by other processes are picked up within REFRESH_INTERVAL seconds, until then logins load them all the same
+USERNAME_FILTER = {
+	'ENABLED': True,
+	'CAPACITY': 100000,
+	'ERROR_RATE': 0.01,
+	'REFRESH_INTERVAL': 5,
+}
+
+# Secret keys that are always accepted for registration, on top of the RegistrationKey rows managed in the admin
+REGISTRATION_SECRET_KEYS = ["123", "test_key"]
+
+# In-process index of RegistrationKey rows, so that checking a key does not cost a query per registration
+REGISTRATION_KEY_CACHE = {
+	'MAX_SIZE': 10000,
+	'TTL': 60,
+	'NEGATIVE_TTL': 5,
+}
+
+# Bulk (classroom roster) registration
+BULK_REGISTRATION = {
+	'MAX_ROWS': 1000,
+	'CHUNK_SIZE': 100,
+}
+
+# Logging. Records are put on a bounded queue and written to LOG_DIR as JSON lines by a background thread, so that a slow
+# disk never holds up a request, when the queue is full they are dropped and counted in log_records_dropped_total.
+# The sample filter keeps a fraction of each high volume event, records at WARNING and above are always kept. Processes
+# forked once logging is set up, such as serve's workers, each write and rotate a file of their own, named with their pid
+LOG_DIR = os.path.join(BASE_DIR, 'logs')
+
+LOGGING = {
+	'version': 1,
+	'disable_existing_loggers': False,
+	'filters': {
+		'request_id': {'()': 'backend.log.RequestIdFilter'},
+		'sample': {'()': 'backend.log.SamplingFilter', 'rates': {'request': 0.1, 'auth': 1.0}},
+	},
+	'handlers': {
+		'queue': {
+			'class': 'backend.log.QueuedJSONFileHandler',
+			'filename': os.path.join(LOG_DIR, 'backend.log'),
+			'max_bytes': 50 * 1024 * 1024,
+			'backup_count': 5,
+			'queue_size': 10000,
+			'filters': ['request_id', 'sample'],
+		},
+	},
+	'loggers': {
+		'backend': {'handlers': ['queue'], 'level': 'INFO', 'propagate': False},
+		'django.request': {'handlers': ['queue'], 'level': 'ERROR'},
+	},
+}
+
+# Requests sent together to api/batch/, run one after the other under a single authentication
+BATCH_REQUESTS = {
+	'MAX_REQUESTS': 20,
+}
+
+# Rendered responses of views using backend.response_cache.CachedResponseMixin, at most MAX_SIZE are kept by each process
+RESPONSE_CACHE = {
+	'ENABLED': True,
+	'MAX_SIZE': 1000,
+}
+
+# Streamed user exports, rows are read from the database and written to the response CHUNK_SIZE at a time
+USER_EXPORT = {
+	'CHUNK_SIZE': 2000,
+	'GZIP_LEVEL': 6,
+}
+
+# Login and registration limits, checked before any password is hashed. RATES are "requests/period" (period s, m, h
+# or d) and None turns a limit off. Without SHARED_CACHE the limits are per process and the global budget is split into
+# GLOBAL_STRIPES buckets so that threads do not queue on one lock. SHARED_CACHE names an alias in CACHES to share the
+# limits between processes, it should be one with an atomic incr (memcached or redis)
+THROTTLING = {
+	'ENABLED': True,
+	'RATES': {
+		'username': '10/m',
+		'ip': '300/m',
+		'global': '%d/s' % (10 * (os.cpu_count() or 1)),
+	},
+	'SHARDS': 64,
+	'GLOBAL_STRIPES': 16,
+	'MAX_KEYS': 100000,
+	'SHARED_CACHE': None,
+}
+
+# Request metrics served at /api/metrics, to requests sending "Authorization: Bearer <TOKEN>" when TOKEN is set and to
+# private and loopback addresses when ALLOW_INTERNAL is set, which is ignored behind proxies (NUM_PROXIES above 0). A
+# PROFILE_SAMPLE_RATE fraction of requests are run under cProfile, with the stats written to PROFILE_DIR, one file per
+# request, named after the route
+METRICS = {
+	'ENABLED': True,
+	'ALLOW_INTERNAL': False,
+	'TOKEN': os.environ.get('METRICS_TOKEN'),
+	'PROFILE_SAMPLE_RATE': 0.0,
+	'PROFILE_DIR': os.path.join(BASE_DIR, 'profiles'),
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
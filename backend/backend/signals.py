@@ -0,0 +1,47 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from backend import registration_keys
+from backend.authentication import forget_user_tokens
+from backend.metrics import install_query_counter
+from backend.models import User, RegistrationKey
+from backend.usernames import username_filter
+from backend.user_cache import user_cache
+
+@receiver(post_save, sender=User)
+def add_registered_username(sender, instance, created, **kwargs) :
+	user_cache.invalidate(instance.username, instance.pk)
+
+	previous = getattr(instance, '_loaded_username', None)
+	if previous is not None and previous != instance.username :
+		# tokens name their user by id and keep working, apart from those issued with LEGACY_USER_ID_CLAIM
+		user_cache.invalidate(previous)
+		username_filter.add(instance.username)
+
+	instance._loaded_username = instance.username
+
+	if created :
+		username_filter.add(instance.username)
+	elif not instance.is_active :
+		forget_user_tokens(instance)
+
+@receiver(post_delete, sender=User)
+def forget_deleted_user(sender, instance, **kwargs) :
+	user_cache.invalidate(instance.username, instance.pk)
+	forget_user_tokens(instance)
+
+@receiver(post_save, sender=RegistrationKey)
+@receiver(post_delete, sender=RegistrationKey)
+def invalidate_registration_keys(sender, **kwargs) :
+	registration_keys.invalidate()
+
+@receiver(connection_created)
+def count_connection_queries(sender, connection, **kwargs) :
+	install_query_counter(connection)
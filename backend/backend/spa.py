@@ -0,0 +1,69 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import os
+import hashlib
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+
+from backend.compression import compress, available_encodings, choose_encoding, etag_matches
+
+class SPAShell :
+	"""
+	The built frontend's index.html, read once and kept in memory along with compressed variants, each with its own
+	strong ETag. In DEBUG the file is checked for changes on every request so that rebuilds show up straight away.
+	"""
+
+	def __init__(self, path) :
+		self.path = path
+		self._variants = None
+		self._mtime = None
+		self._lock = threading.Lock()
+
+	def _load(self) :
+		mtime = os.stat(self.path).st_mtime_ns
+
+		with open(self.path, 'rb') as f :
+			body = f.read()
+
+		digest = hashlib.sha256(body).hexdigest()[:32]
+		variants = {'identity' : (body, '"%s"' % digest)}
+
+		for encoding in available_encodings() :
+			variants[encoding] = (compress(body, encoding), '"%s-%s"' % (digest, encoding))
+
+		self._variants = variants
+		self._mtime = mtime
+
+	def variants(self) :
+		if self._variants is None or (settings.DEBUG and os.stat(self.path).st_mtime_ns != self._mtime) :
+			with self._lock :
+				if self._variants is None or (settings.DEBUG and os.stat(self.path).st_mtime_ns != self._mtime) :
+					self._load()
+
+		return self._variants
+
+	def response(self, request) :
+		variants = self.variants()
+		encoding = choose_encoding(request, variants)
+		body, etag = variants[encoding]
+
+		if etag_matches(request, etag) :
+			response = HttpResponseNotModified()
+		else :
+			response = HttpResponse(body, content_type='text/html; charset=utf-8')
+			if encoding != 'identity' :
+				response['Content-Encoding'] = encoding
+
+		response['ETag'] = etag
+		response['Vary'] = 'Accept-Encoding'
+		# the shell points at the current build's assets, so browsers must check back with us before reusing it
+		response['Cache-Control'] = 'no-cache'
+		return response
+
+spa_shell = SPAShell(os.path.join(settings.TEMPLATE_DIR, 'index.html'))
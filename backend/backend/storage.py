@@ -0,0 +1,59 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+from backend.compression import compress, available_encodings
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage) :
+	"""
+	ManifestStaticFilesStorage that also writes .gz (and .br, when brotli is installed) siblings of every text asset
+	once collectstatic has hashed them, so that nothing has to be compressed while serving. Until build_static has
+	written a manifest, files are referred to by their own names rather than failing to be found in it.
+	"""
+	compress_extensions = ('.js', '.css', '.html', '.json', '.map', '.svg', '.txt', '.xml', '.ico')
+	compress_min_size = 256
+
+	def stored_name(self, name) :
+		if not self.hashed_files :
+			return name
+
+		return super().stored_name(name)
+
+	def post_process(self, paths, dry_run=False, **options) :
+		yield from super().post_process(paths, dry_run=dry_run, **options)
+
+		if dry_run :
+			return
+
+		# both names are compressed, as the frontend's index.html refers to the original ones
+		for name in sorted(set(paths) | set(self.hashed_files.values())) :
+			for compressed_name in self.compress_file(name) :
+				yield name, compressed_name, True
+
+	def compress_file(self, name) :
+		path = self.path(name)
+
+		if not name.endswith(self.compress_extensions) or not os.path.isfile(path) or os.path.getsize(path) < self.compress_min_size :
+			return []
+
+		with open(path, 'rb') as f :
+			body = f.read()
+
+		written = []
+		for encoding in available_encodings() :
+			compressed = compress(body, encoding)
+
+			# not worth a sibling unless it saves something
+			if len(compressed) < len(body) * 0.95 :
+				compressed_name = name + ('.br' if encoding == 'br' else '.gz')
+				with open(self.path(compressed_name), 'wb') as f :
+					f.write(compressed)
+				written.append(compressed_name)
+
+		return written
@@ -4,18 +4,83 @@
 #  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
 #
 
+import gc
+import io
+import os
+import gzip
 import json
+import sys
+import time
+import uuid
+import logging
+import tempfile
+import threading
+import concurrent.futures
 
-from django.test import TestCase, Client
+from datetime import timedelta
+
+from unittest import mock
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth import user_login_failed
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command, CommandError
+from django.db import connection, models
+from django.db.migrations.state import ProjectState
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, Client, AsyncClient, AsyncRequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from backend.models import User
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from backend import admin
+from backend import async_views
+from backend import hashing
+from backend import hashers
+from backend import log
+from backend import metrics
+from backend import middleware
+from backend.authentication import CachedJWTAuthentication
+from backend import registration_keys
+from backend import response_cache
+from backend import search
+from backend import throttling
+from backend.benchmark import Benchmark, InProcessTransport, percentile, find_regressions
+from backend.bloom import BloomFilter
+from backend.management.commands import serve
+from backend.compression import brotli
+from backend.models import User, RegistrationKey, RevokedToken
+from backend.revocation import revocation_store
+from backend.db.base import DatabaseWrapper
+from backend.routers import ReadReplicaRouter
+from backend.storage import PrecompressedManifestStaticFilesStorage
+from backend.usernames import username_filter
+from backend.views import TestView, INCORRECT_DETAILS_RESPONSE, SERVER_BUSY_RESPONSE
+from backend.validators import BreachedPasswordValidator, build_index, get_index
+from backend.user_cache import user_cache
+from backend.utils import get_tokens_for_user
 from backend.urls import NAMESPACE
 
 NAMESPACE = '/' + NAMESPACE
 
 TEST_SECRET_KEY = "test_key"
 
+# the throttles' buckets outlive a test, so suites that send many auth requests for the same names run without them
+THROTTLING_DISABLED = {'ENABLED': False, 'RATES': {}, 'SHARDS': 1, 'GLOBAL_STRIPES': 1, 'MAX_KEYS': 1, 'SHARED_CACHE': None}
+
+@override_settings(THROTTLING=THROTTLING_DISABLED)
 class UserRegistrationTestCase(TestCase):
 	def setUp(self) :
 		self.client = Client()
@@ -81,6 +146,94 @@ class UserRegistrationTestCase(TestCase):
 		response = self.client.delete(NAMESPACE + '/auth/register/')
 		self.assertEqual(response.status_code, 405)
 
+class UserBulkRegistrationTestCase(TestCase):
+	def setUp(self) :
+		self.client = Client()
+		User.objects.create(username='foo', password='foo')
+
+	def read_results(self, response) :
+		return [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+
+	def test_bulk_registration_json(self):
+		users = [
+			{"username" : "bar", "password" : "dghjasdja^&*678"},
+			{"username" : "foo", "password" : "dghjasdja^&*678"},
+			{"username" : "baz", "password" : "password"},
+			{"username" : "bar", "password" : "dghjasdja^&*678"},
+		]
+		response = self.client.post(NAMESPACE + '/auth/register/bulk/', json.dumps({"users" : users, "secret_key": TEST_SECRET_KEY}), content_type="application/json")
+		self.assertEqual(response.status_code, 200)
+
+		results = {result['row'] : result for result in self.read_results(response)}
+		self.assertEqual(results[0]['status'], 201)
+		self.assertGreater(len(results[0]['tokens']['access']), 20)
+		self.assertEqual(results[1]['message'], "User with username already exists")
+		self.assertEqual(results[2]['message'], "This password is too common")
+		self.assertEqual(results[3]['message'], "Username appears more than once in the roster")
+		self.assertTrue(User.objects.get(username='bar').check_password("dghjasdja^&*678"))
+
+	def test_bulk_registration_csv(self):
+		roster = "username,password\nbar,dghjasdja^&*678\nbaz,dghjasdja^&*679\n"
+		response = self.client.post(NAMESPACE + '/auth/register/bulk/?secret_key=' + TEST_SECRET_KEY, roster, content_type="text/csv")
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual([result['status'] for result in self.read_results(response)], [201, 201])
+		self.assertEqual(User.objects.filter(username__in=['bar', 'baz']).count(), 2)
+
+	def test_bulk_registration_unsuccessful_invalid_secret_key(self):
+		response = self.client.post(NAMESPACE + '/auth/register/bulk/', json.dumps({"users" : [{"username" : "bar", "password" : "dghjasdja^&*678"}], "secret_key": TEST_SECRET_KEY+"foo"}), content_type="application/json")
+		self.assertEqual(response.status_code, 401)
+		self.assertFalse(User.objects.filter(username='bar').exists())
+
+class RegistrationKeyTestCase(TestCase):
+	def setUp(self) :
+		self.client = Client()
+		self.TEST_PASSWORD = "dghjasdja^&*678"
+		RegistrationKey.objects.create(key="class_key", seat_limit=2)
+		RegistrationKey.objects.create(key="expired_key", expires_at=timezone.now() - timedelta(days=1))
+
+	def register(self, username, secret_key) :
+		return self.client.post(NAMESPACE + '/auth/register/', json.dumps({"username" : username, "password" : self.TEST_PASSWORD, "secret_key": secret_key}), content_type="application/json")
+
+	def test_seat_limit(self):
+		self.assertEqual(self.register("bar", "class_key").status_code, 201)
+		self.assertEqual(self.register("baz", "class_key").status_code, 201)
+
+		response = self.register("qux", "class_key")
+		self.assertEqual(response.status_code, 403)
+		self.assertFalse(User.objects.filter(username="qux").exists())
+		self.assertEqual(RegistrationKey.objects.get(key="class_key").seats_used, 2)
+
+	def test_failed_registration_gives_seat_back(self):
+		User.objects.create(username='foo', password='foo')
+		registration_keys.invalidate()
+		with mock.patch('backend.usernames.username_filter.might_exist', return_value=False) :
+			self.assertEqual(self.register("foo", "class_key").status_code, 400)
+
+		self.assertEqual(RegistrationKey.objects.get(key="class_key").seats_used, 0)
+
+	def test_expired_key(self):
+		self.assertEqual(self.register("bar", "expired_key").status_code, 401)
+
+	def test_key_checks_are_cached_until_changed(self):
+		self.assertTrue(registration_keys.is_valid("class_key"))
+		with self.assertNumQueries(0) :
+			self.assertTrue(registration_keys.is_valid("class_key"))
+
+		RegistrationKey.objects.filter(key="class_key").update(is_active=False)
+		self.assertTrue(registration_keys.is_valid("class_key"))
+
+		RegistrationKey.objects.get(key="class_key").save()
+		self.assertFalse(registration_keys.is_valid("class_key"))
+
+	def test_bulk_registration_respects_seat_limit(self):
+		users = [{"username" : "user%d" % i, "password" : self.TEST_PASSWORD} for i in range(3)]
+		response = self.client.post(NAMESPACE + '/auth/register/bulk/', json.dumps({"users" : users, "secret_key": "class_key"}), content_type="application/json")
+
+		results = [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+		self.assertEqual([result['status'] for result in results], [201, 201, 400])
+		self.assertEqual(User.objects.filter(username__startswith="user").count(), 2)
+
+@override_settings(THROTTLING=THROTTLING_DISABLED)
 class UserLoginTestCase(TestCase) :
 	def setUp(self):
 		self.client = Client()
@@ -123,6 +276,245 @@ class UserLoginTestCase(TestCase) :
 		response = self.client.delete(NAMESPACE + '/auth/login/')
 		self.assertEqual(response.status_code, 405)
 
+@override_settings(THROTTLING=THROTTLING_DISABLED)
+class UsernameFilterTestCase(TestCase) :
+	def setUp(self):
+		self.client = Client()
+		self.TEST_USERNAME = "foo"
+		self.TEST_PASSWORD = "gdsakdsja678687&^*"
+		self.client.post(NAMESPACE + '/auth/register/', json.dumps({"username" : self.TEST_USERNAME, "password" : self.TEST_PASSWORD, "secret_key": TEST_SECRET_KEY}), content_type="application/json")
+		username_filter.warm()
+
+	def user_table_queries(self, context) :
+		return [query for query in context.captured_queries if 'backend_user' in query['sql']]
+
+	def test_bloom_filter(self) :
+		bloom = BloomFilter(1000)
+		for i in range(1000) :
+			bloom.add("user%d" % i)
+
+		self.assertTrue(all("user%d" % i in bloom for i in range(1000)))
+		self.assertLess(sum("other%d" % i in bloom for i in range(1000)), 50)
+
+	def test_login_touches_users_table_once(self) :
+		with CaptureQueriesContext(connection) as context :
+			response = self.client.put(NAMESPACE + '/auth/login/', json.dumps({"username" : self.TEST_USERNAME, "password" : self.TEST_PASSWORD}), content_type="application/json")
+
+		self.assertEqual(response.status_code, 202)
+		self.assertEqual(len(self.user_table_queries(context)), 1)
+
+	def test_login_unknown_username_touches_users_table_once(self) :
+		def login() :
+			with CaptureQueriesContext(connection) as context :
+				response = self.client.put(NAMESPACE + '/auth/login/', json.dumps({"username" : "nobody", "password" : self.TEST_PASSWORD}), content_type="application/json")
+
+			self.assertEqual(response.status_code, 400)
+			return self.user_table_queries(context)
+
+		# missing from the filter between catch ups, so loaded in case another process registered it
+		self.assertEqual(len(login()), 1)
+
+		# due a catch up, which settles it without loading the user
+		username_filter._checked_at = 0.0
+		queries = login()
+		self.assertEqual(len(queries), 1)
+		self.assertIn('date_joined', queries[0]['sql'])
+
+	def test_login_finds_users_registered_elsewhere(self) :
+		# bulk_create sends no post_save, as with a user registered by another process before the next catch up
+		User.objects.bulk_create([User(username="bar", password=hashing.hash_password(self.TEST_PASSWORD))])
+		self.assertFalse(username_filter.might_exist("bar"))
+
+		response = self.client.put(NAMESPACE + '/auth/login/', json.dumps({"username" : "bar", "password" : self.TEST_PASSWORD}), content_type="application/json")
+		self.assertEqual(response.status_code, 202)
+		self.assertTrue(username_filter.might_exist("bar"))
+
+	def test_registration_touches_users_table_once(self) :
+		with CaptureQueriesContext(connection) as context :
+			response = self.client.post(NAMESPACE + '/auth/register/', json.dumps({"username" : "bar", "password" : self.TEST_PASSWORD, "secret_key": TEST_SECRET_KEY}), content_type="application/json")
+
+		self.assertEqual(response.status_code, 201)
+		self.assertEqual(len(self.user_table_queries(context)), 1)
+
+	def test_stale_filter_still_rejects_duplicate_registration(self) :
+		username_filter.reset()
+		username_filter.warm()
+		User.objects.bulk_create([User(username="bar", password="bar")])
+
+		response = self.client.post(NAMESPACE + '/auth/register/', json.dumps({"username" : "bar", "password" : self.TEST_PASSWORD, "secret_key": TEST_SECRET_KEY}), content_type="application/json")
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(response.data['message'], "User with username already exists")
+
+HASH_POOL_ENABLED = {'ENABLED': True, 'WORKERS': 2, 'QUEUE_DEPTH': 4, 'TIMEOUT': 10}
+
+@override_settings(PASSWORD_HASH_POOL=HASH_POOL_ENABLED)
+class HashPoolTestCase(TestCase) :
+	def setUp(self):
+		self.client = Client()
+		self.TEST_USERNAME = "foo"
+		self.TEST_PASSWORD = "gdsakdsja678687&^*"
+
+	def test_register_and_login_through_pool(self) :
+		response = self.client.post(NAMESPACE + '/auth/register/', json.dumps({"username" : self.TEST_USERNAME, "password" : self.TEST_PASSWORD, "secret_key": TEST_SECRET_KEY}), content_type="application/json")
+		self.assertEqual(response.status_code, 201)
+
+		response = self.client.put(NAMESPACE + '/auth/login/', json.dumps({"username" : self.TEST_USERNAME, "password" : self.TEST_PASSWORD}), content_type="application/json")
+		self.assertEqual(response.status_code, 202)
+
+		response = self.client.put(NAMESPACE + '/auth/login/', json.dumps({"username" : self.TEST_USERNAME, "password" : self.TEST_PASSWORD+"1"}), content_type="application/json")
+		self.assertEqual(response.status_code, 401)
+
+	def test_saturated_pool_fails_fast(self) :
+		with mock.patch.object(hashing, '_slots', threading.BoundedSemaphore(1)) as slots :
+			slots.acquire()
+			response = self.client.post(NAMESPACE + '/auth/register/', json.dumps({"username" : self.TEST_USERNAME, "password" : self.TEST_PASSWORD, "secret_key": TEST_SECRET_KEY}), content_type="application/json")
+
+		self.assertEqual(response.status_code, 503)
+		self.assertEqual(response['Retry-After'], "1")
+		self.assertFalse(User.objects.filter(username=self.TEST_USERNAME).exists())
+
+	def test_bulk_hashing_leaves_room_for_logins(self) :
+		slots = threading.BoundedSemaphore(HASH_POOL_ENABLED['WORKERS'] + HASH_POOL_ENABLED['QUEUE_DEPTH'])
+		free = []
+
+		def chunk(passwords) :
+			free.append(slots._value)
+			return ["hashed " + password for password in passwords]
+
+		with concurrent.futures.ThreadPoolExecutor(HASH_POOL_ENABLED['WORKERS']) as pool :
+			with mock.patch.object(hashing, '_slots', slots), mock.patch.object(hashing, 'get_hash_pool', return_value=pool), mock.patch.object(hashing, '_make_password_chunk', chunk) :
+				hashed = hashing.make_passwords(["password %d" % i for i in range(40)])
+
+		self.assertEqual(hashed, ["hashed password %d" % i for i in range(40)])
+		# the chunks went through the login queue's places, but only ever as many as there are workers
+		self.assertGreaterEqual(min(free), HASH_POOL_ENABLED['QUEUE_DEPTH'])
+		self.assertEqual(slots._value, HASH_POOL_ENABLED['WORKERS'] + HASH_POOL_ENABLED['QUEUE_DEPTH'])
+
+class CachedJWTAuthenticationTestCase(TestCase) :
+	def setUp(self):
+		self.user = User.objects.create(username='foo', password='foo')
+		self.access = get_tokens_for_user(self.user)['access']
+		self.factory = APIRequestFactory()
+		self.authentication = CachedJWTAuthentication()
+
+	def authenticate(self, token) :
+		return self.authentication.authenticate(self.factory.get('/', HTTP_AUTHORIZATION='Bearer ' + token))
+
+	def test_repeat_requests_skip_verification(self) :
+		user, token = self.authenticate(self.access)
+		self.assertEqual(user, self.user)
+
+		with mock.patch('rest_framework_simplejwt.backends.TokenBackend.decode') as decode :
+			user, cached_token = self.authenticate(self.access)
+			decode.assert_not_called()
+
+		self.assertIs(cached_token, token)
+
+	def test_invalid_token_is_rejected(self) :
+		with self.assertRaises(AuthenticationFailed) :
+			self.authenticate(self.access[:-2])
+
+	def legacy(self, token) :
+		del token['user_id']
+		token['user_username'] = self.user.username
+		return token
+
+	def test_tokens_name_users_by_id(self) :
+		self.assertEqual(AccessToken(self.access)['user_id'], self.user.id)
+
+		self.user.username = 'renamed'
+		self.user.save()
+
+		user, _ = self.authenticate(self.access)
+		self.assertEqual(user.username, 'renamed')
+
+	def test_legacy_username_claim(self) :
+		user, _ = self.authenticate(str(self.legacy(AccessToken.for_user(self.user))))
+		self.assertEqual(user, self.user)
+
+		response = Client().post(NAMESPACE + '/auth/refresh_tokens/', json.dumps({"refresh" : str(self.legacy(RefreshToken.for_user(self.user)))}), content_type="application/json")
+		self.assertEqual(response.status_code, 200)
+
+		for token in (AccessToken(response.data['access']), RefreshToken(response.data['refresh'])) :
+			self.assertEqual(token['user_id'], self.user.id)
+			self.assertNotIn('user_username', token)
+
+	def test_deactivating_user_drops_cached_tokens(self) :
+		self.authenticate(self.access)
+
+		self.user.is_active = False
+		self.user.save()
+
+		with mock.patch('rest_framework_simplejwt.backends.TokenBackend.decode', side_effect=TokenBackend.decode, autospec=True) as decode :
+			with self.assertRaises(AuthenticationFailed) :
+				self.authenticate(self.access)
+			decode.assert_called_once()
+
+@override_settings(USER_CACHE={'ENABLED': True, 'LOCAL_SIZE': 100, 'LOCAL_TTL': 30, 'SHARED_CACHE': 'default', 'SHARED_TTL': 30}, THROTTLING=THROTTLING_DISABLED)
+class UserCacheTestCase(TestCase) :
+	def setUp(self):
+		self.client = Client()
+		self.TEST_USERNAME = "foo"
+		self.TEST_PASSWORD = "gdsakdsja678687&^*"
+		self.client.post(NAMESPACE + '/auth/register/', json.dumps({"username" : self.TEST_USERNAME, "password" : self.TEST_PASSWORD, "secret_key": TEST_SECRET_KEY}), content_type="application/json")
+
+	def login(self, password) :
+		return self.client.put(NAMESPACE + '/auth/login/', json.dumps({"username" : self.TEST_USERNAME, "password" : password}), content_type="application/json")
+
+	def test_repeat_logins_are_served_from_cache(self) :
+		self.assertEqual(self.login(self.TEST_PASSWORD).status_code, 202)
+
+		with self.assertNumQueries(0) :
+			self.assertEqual(self.login(self.TEST_PASSWORD).status_code, 202)
+
+	def test_saving_user_invalidates_cache(self) :
+		self.login(self.TEST_PASSWORD)
+
+		user = User.objects.get(username=self.TEST_USERNAME)
+		user.set_password(self.TEST_PASSWORD + "1")
+		user.save()
+
+		self.assertEqual(self.login(self.TEST_PASSWORD).status_code, 401)
+		self.assertEqual(self.login(self.TEST_PASSWORD + "1").status_code, 202)
+
+	def test_renaming_user_invalidates_old_name(self) :
+		self.login(self.TEST_PASSWORD)
+
+		user = User.objects.get(username=self.TEST_USERNAME)
+		user.username = "renamed"
+		user.save()
+
+		self.assertIsNone(user_cache.get_user(self.TEST_USERNAME))
+		self.assertEqual(user_cache.get_user("renamed").pk, user.pk)
+
+	def test_shared_tier_leaves_out_passwords(self) :
+		user = User.objects.get(username=self.TEST_USERNAME)
+		user_cache.invalidate(self.TEST_USERNAME, user.pk)
+		user_cache.get_user(self.TEST_USERNAME)
+
+		shared = caches['default'].get(user_cache._shared_key(self.TEST_USERNAME))
+		self.assertEqual(shared.get_deferred_fields(), {'password'})
+
+		# as another process would find it, with an empty local tier
+		user_cache._local.clear()
+		with self.assertNumQueries(1) :
+			self.assertEqual(self.login(self.TEST_PASSWORD).status_code, 202)
+
+	def test_cached_users_are_copies(self) :
+		user_cache.get_user(self.TEST_USERNAME).first_name = "changed"
+		self.assertEqual(user_cache.get_user(self.TEST_USERNAME).first_name, "")
+
+	def test_stats(self) :
+		user_cache.invalidate(self.TEST_USERNAME)
+		before = user_cache.stats()
+
+		user_cache.get_user(self.TEST_USERNAME)
+		user_cache.get_user(self.TEST_USERNAME)
+
+		after = user_cache.stats()
+		self.assertEqual(after['local']['hits'] - before['local']['hits'], 1)
+		self.assertEqual(after['shared']['misses'] - before['shared']['misses'], 1)
+
 class FrontendTemplateTestCase(TestCase) :
 	def setUp(self):
 		self.client = Client()
@@ -147,3 +539,1063 @@ class FrontendTemplateTestCase(TestCase) :
 		self.assertEqual(response.status_code, 200)
 		self.assertTemplateUsed(response, 'index.html')
 		self.assertContains(response, 'YES Business Simulation')
+
+@override_settings(SPA_SHELL_PRECOMPILED=True)
+class FrontendShellTestCase(TestCase) :
+	def setUp(self):
+		self.client = Client()
+
+	def test_shell_served_without_templates(self):
+		with self.assertNumQueries(0) :
+			response = self.client.get(reverse('frontend-home'))
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.templates, [])
+		self.assertContains(response, 'YES Business Simulation')
+		self.assertEqual(response['Cache-Control'], 'no-cache')
+
+	def test_compressed_variants(self):
+		response = self.client.get(reverse('frontend-login'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+		self.assertEqual(response['Content-Encoding'], 'gzip')
+		self.assertIn(b'YES Business Simulation', gzip.decompress(response.content))
+
+		response = self.client.get(reverse('frontend-login'), HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+		self.assertFalse(response.has_header('Content-Encoding'))
+
+		if brotli is not None :
+			response = self.client.get(reverse('frontend-login'), HTTP_ACCEPT_ENCODING='gzip, br')
+			self.assertEqual(response['Content-Encoding'], 'br')
+			self.assertIn(b'YES Business Simulation', brotli.decompress(response.content))
+
+	def test_conditional_get(self):
+		etag = self.client.get(reverse('frontend-other'))['ETag']
+
+		response = self.client.get(reverse('frontend-other'), HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+
+		response = self.client.get(reverse('frontend-other'), HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT_ENCODING='gzip')
+		self.assertEqual(response.status_code, 200)
+
+class MediaTestCase(TestCase) :
+	def setUp(self):
+		self.client = Client()
+		self.media_root = tempfile.TemporaryDirectory()
+		self.content = bytes(range(256)) * 16
+
+		with open(os.path.join(self.media_root.name, 'asset.bin'), 'wb') as f :
+			f.write(self.content)
+
+		self.settings_override = override_settings(MEDIA_ROOT=self.media_root.name)
+		self.settings_override.enable()
+
+	def tearDown(self):
+		self.settings_override.disable()
+		self.media_root.cleanup()
+
+	def get(self, path='asset.bin', **headers) :
+		return self.client.get(NAMESPACE + '/media/' + path, **headers)
+
+	def test_whole_file(self):
+		response = self.get()
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(b''.join(response.streaming_content), self.content)
+		self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+	def test_missing_and_escaping_paths(self):
+		self.assertEqual(self.get('missing.bin').status_code, 404)
+		self.assertEqual(self.get('../asset.bin').status_code, 404)
+
+	def test_ranges(self):
+		response = self.get(HTTP_RANGE='bytes=10-19')
+		self.assertEqual(response.status_code, 206)
+		self.assertEqual(response['Content-Range'], 'bytes 10-19/4096')
+		self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+		response = self.get(HTTP_RANGE='bytes=-5')
+		self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+
+		response = self.get(HTTP_RANGE='bytes=5000-')
+		self.assertEqual(response.status_code, 416)
+		self.assertEqual(response['Content-Range'], 'bytes */4096')
+
+	def test_empty_file(self):
+		open(os.path.join(self.media_root.name, 'empty.bin'), 'wb').close()
+
+		response = self.get('empty.bin', HTTP_RANGE='bytes=-5')
+		self.assertEqual(response.status_code, 416)
+		self.assertEqual(response['Content-Range'], 'bytes */0')
+
+		self.assertEqual(b''.join(self.get('empty.bin').streaming_content), b'')
+
+	def test_if_range(self):
+		etag = self.get()['ETag']
+		self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag).status_code, 206)
+		self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+	def test_conditional_get(self):
+		response = self.get()
+		self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+		self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+	@override_settings(MEDIA_SENDFILE={'BACKEND': 'x-accel-redirect', 'URL_PREFIX': '/protected-media/'})
+	def test_offload(self):
+		response = self.get()
+		self.assertEqual(response['X-Accel-Redirect'], '/protected-media/asset.bin')
+		self.assertEqual(response.content, b'')
+
+class StaticAssetsTestCase(TestCase) :
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		cls.build_dir = tempfile.TemporaryDirectory()
+		cls.static_root = tempfile.TemporaryDirectory()
+		cls.script = b"console.log('YES Business Simulation');\n" * 50
+
+		os.makedirs(os.path.join(cls.build_dir.name, 'static', 'js'))
+		with open(os.path.join(cls.build_dir.name, 'static', 'js', 'main.1a2b3c4d.js'), 'wb') as f :
+			f.write(cls.script)
+		with open(os.path.join(cls.build_dir.name, 'robots.txt'), 'wb') as f :
+			f.write(b"User-agent: *\n" * 50)
+
+		cls.settings_override = override_settings(STATIC_DIR=cls.build_dir.name, STATICFILES_DIRS=[cls.build_dir.name], STATIC_ROOT=cls.static_root.name)
+		cls.settings_override.enable()
+		call_command('build_static', verbosity=0, stdout=io.StringIO())
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.settings_override.disable()
+		cls.build_dir.cleanup()
+		cls.static_root.cleanup()
+		super().tearDownClass()
+
+	def setUp(self):
+		self.client = Client()
+
+	def test_build_writes_manifest_and_compressed_variants(self):
+		with open(os.path.join(self.static_root.name, 'staticfiles.json')) as f :
+			paths = json.load(f)['paths']
+
+		hashed = paths['robots.txt']
+		self.assertNotEqual(hashed, 'robots.txt')
+		self.assertTrue(os.path.isfile(os.path.join(self.static_root.name, hashed + '.gz')))
+		self.assertTrue(os.path.isfile(os.path.join(self.static_root.name, 'static/js/main.1a2b3c4d.js.gz')))
+
+	def test_dry_run_leaves_the_manifest(self):
+		with open(os.path.join(self.static_root.name, 'staticfiles.json')) as f :
+			manifest = f.read()
+
+		call_command('collectstatic', dry_run=True, interactive=False, verbosity=0)
+
+		with open(os.path.join(self.static_root.name, 'staticfiles.json')) as f :
+			self.assertEqual(f.read(), manifest)
+
+	def test_hashed_names_are_immutable(self):
+		with open(os.path.join(self.static_root.name, 'staticfiles.json')) as f :
+			hashed = json.load(f)['paths']['robots.txt']
+
+		response = self.client.get('/static/' + hashed, HTTP_ACCEPT_ENCODING='gzip')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Content-Encoding'], 'gzip')
+		self.assertIn('immutable', response['Cache-Control'])
+
+		response = self.client.get('/static/robots.txt')
+		self.assertEqual(response['Cache-Control'], 'no-cache')
+		self.assertFalse(response.has_header('Content-Encoding'))
+		self.assertFalse(response.has_header('Content-Disposition'))
+
+	def test_names_without_a_manifest(self):
+		with tempfile.TemporaryDirectory() as directory :
+			storage = PrecompressedManifestStaticFilesStorage(location=directory)
+			self.assertEqual(storage.url('admin/css/base.css'), '/static/admin/css/base.css')
+
+	def test_build_hashed_names_are_immutable(self):
+		response = self.client.get('/static/static/js/main.1a2b3c4d.js', HTTP_ACCEPT_ENCODING='gzip')
+		self.assertIn('immutable', response['Cache-Control'])
+		self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.script)
+
+		self.assertEqual(self.client.get('/static/static/js/main.1a2b3c4d.js', HTTP_IF_NONE_MATCH=response['ETag'], HTTP_ACCEPT_ENCODING='gzip').status_code, 304)
+		self.assertEqual(self.client.get('/static/missing.js').status_code, 404)
+
+class DatabaseProfileTestCase(TestCase) :
+	def pragma(self, name) :
+		with connection.cursor() as cursor :
+			cursor.execute('PRAGMA %s' % name)
+			return cursor.fetchone()[0]
+
+	def test_pragmas_applied(self):
+		self.assertEqual(self.pragma('busy_timeout'), 20000)
+		self.assertEqual(self.pragma('synchronous'), 1) # NORMAL
+		self.assertEqual(self.pragma('cache_size'), -20000)
+
+	def test_concurrent_write_transactions_wait_for_each_other(self):
+		errors = []
+
+		with tempfile.TemporaryDirectory() as directory :
+			settings_dict = dict(connection.settings_dict, NAME=os.path.join(directory, 'db.sqlite3'))
+
+			setup = DatabaseWrapper(settings_dict)
+			with setup.cursor() as cursor :
+				cursor.execute("CREATE TABLE registrations (id INTEGER PRIMARY KEY, username TEXT UNIQUE)")
+			setup.close()
+
+			def register(worker) :
+				# claiming a seat then saving the user reads before it writes, as registration does
+				db = DatabaseWrapper(settings_dict)
+				try :
+					for i in range(5) :
+						db.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+						with db.cursor() as cursor :
+							cursor.execute("SELECT COUNT(*) FROM registrations")
+							time.sleep(0.005)
+							cursor.execute("INSERT INTO registrations (username) VALUES (%s)", ['user%d.%d' % (worker, i)])
+						db.commit()
+						db.set_autocommit(True)
+				except Exception as e :
+					errors.append(e)
+				finally :
+					db.close()
+
+			workers = [threading.Thread(target=register, args=(worker,)) for worker in range(8)]
+			for worker in workers :
+				worker.start()
+			for worker in workers :
+				worker.join()
+
+		self.assertEqual(errors, [])
+
+	def test_router(self):
+		router = ReadReplicaRouter()
+		self.assertEqual(router.db_for_write(User), 'default')
+
+		with override_settings(DATABASE_READ_REPLICA=True) :
+			# test cases run inside a transaction, which keeps reads on the primary
+			self.assertEqual(router.db_for_read(User), 'default')
+
+			with mock.patch.object(connection, 'in_atomic_block', False) :
+				self.assertEqual(router.db_for_read(User), 'replica')
+
+		self.assertEqual(router.db_for_read(User), 'default')
+
+class BenchmarkTestCase(TestCase) :
+	def test_percentile(self):
+		values = list(range(1, 101))
+		self.assertEqual(percentile(values, 0.50), 50)
+		self.assertEqual(percentile(values, 0.99), 99)
+		self.assertIsNone(percentile([], 0.5))
+
+	def test_run(self):
+		result = Benchmark(InProcessTransport(), TEST_SECRET_KEY).run('frontend', 10, 2)
+		self.assertEqual(result['requests'], 10)
+		self.assertEqual(result['errors'], 0)
+		self.assertEqual(result['mean_queries'], 0)
+		self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+	def test_runs_without_latencies(self):
+		result = Benchmark(InProcessTransport(), TEST_SECRET_KEY).run('frontend', 0, 2)
+		self.assertIsNone(result['p95_ms'])
+
+		with mock.patch.object(InProcessTransport, 'request', side_effect=ConnectionRefusedError) :
+			result = Benchmark(InProcessTransport(), TEST_SECRET_KEY).run('frontend', 5, 2)
+
+		self.assertEqual(result['errors'], 5)
+		self.assertIsNone(result['p50_ms'])
+		self.assertEqual(find_regressions({"frontend" : result}, {"frontend" : {"throughput_rps" : 1.0, "p95_ms" : 1.0}}, 0.2), [])
+
+	def test_refresh_tokens_are_used_once(self):
+		used = set()
+		in_flight = set()
+		lock = threading.Lock()
+
+		def refresh(method, path, body=None, content_type=None) :
+			token = json.loads(body)['refresh']
+			with lock :
+				self.assertNotIn(token, used | in_flight)
+				in_flight.add(token)
+
+			time.sleep(0.001)
+
+			with lock :
+				in_flight.discard(token)
+				used.add(token)
+			return 200, json.dumps({"refresh" : uuid.uuid4().hex}).encode('utf-8'), None
+
+		benchmark = Benchmark(InProcessTransport(), TEST_SECRET_KEY, population=3)
+		benchmark.refresh_tokens = ['first', 'second', 'third']
+
+		with mock.patch.object(benchmark.transport, 'request', side_effect=refresh) :
+			result = benchmark.run('refresh', 60, 8)
+
+		self.assertEqual(result['errors'], 0)
+		self.assertEqual(len(used), 60)
+
+	def test_find_regressions(self):
+		baseline = {"login" : {"throughput_rps" : 100.0, "p95_ms" : 10.0, "mean_queries" : 1.0}}
+
+		self.assertEqual(find_regressions({"login" : {"throughput_rps" : 95.0, "p95_ms" : 11.0, "mean_queries" : 1.0}}, baseline, 0.2), [])
+		self.assertEqual(len(find_regressions({"login" : {"throughput_rps" : 50.0, "p95_ms" : 20.0, "mean_queries" : 2.0}}, baseline, 0.2)), 3)
+
+class MetricsTestCase(TestCase) :
+	def setUp(self) :
+		self.client = Client()
+		self.client.post(NAMESPACE + '/auth/register/', json.dumps({"username" : "metrics", "password" : "gu^&*678dghjasdja", "secret_key": TEST_SECRET_KEY}), content_type="application/json")
+
+	def test_requests_are_recorded(self):
+		self.client.put(NAMESPACE + '/auth/login/', json.dumps({"username" : "metrics", "password" : "gu^&*678dghjasdja"}), content_type="application/json")
+		with override_settings(METRICS=dict(settings.METRICS, ALLOW_INTERNAL=True)) :
+			body = self.client.get(NAMESPACE + '/metrics').content.decode('utf-8')
+
+		self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+		self.assertIn('http_request_duration_seconds_count{method="PUT",route="api/auth/login/",status="202"}', body)
+		self.assertIn('db_queries_total{route="api/auth/login/"}', body)
+		self.assertIn('password_hash_duration_seconds_count{operation="verify"}', body)
+		self.assertIn('auth_step_duration_seconds_count{step="authenticate"}', body)
+		self.assertIn('auth_step_duration_seconds_count{step="tokens"}', body)
+		self.assertIn('user_cache_hits_total{tier="local"}', body)
+
+	def test_threads_are_aggregated(self):
+		labels = (('test', 'threads'), )
+		before = metrics._collect()[0].get(('metrics_test_total', labels), 0)
+
+		threads = [threading.Thread(target=metrics.increment, args=('metrics_test_total', labels, 2)) for _ in range(4)]
+		for thread in threads :
+			thread.start()
+		for thread in threads :
+			thread.join()
+
+		self.assertEqual(metrics._collect()[0][('metrics_test_total', labels)], before + 8)
+		# the exited threads were folded into the retired totals
+		self.assertFalse(any(('metrics_test_total', labels) in registry.counters for registry in metrics._registries))
+
+	def test_scrapes_are_restricted(self):
+		self.assertEqual(self.client.get(NAMESPACE + '/metrics').status_code, 403)
+
+		with override_settings(METRICS=dict(settings.METRICS, ALLOW_INTERNAL=True, TOKEN='scrape')) :
+			self.assertEqual(self.client.get(NAMESPACE + '/metrics').status_code, 200)
+			self.assertEqual(self.client.get(NAMESPACE + '/metrics', REMOTE_ADDR='93.184.216.34').status_code, 403)
+			self.assertEqual(self.client.get(NAMESPACE + '/metrics', REMOTE_ADDR='93.184.216.34', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+			self.assertEqual(self.client.get(NAMESPACE + '/metrics', REMOTE_ADDR='93.184.216.34', HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+
+			# behind a proxy every request comes from a private address, so only the token counts
+			with override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, NUM_PROXIES=1)) :
+				self.assertEqual(self.client.get(NAMESPACE + '/metrics', REMOTE_ADDR='10.0.0.2', HTTP_X_FORWARDED_FOR='93.184.216.34').status_code, 403)
+				self.assertEqual(self.client.get(NAMESPACE + '/metrics', REMOTE_ADDR='10.0.0.2', HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+
+	def test_sampled_profiles(self):
+		with tempfile.TemporaryDirectory() as directory :
+			with override_settings(METRICS={'ENABLED' : True, 'PROFILE_SAMPLE_RATE' : 1.0, 'PROFILE_DIR' : directory}) :
+				self.client.get(NAMESPACE + '/')
+
+			self.assertEqual([name.split('-')[0] for name in os.listdir(directory)], ['api'])
+
+class BreachedPasswordTestCase(TestCase) :
+	def setUp(self) :
+		self.directory = tempfile.TemporaryDirectory()
+		self.index_path = os.path.join(self.directory.name, 'breached.idx')
+		self.passwords = [("breached-%d" % i).encode('utf-8') for i in range(500)]
+
+	def tearDown(self) :
+		self.directory.cleanup()
+
+	def test_index(self):
+		source = os.path.join(self.directory.name, 'passwords.txt')
+		with open(source, 'wb') as f :
+			f.write(b"\n".join(self.passwords + self.passwords[:10]) + b"\n")
+
+		call_command('build_breached_index', source, output=self.index_path, run_size=64, stdout=io.StringIO())
+
+		for path, error_rate in ((self.index_path, 0.001), (self.index_path + '.plain', 0)) :
+			if error_rate == 0 :
+				self.assertEqual(build_index(iter(self.passwords), path, bloom_error_rate=0), 500)
+
+			index = get_index(path)
+			self.assertEqual(len(index), 500)
+			self.assertEqual(index.bloom is None, error_rate == 0)
+			self.assertTrue(all(index.contains_password(password.decode('utf-8')) for password in self.passwords))
+			self.assertFalse(any(index.contains_password("safe-%d" % i) for i in range(500)))
+
+	def test_validator(self):
+		build_index(iter(self.passwords), self.index_path)
+		validator = BreachedPasswordValidator(self.index_path)
+
+		with self.assertRaisesMessage(Exception, "This password has appeared in a data breach.") :
+			validator.validate("breached-7")
+		validator.validate("gu^&*678dghjasdja")
+
+		# no index built yet
+		BreachedPasswordValidator(os.path.join(self.directory.name, 'missing.idx')).validate("breached-7")
+
+	def test_registration(self):
+		build_index(iter(self.passwords), self.index_path)
+
+		with override_settings(BREACHED_PASSWORD_INDEX=self.index_path) :
+			response = Client().post(NAMESPACE + '/auth/register/', json.dumps({"username" : "someone", "password" : "breached-123", "secret_key": TEST_SECRET_KEY}), content_type="application/json")
+
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(response.data['message'], "This password has appeared in a data breach")
+
+class ThrottlingTestCase(TestCase) :
+	RATES = {'username' : '3/m', 'ip' : '5/m', 'global' : '100/s'}
+
+	def setUp(self) :
+		self.client = Client()
+		self.settings = {'ENABLED' : True, 'RATES' : self.RATES, 'SHARDS' : 4, 'GLOBAL_STRIPES' : 4, 'MAX_KEYS' : 100, 'SHARED_CACHE' : None}
+
+	def login(self, username, **extra) :
+		return self.client.put(NAMESPACE + '/auth/login/', json.dumps({"username" : username, "password" : "gu^&*678dghjasdja"}), content_type="application/json", **extra)
+
+	def test_username_and_ip_limits(self):
+		with override_settings(THROTTLING=self.settings) :
+			with mock.patch('backend.views.authenticate') as authenticate :
+				statuses = [self.login("victim", REMOTE_ADDR='10.0.0.%d' % i).status_code for i in range(4)]
+				self.assertEqual(statuses[-1], 429)
+				# no password was checked for the throttled request
+				self.assertEqual(authenticate.call_count, 0)
+
+			response = self.login("victim", REMOTE_ADDR='10.0.0.9')
+			self.assertEqual(response.status_code, 429)
+			self.assertTrue(response.data['message'].startswith("Too many attempts"))
+			self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+			statuses = [self.login("user%d" % i, REMOTE_ADDR='10.0.1.1').status_code for i in range(6)]
+			self.assertEqual(statuses[:5], [400] * 5)
+			self.assertEqual(statuses[5], 429)
+
+	def test_forwarded_for_does_not_change_the_ip(self):
+		with override_settings(THROTTLING=self.settings) :
+			statuses = [self.login("user%d" % i, HTTP_X_FORWARDED_FOR='203.0.113.%d' % i).status_code for i in range(6)]
+
+		self.assertEqual(statuses, [400] * 5 + [429])
+
+	def test_rejected_requests_spend_no_tokens(self):
+		with override_settings(THROTTLING=self.settings) :
+			statuses = [self.login("victim", REMOTE_ADDR='10.0.2.1').status_code for i in range(6)]
+			self.assertEqual(statuses, [400] * 3 + [429] * 3)
+
+			# only the three requests that got through count against the address
+			statuses = [self.login("user%d" % i, REMOTE_ADDR='10.0.2.1').status_code for i in range(3)]
+			self.assertEqual(statuses, [400, 400, 429])
+
+	def test_bucket_store(self):
+		store = throttling.BucketStore(4, 100)
+		self.assertEqual(store.peek('key', 2, 60), 0)
+		self.assertEqual([store.take('key', 2, 60) for _ in range(2)], [0, 0])
+		self.assertAlmostEqual(store.take('key', 2, 60), 30, delta=1)
+		self.assertEqual(store.take('other', 2, 60), 0)
+
+	def test_global_stripes_add_up_to_limit(self):
+		with override_settings(THROTTLING=dict(self.settings, RATES={'global' : '10/m'}, GLOBAL_STRIPES=4)) :
+			throttle = throttling.GlobalRateThrottle()
+			allowed = [throttle.allow_request(None, None) for _ in range(12)]
+
+		self.assertEqual(allowed.count(True), 10)
+		self.assertFalse(allowed[-1])
+
+	def test_shared_cache_store(self):
+		with override_settings(THROTTLING=dict(self.settings, SHARED_CACHE='default')) :
+			self.assertIsInstance(throttling.get_store(), throttling.CacheStore)
+			statuses = [self.login("shared").status_code for _ in range(4)]
+
+		self.assertEqual(statuses, [400, 400, 400, 429])
+
+class CalibratedHasherTestCase(TestCase) :
+	PASSWORD = "gu^&*678dghjasdja"
+
+	def setUp(self) :
+		self.directory = tempfile.TemporaryDirectory()
+		self.settings = {
+			'FILE' : os.path.join(self.directory.name, 'calibration.json'),
+			'TARGET_MS' : 50,
+			'MIN_BCRYPT_ROUNDS' : 4,
+			'MIN_PBKDF2_ITERATIONS' : 10000,
+			'ON_STARTUP' : False,
+			'ASYNC_REHASH' : False,
+		}
+
+	def tearDown(self) :
+		self.directory.cleanup()
+
+	def calibrated(self, rounds) :
+		with open(self.settings['FILE'], 'w') as f :
+			json.dump({"bcrypt_sha256" : {"rounds" : rounds}, "pbkdf2_sha256" : {"iterations" : 20000}}, f)
+
+		return override_settings(PASSWORD_HASH_CALIBRATION=self.settings)
+
+	def test_costs_come_from_calibration(self):
+		with self.calibrated(5) :
+			self.assertEqual(User(password=hashing.hash_password(self.PASSWORD)).password.split('$')[3], '05')
+			self.assertEqual(hashers.CalibratedPBKDF2PasswordHasher().iterations, 20000)
+
+		# uncalibrated hosts keep Django's defaults
+		os.remove(self.settings['FILE'])
+		with override_settings(PASSWORD_HASH_CALIBRATION=self.settings) :
+			self.assertEqual(hashers.CalibratedBCryptSHA256PasswordHasher().rounds, 12)
+
+	def test_login_rehashes_to_calibrated_cost(self):
+		with self.calibrated(4) :
+			User.objects.create(username='rehash', password=hashing.hash_password(self.PASSWORD))
+
+		with self.calibrated(5) :
+			response = Client().put(NAMESPACE + '/auth/login/', json.dumps({"username" : "rehash", "password" : self.PASSWORD}), content_type="application/json")
+			self.assertEqual(response.status_code, 202)
+
+			password = User.objects.get(username='rehash').password
+			self.assertEqual(password.split('$')[3], '05')
+			self.assertTrue(hashing.verify_password(self.PASSWORD, password))
+
+	def test_calibrate_command(self):
+		with override_settings(PASSWORD_HASH_CALIBRATION=self.settings) :
+			call_command('calibrate_hashers', target_ms=20, stdout=io.StringIO())
+
+			with open(self.settings['FILE']) as f :
+				calibration = json.load(f)
+
+			self.assertEqual(calibration['target_ms'], 20)
+			self.assertGreaterEqual(calibration['bcrypt_sha256']['rounds'], 4)
+			self.assertEqual(hashers.CalibratedBCryptSHA256PasswordHasher().rounds, calibration['bcrypt_sha256']['rounds'])
+
+class MasterPasswordBackend(ModelBackend) :
+	def authenticate(self, request, user=None, password=None, **kwargs) :
+		return user if password == "master" else None
+
+@override_settings(THROTTLING=THROTTLING_DISABLED)
+class AsyncViewsTestCase(TestCase) :
+	PASSWORD = "gu^&*678dghjasdja"
+
+	def setUp(self) :
+		self.factory = AsyncRequestFactory()
+
+	def post(self, path, body) :
+		return self.factory.post(NAMESPACE + path, json.dumps(body), content_type="application/json")
+
+	def put(self, path, body) :
+		return self.factory.put(NAMESPACE + path, json.dumps(body), content_type="application/json")
+
+	async def test_register_and_login(self):
+		response = await async_views.register(self.post('/auth/register/', {"username" : "async", "password" : self.PASSWORD, "secret_key" : TEST_SECRET_KEY}))
+		self.assertEqual(response.status_code, 201)
+		self.assertEqual(json.loads(response.content)['username'], "async")
+
+		response = await async_views.register(self.post('/auth/register/', {"username" : "async", "password" : self.PASSWORD, "secret_key" : TEST_SECRET_KEY}))
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(json.loads(response.content)['message'], "User with username already exists")
+
+		response = await async_views.login(self.put('/auth/login/', {"username" : "async", "password" : self.PASSWORD}))
+		self.assertEqual(response.status_code, 202)
+		self.assertIn('access', json.loads(response.content)['tokens'])
+
+		response = await async_views.login(self.put('/auth/login/', {"username" : "async", "password" : self.PASSWORD + "1"}))
+		self.assertEqual(response.status_code, 401)
+
+	async def test_login_uses_every_backend(self):
+		await async_views.register(self.post('/auth/register/', {"username" : "async", "password" : self.PASSWORD, "secret_key" : TEST_SECRET_KEY}))
+
+		failures = []
+		def failed(sender, credentials, request, **kwargs) :
+			failures.append(credentials)
+
+		user_login_failed.connect(failed)
+		try :
+			response = await async_views.login(self.put('/auth/login/', {"username" : "async", "password" : "master"}))
+			self.assertEqual(response.status_code, 401)
+
+			with override_settings(AUTHENTICATION_BACKENDS=['backend.backends.PooledModelBackend', 'backend.tests.MasterPasswordBackend']) :
+				response = await async_views.login(self.put('/auth/login/', {"username" : "async", "password" : "master"}))
+				self.assertEqual(response.status_code, 202)
+		finally :
+			user_login_failed.disconnect(failed)
+
+		self.assertEqual(len(failures), 1)
+		self.assertNotEqual(failures[0]['password'], "master")
+
+	async def test_responses_match_sync_views(self):
+		body = {"username" : "user1", "password" : "user1", "secret_key" : TEST_SECRET_KEY}
+		response = await async_views.register(self.post('/auth/register/', body))
+		sync_response = await AsyncClient().post(NAMESPACE + '/auth/register/', json.dumps(body), content_type="application/json")
+		self.assertEqual((response.status_code, response.content), (sync_response.status_code, sync_response.content))
+
+		body = {"username" : "nobody", "password" : self.PASSWORD}
+		response = await async_views.login(self.put('/auth/login/', body))
+		sync_response = await AsyncClient().put(NAMESPACE + '/auth/login/', json.dumps(body), content_type="application/json")
+		self.assertEqual((response.status_code, response.content), (sync_response.status_code, sync_response.content))
+
+		response = await async_views.login(self.factory.get(NAMESPACE + '/auth/login/'))
+		self.assertEqual(response.status_code, 405)
+
+		response = await async_views.register(self.post('/auth/register/', {"username" : "user2", "password" : self.PASSWORD, "secret_key" : "wrong"}))
+		self.assertEqual(response.status_code, 401)
+
+	@override_settings(PASSWORD_HASH_POOL=HASH_POOL_ENABLED)
+	async def test_hash_pool(self):
+		encoded = await hashing.ahash_password(self.PASSWORD)
+		self.assertTrue(await hashing.averify_password(self.PASSWORD, encoded))
+		self.assertFalse(await hashing.averify_password(self.PASSWORD + "1", encoded))
+
+	async def test_frontend(self):
+		response = await async_views.frontend(self.factory.get('/'))
+		self.assertEqual(response.status_code, 200)
+
+	async def test_metrics_middleware_counts_queries(self):
+		await AsyncClient().put(NAMESPACE + '/auth/login/', json.dumps({"username" : "nobody", "password" : self.PASSWORD}), content_type="application/json")
+		counters = metrics._collect()[0]
+		self.assertIn(('db_queries_total', (('route', 'api/auth/login/'), )), counters)
+
+@override_settings(THROTTLING=THROTTLING_DISABLED)
+class TokenRevocationTestCase(TestCase) :
+	def setUp(self) :
+		self.client = Client()
+		response = self.client.post(NAMESPACE + '/auth/register/', json.dumps({"username" : "rotate", "password" : "gu^&*678dghjasdja", "secret_key": TEST_SECRET_KEY}), content_type="application/json")
+		self.refresh = response.data['tokens']['refresh']
+
+	def refresh_tokens(self, refresh) :
+		return self.client.post(NAMESPACE + '/auth/refresh_tokens/', json.dumps({"refresh" : refresh}), content_type="application/json")
+
+	def test_refresh_tokens_are_rotated(self):
+		response = self.refresh_tokens(self.refresh)
+		self.assertEqual(response.status_code, 200)
+		self.assertIn('access', response.data)
+		self.assertNotEqual(response.data['refresh'], self.refresh)
+
+		# the old token has been used up, the new one works once
+		self.assertEqual(self.refresh_tokens(self.refresh).status_code, 401)
+		self.assertEqual(self.refresh_tokens(response.data['refresh']).status_code, 200)
+		self.assertEqual(RevokedToken.objects.count(), 2)
+
+	def test_logout(self):
+		response = self.client.post(NAMESPACE + '/auth/logout/', json.dumps({"refresh" : self.refresh}), content_type="application/json")
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(self.refresh_tokens(self.refresh).status_code, 401)
+
+		response = self.client.post(NAMESPACE + '/auth/logout/', json.dumps({"refresh" : "garbage"}), content_type="application/json")
+		self.assertEqual(response.status_code, 401)
+
+	def test_revocations_from_other_processes_are_synced(self):
+		revocation_store.is_revoked('warm')
+		RevokedToken.objects.create(jti='elsewhere', expires_at=timezone.now() + timedelta(hours=1))
+		self.assertFalse(revocation_store.is_revoked('elsewhere'))
+
+		with override_settings(TOKEN_REVOCATION={'SYNC_INTERVAL' : 0, 'PURGE_INTERVAL' : 0}) :
+			self.assertTrue(revocation_store.is_revoked('elsewhere'))
+
+	def test_expired_revocations_are_forgotten(self):
+		revocation_store.revoke('expired', time.time() - 1)
+		self.assertFalse(revocation_store.is_revoked('expired'))
+
+		with override_settings(TOKEN_REVOCATION={'SYNC_INTERVAL' : 0, 'PURGE_INTERVAL' : 0}) :
+			revocation_store.is_revoked('expired')
+			self.assertFalse(RevokedToken.objects.filter(jti='expired').exists())
+
+# the admin's templates link static files that only the manifest of a collectstatic run knows about
+class UserSearchTestCase(TestCase) :
+	def setUp(self) :
+		self.admin = User.objects.create_superuser(username='overseer', password='gu^&*678dghjasdja')
+		User.objects.bulk_create([User(username='student%03d' % i, email='s%d@example.com' % i) for i in range(25)])
+		User.objects.create(username='zed', first_name='Ada', last_name='Lovelace')
+		self.client.force_login(self.admin)
+
+	def test_search_uses_index(self):
+		self.assertEqual(set(search.search(User.objects.all(), 'velac').values_list('username', flat=True)), {'zed'})
+		self.assertEqual(search.search(User.objects.all(), 'student01 example').count(), 10)
+		self.assertIsNone(search.search(User.objects.all(), 'ze'))
+
+	def test_index_follows_updates_and_deletes(self):
+		User.objects.filter(username='zed').update(last_name='Byron')
+		self.assertFalse(search.search(User.objects.all(), 'velac').exists())
+		self.assertTrue(search.search(User.objects.all(), 'byron').exists())
+
+		User.objects.filter(username='zed').delete()
+		self.assertFalse(search.search(User.objects.all(), 'byron').exists())
+
+	def test_admin_search(self):
+		response = self.client.get(NAMESPACE + '/admin/backend/user/', {'q' : 'Lovelace'})
+		self.assertEqual([user.username for user in response.context['cl'].result_list], ['zed'])
+
+		response = self.client.get(NAMESPACE + '/admin/backend/user/', {'q' : 'ze'})
+		self.assertEqual([user.username for user in response.context['cl'].result_list], ['zed'])
+
+	def test_admin_keyset_pagination(self):
+		with mock.patch.object(admin.UserAdmin, 'list_per_page', 10) :
+			cl = self.client.get(NAMESPACE + '/admin/backend/user/').context['cl']
+			first = [user.username for user in cl.result_list]
+			self.assertTrue(cl.keyset)
+			self.assertIsNone(cl.previous_url)
+
+			with CaptureQueriesContext(connection) as queries :
+				cl = self.client.get(NAMESPACE + '/admin/backend/user/' + cl.next_url).context['cl']
+			self.assertEqual(cl.result_list[0].username, 'student009')
+			self.assertFalse([query for query in queries if 'OFFSET' in query['sql'] or 'COUNT(' in query['sql']])
+
+			cl = self.client.get(NAMESPACE + '/admin/backend/user/' + cl.previous_url).context['cl']
+			self.assertEqual([user.username for user in cl.result_list], first)
+
+			# sorting by another column pages with offsets as before
+			cl = self.client.get(NAMESPACE + '/admin/backend/user/', {'o' : '2'}).context['cl']
+			self.assertFalse(cl.keyset)
+
+class UserExportTestCase(TestCase) :
+	def setUp(self) :
+		admin = User.objects.create_superuser(username='overseer', password='gu^&*678dghjasdja')
+		self.auth = {'HTTP_AUTHORIZATION' : 'Bearer ' + get_tokens_for_user(admin)['access']}
+		User.objects.bulk_create([User(username='pupil%d' % i, cohort='7B' if i % 2 else '7C', is_active=i != 3) for i in range(5)])
+
+	def export(self, extension, **params) :
+		response = self.client.get(NAMESPACE + '/users/export.' + extension, params, **self.auth)
+		self.assertEqual(response.status_code, 200)
+		return b''.join(response.streaming_content)
+
+	def test_csv_export(self):
+		lines = self.export('csv').decode('utf-8').splitlines()
+		self.assertEqual(lines[0].split(',')[:5], ['username', 'email', 'first_name', 'last_name', 'cohort'])
+		self.assertEqual([line.split(',')[0] for line in lines[1:]], ['overseer', 'pupil0', 'pupil1', 'pupil2', 'pupil3', 'pupil4'])
+
+	def test_ndjson_export_filters_and_resumes(self):
+		rows = [json.loads(line) for line in self.export('ndjson', cohort='7B', is_active='true').splitlines()]
+		self.assertEqual([row['username'] for row in rows], ['pupil1'])
+
+		rows = [json.loads(line) for line in self.export('ndjson', after='pupil2').splitlines()]
+		self.assertEqual([row['username'] for row in rows], ['pupil3', 'pupil4'])
+
+		rows = self.export('ndjson', joined_after=(timezone.now() + timedelta(days=1)).date().isoformat())
+		self.assertEqual(rows, b'')
+
+	def test_gzip_export(self):
+		response = self.client.get(NAMESPACE + '/users/export.ndjson', HTTP_ACCEPT_ENCODING='gzip', **self.auth)
+		self.assertEqual(response['Content-Encoding'], 'gzip')
+		self.assertEqual(len(gzip.decompress(b''.join(response.streaming_content)).splitlines()), 6)
+
+	def test_export_requires_admin(self):
+		self.assertEqual(self.client.get(NAMESPACE + '/users/export.csv').status_code, 401)
+
+		response = self.client.get(NAMESPACE + '/users/export.csv', {'joined_after' : 'yesterday'}, **self.auth)
+		self.assertEqual(response.status_code, 400)
+
+	def test_registration_records_cohort(self):
+		RegistrationKey.objects.create(key='class-key', label='Year 9')
+		self.client.post(NAMESPACE + '/auth/register/', json.dumps({"username" : "cohorted", "password" : "gu^&*678dghjasdja", "secret_key" : "class-key"}), content_type="application/json")
+		self.assertEqual(User.objects.get(username='cohorted').cohort, 'Year 9')
+
+		# an unlabelled key is recorded by its id, never as the secret itself
+		key = RegistrationKey.objects.create(key='unlabelled-secret')
+		self.client.post(NAMESPACE + '/auth/register/', json.dumps({"username" : "unlabelled", "password" : "gu^&*678dghjasdja", "secret_key" : "unlabelled-secret"}), content_type="application/json")
+		self.assertEqual(User.objects.get(username='unlabelled').cohort, 'key-%d' % key.pk)
+
+class ServeCommandTestCase(TestCase) :
+	def test_warm_up_report(self):
+		out = io.StringIO()
+		call_command('serve', '--dry-run', stdout=out)
+
+		report = out.getvalue()
+		self.assertIn("Warmed up in", report)
+		for name in ("password validators", "password hashers", "URL resolvers", "database") :
+			self.assertIn(name, report)
+
+	def test_needs_gunicorn_unless_threads_only(self):
+		with mock.patch.object(serve, 'warm_up', return_value=([], {})), mock.patch.dict(sys.modules, {'gunicorn.app.base' : None}) :
+			with self.assertRaisesRegex(CommandError, "--threads-only") :
+				call_command('serve', stdout=io.StringIO())
+
+			with mock.patch('django.core.servers.basehttp.run') as run :
+				call_command('serve', '--threads-only', '--bind', '127.0.0.1:8123', stdout=io.StringIO())
+
+		self.assertEqual(run.call_args.args[:2], ('127.0.0.1', 8123))
+
+	def test_import_timer_excludes_children(self):
+		with serve.ImportTimer() as timer :
+			__import__('tabnanny')
+
+		self.assertIn('tabnanny', timer.times)
+		self.assertTrue(all(elapsed >= 0 for elapsed in timer.times.values()))
+
+class ViewHookMiddleware :
+	def __init__(self, get_response) :
+		self.get_response = get_response
+
+	def __call__(self, request) :
+		return self.get_response(request)
+
+	def process_view(self, request, view_func, view_args, view_kwargs) :
+		return HttpResponse(b'hooked')
+
+class RouteMiddlewareTestCase(TestCase) :
+	def test_api_skips_session_middleware(self):
+		response = self.client.get(NAMESPACE + '/')
+		self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+		self.assertFalse(response.has_header('X-Frame-Options'))
+		self.assertFalse(hasattr(response.wsgi_request, 'session'))
+
+		response = self.client.get(NAMESPACE + '/admin/login/')
+		self.assertEqual(response['X-Frame-Options'], 'DENY')
+		self.assertTrue(hasattr(response.wsgi_request, 'session'))
+
+	def test_api_appends_slashes(self):
+		response = self.client.get(NAMESPACE + '/cache/stats')
+		self.assertEqual(response.status_code, 301)
+		self.assertEqual(response['Location'], NAMESPACE + '/cache/stats/')
+
+	def test_admin_middleware_is_checked_in_its_route(self):
+		self.assertEqual(middleware.check_admin_middleware(), [])
+
+		with override_settings(MIDDLEWARE_ROUTES={'/' : ['django.middleware.security.SecurityMiddleware']}) :
+			self.assertEqual([error.id for error in middleware.check_admin_middleware()], ['admin.E408', 'admin.E409', 'admin.E410'])
+
+	def test_cors_preflight_is_answered_first(self):
+		with CaptureQueriesContext(connection) as queries :
+			response = self.client.options(NAMESPACE + '/auth/login/', HTTP_ORIGIN='http://example.com', HTTP_ACCESS_CONTROL_REQUEST_METHOD='PUT')
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Access-Control-Allow-Origin'], '*')
+		self.assertEqual(len(queries), 0)
+
+	@override_settings(MIDDLEWARE_ROUTES={'/api/' : ['backend.tests.ViewHookMiddleware']})
+	def test_view_hooks_are_delegated(self):
+		response = Client().get(NAMESPACE + '/')
+		self.assertEqual(response.content, b'hooked')
+
+		response = Client().get('/login')
+		self.assertNotEqual(response.content, b'hooked')
+
+class ConvertUserPkTestCase(TransactionTestCase) :
+	def setUp(self) :
+		# rebuild the user tables the way they were while the username was the primary key
+		state = ProjectState.from_apps(django_apps)
+		user_state = state.models['backend', 'user']
+		user_state.fields.pop('id')
+		user_state.fields['username'] = models.CharField(max_length=128, primary_key=True)
+		old_apps = state.apps
+
+		with connection.schema_editor() as editor :
+			editor.delete_model(LogEntry)
+			editor.delete_model(User)
+			editor.create_model(old_apps.get_model('backend', 'User'))
+			editor.create_model(old_apps.get_model('admin', 'LogEntry'))
+
+		OldUser = old_apps.get_model('backend', 'User')
+		search.create_search_index(OldUser)
+
+		group = old_apps.get_model('auth', 'Group').objects.create(name='teachers')
+		OldUser.objects.create(username='alice', date_joined=timezone.now())
+		OldUser.objects.create(username='bobby', date_joined=timezone.now() - timedelta(days=1)).groups.add(group)
+
+		content_type = ContentType.objects.get_for_model(User)
+		old_apps.get_model('admin', 'LogEntry').objects.create(user_id='alice', content_type_id=content_type.pk, object_id='bobby', object_repr='bobby', action_flag=2)
+
+	def test_convert(self):
+		out = io.StringIO()
+		call_command('convert_user_pk', stdout=out)
+
+		self.assertEqual(list(User.objects.order_by('id').values_list('username', flat=True)), ['bobby', 'alice'])
+		bobby = User.objects.get(username='bobby')
+		self.assertEqual([group.name for group in bobby.groups.all()], ['teachers'])
+
+		entry = LogEntry.objects.get()
+		self.assertEqual(entry.user.username, 'alice')
+		self.assertEqual(entry.object_id, str(bobby.pk))
+
+		self.assertEqual(list(search.search(User.objects.all(), 'lic').values_list('username', flat=True)), ['alice'])
+
+		call_command('convert_user_pk', stdout=out)
+		self.assertIn("already have an integer primary key", out.getvalue())
+
+@override_settings(THROTTLING=THROTTLING_DISABLED)
+class BatchTestCase(TestCase) :
+	def setUp(self) :
+		admin = User.objects.create_superuser(username='overseer', password='gu^&*678dghjasdja')
+		self.auth = {'HTTP_AUTHORIZATION' : 'Bearer ' + get_tokens_for_user(admin)['access']}
+
+	def batch(self, requests, **headers) :
+		return self.client.post(NAMESPACE + '/batch/', json.dumps({"requests" : requests}), content_type="application/json", **headers)
+
+	def test_batch_runs_sub_requests_in_order(self):
+		response = self.batch([
+			{"method" : "GET", "path" : "/"},
+			{"method" : "PUT", "path" : "/auth/login/", "body" : {"username" : "overseer", "password" : "wrong"}},
+			{"method" : "GET", "path" : "/cache/stats/"},
+			{"method" : "GET", "path" : "/nowhere/"},
+		], **self.auth)
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual([result['status'] for result in response.data['responses']], [200, 401, 200, 404])
+		self.assertEqual(response.data['responses'][0]['body'], {"blah" : "foo"})
+		self.assertEqual(response.data['responses'][1]['body']['message'], "Incorrect authentication details supplied, please ensure that the correct password was entered")
+
+	def test_sub_requests_run_through_the_middleware(self):
+		with mock.patch.object(log.RequestLogMiddleware, 'log', autospec=True) as logged :
+			response = self.batch([{"method" : "GET", "path" : "/"}, {"method" : "GET", "path" : "/cache/stats/"}], **self.auth)
+
+		self.assertEqual(logged.call_count, 3)
+		self.assertEqual([call.args[1].path for call in logged.call_args_list[:2]], [NAMESPACE + '/', NAMESPACE + '/cache/stats/'])
+
+		# the API route's chain, not the batch's view, adds the security headers
+		for result in response.data['responses'] :
+			self.assertEqual(result['headers']['X-Content-Type-Options'], 'nosniff')
+			self.assertIn('X-Request-ID', result['headers'])
+
+	def test_batch_authenticates_once(self):
+		with mock.patch.object(CachedJWTAuthentication, 'authenticate', autospec=True, side_effect=CachedJWTAuthentication.authenticate) as authenticate :
+			response = self.batch([{"method" : "GET", "path" : "/cache/stats/"}] * 3, **self.auth)
+
+		self.assertEqual([result['status'] for result in response.data['responses']], [200] * 3)
+		self.assertEqual(authenticate.call_count, 1)
+
+		response = self.batch([{"method" : "GET", "path" : "/cache/stats/"}])
+		self.assertEqual(response.data['responses'][0]['status'], 401)
+
+	def test_invalid_batches(self):
+		self.assertEqual(self.batch([]).status_code, 400)
+		self.assertEqual(self.batch([{"method" : "GET", "path" : "/batch/"}]).status_code, 400)
+		self.assertEqual(self.batch([{"method" : "GET", "path" : "/admin/"}]).status_code, 400)
+		self.assertEqual(self.batch([{"method" : "TRACE", "path" : "/"}]).status_code, 400)
+
+		with override_settings(BATCH_REQUESTS={'MAX_REQUESTS' : 2}) :
+			self.assertEqual(self.batch([{"method" : "GET", "path" : "/"}] * 3).status_code, 400)
+
+@override_settings(THROTTLING=THROTTLING_DISABLED)
+class LoggingTestCase(TestCase) :
+	def setUp(self) :
+		self.log_dir = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.log_dir.name, 'test.log')
+
+	def tearDown(self) :
+		self.log_dir.cleanup()
+
+	def read_log(self, handler) :
+		handler.flush()
+		with open(self.path) as f :
+			return [json.loads(line) for line in f]
+
+	def test_records_are_written_as_json_lines(self):
+		handler = log.QueuedJSONFileHandler(self.path)
+		handler.addFilter(log.RequestIdFilter())
+		logger = logging.getLogger('backend.tests.json')
+		logger.addHandler(handler)
+
+		try :
+			token = log._request_id.set('abc123')
+			try :
+				logger.warning("hello %s", "world", extra={'event' : 'test', 'duration_ms' : 1.5})
+				try :
+					raise ValueError("broken")
+				except ValueError :
+					logger.exception("failed")
+			finally :
+				log._request_id.reset(token)
+
+			first, second = self.read_log(handler)
+		finally :
+			logger.removeHandler(handler)
+			handler.close()
+
+		self.assertEqual((first['message'], first['request_id'], first['event'], first['duration_ms']), ("hello world", 'abc123', 'test', 1.5))
+		self.assertIn("ValueError: broken", second['exception'])
+
+	def test_full_queue_drops_records(self):
+		handler = log.QueuedJSONFileHandler(self.path, queue_size=1)
+		handler.listener.stop()
+
+		for i in range(3) :
+			handler.handle(logging.makeLogRecord({'msg' : 'record %d' % i, 'levelno' : logging.INFO}))
+
+		self.assertEqual(handler.dropped, 2)
+		handler.close()
+
+	def test_forked_processes_write_their_own_file(self):
+		handler = log.QueuedJSONFileHandler(self.path)
+		self.assertIn(handler, log._handlers)
+
+		with mock.patch('os.getpid', return_value=4242) :
+			handler._restart()
+
+		handler.handle(logging.makeLogRecord({'msg' : 'from the child', 'levelno' : logging.INFO}))
+		handler.flush()
+		handler.close()
+
+		with open(os.path.join(self.log_dir.name, 'test.4242.log')) as f :
+			self.assertEqual(json.loads(f.readline())['message'], 'from the child')
+		self.assertFalse(os.path.exists(self.path))
+
+		del handler
+		gc.collect()
+		self.assertFalse(any(handler.filename == self.path for handler in log._handlers))
+
+	def test_sampling(self):
+		sampler = log.SamplingFilter({'request' : 0.0})
+		self.assertFalse(sampler.filter(logging.makeLogRecord({'levelno' : logging.INFO, 'event' : 'request'})))
+		self.assertTrue(sampler.filter(logging.makeLogRecord({'levelno' : logging.WARNING, 'event' : 'request'})))
+		self.assertTrue(sampler.filter(logging.makeLogRecord({'levelno' : logging.INFO, 'event' : 'auth'})))
+
+	def test_request_ids(self):
+		response = self.client.get(NAMESPACE + '/', HTTP_X_REQUEST_ID='upstream-1')
+		self.assertEqual(response['X-Request-ID'], 'upstream-1')
+
+		response = self.client.get(NAMESPACE + '/', HTTP_X_REQUEST_ID='not an id!')
+		self.assertRegex(response['X-Request-ID'], r'^[0-9a-f]{16}$')
+
+	def test_auth_outcomes_are_logged(self):
+		with self.assertLogs('backend.auth', level='INFO') as logs :
+			self.client.put(NAMESPACE + '/auth/login/', json.dumps({"username" : "nobody", "password" : "nothing"}), content_type="application/json")
+
+		self.assertEqual(logs.records[0].outcome, 'unknown_username')
+
+@override_settings(THROTTLING=THROTTLING_DISABLED, RESPONSE_CACHE={'ENABLED': True, 'MAX_SIZE': 10})
+class ResponseCacheTestCase(TestCase) :
+	def setUp(self):
+		response_cache.clear()
+
+	def test_cached_responses_skip_the_view(self):
+		with mock.patch.object(TestView, 'get', autospec=True, side_effect=TestView.get) as get :
+			first = self.client.get(NAMESPACE + '/')
+			second = self.client.get(NAMESPACE + '/')
+
+		self.assertEqual(get.call_count, 1)
+		self.assertEqual(first.content, second.content)
+		self.assertEqual(second.data, {"blah" : "foo"})
+		self.assertEqual(second['Content-Type'], 'application/json')
+		self.assertEqual(second['ETag'], first['ETag'])
+		self.assertIn('Accept', second['Vary'])
+
+		# a different Accept header is negotiated and rendered on its own
+		with mock.patch.object(TestView, 'get', autospec=True, side_effect=TestView.get) as get :
+			self.client.get(NAMESPACE + '/', HTTP_ACCEPT='application/json; indent=4')
+
+		self.assertEqual(get.call_count, 1)
+		self.assertEqual(response_cache.stats()['size'], 2)
+
+	def test_conditional_get(self):
+		etag = self.client.get(NAMESPACE + '/')['ETag']
+
+		response = self.client.get(NAMESPACE + '/', HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+		self.assertEqual(response['ETag'], etag)
+		self.assertEqual(response.content, b'')
+
+		self.assertEqual(self.client.get(NAMESPACE + '/', HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+	def test_entries_expire(self):
+		with mock.patch.object(TestView, 'cache_ttl', 0), mock.patch.object(TestView, 'get', autospec=True, side_effect=TestView.get) as get :
+			self.client.get(NAMESPACE + '/')
+			self.client.get(NAMESPACE + '/')
+
+		self.assertEqual(get.call_count, 2)
+
+	def test_restricted_views_cannot_be_cached(self):
+		with self.assertRaises(ImproperlyConfigured) :
+			class PrivateView(response_cache.CachedResponseMixin, APIView) :
+				permission_classes = [IsAuthenticated]
+
+		with self.assertRaises(ImproperlyConfigured) :
+			class ThrottledView(response_cache.CachedResponseMixin, APIView) :
+				throttle_classes = [throttling.IPRateThrottle]
+
+	def test_prerendered_errors(self):
+		response = self.client.put(NAMESPACE + '/auth/login/', json.dumps({"username" : "nobody", "password" : "nothing"}), content_type="application/json")
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(response.data['message'], "User with supplied username does not exist, please register before logging in")
+
+		response = INCORRECT_DETAILS_RESPONSE.response()
+		self.assertIsNot(response, INCORRECT_DETAILS_RESPONSE.response())
+		self.assertEqual(response.status_code, 401)
+		self.assertEqual(json.loads(response.content), response.data)
+		# byte for byte what DRF's Response would have rendered
+		self.assertEqual(response.content, b'{"message":"Incorrect authentication details supplied, please ensure that the correct password was entered"}')
+
+		busy = SERVER_BUSY_RESPONSE.response()
+		self.assertEqual(busy['Retry-After'], "1")
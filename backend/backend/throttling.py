@@ -0,0 +1,296 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import json
+import math
+import time
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from rest_framework.exceptions import Throttled
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+
+from backend.utils import STATUS_CODE_4xx
+
+PERIODS = {'s' : 1, 'm' : 60, 'h' : 60 * 60, 'd' : 60 * 60 * 24}
+
+def parse_rate(rate) :
+	"""Reads a "requests/period" rate such as "10/m" into (requests, seconds), or None when the limit is off"""
+	if rate is None :
+		return None
+
+	requests, period = rate.split('/')
+	return int(requests), PERIODS[period[0]]
+
+class _Shard :
+	def __init__(self, max_keys) :
+		self.lock = threading.Lock()
+		self.buckets = OrderedDict()
+		self.max_keys = max_keys
+
+class BucketStore :
+	"""
+	In-process token buckets, spread over shards that each have their own lock so that requests for different keys do
+	not wait on each other. Each shard keeps its most recently used buckets, forgetting a bucket only refills it.
+	"""
+
+	def __init__(self, shards, max_keys) :
+		self._shards = [_Shard(max(1, max_keys // shards)) for _ in range(shards)]
+
+	def _tokens(self, shard, key, limit, rate, now) :
+		bucket = shard.buckets.get(key)
+
+		if bucket is None :
+			return limit
+
+		shard.buckets.move_to_end(key)
+		return min(limit, bucket[0] + (now - bucket[1]) * rate)
+
+	def peek(self, key, limit, period) :
+		"""Returns 0 if key's bucket has a token, otherwise the seconds until it will, without taking one"""
+		shard = self._shards[hash(key) % len(self._shards)]
+		rate = limit / period
+
+		with shard.lock :
+			tokens = self._tokens(shard, key, limit, rate, time.monotonic())
+
+		return 0 if tokens >= 1 else (1 - tokens) / rate
+
+	def take(self, key, limit, period) :
+		"""Takes a token from key's bucket, returning 0 if there was one, otherwise the seconds until there will be"""
+		shard = self._shards[hash(key) % len(self._shards)]
+		rate = limit / period
+		now = time.monotonic()
+
+		with shard.lock :
+			tokens = self._tokens(shard, key, limit, rate, now)
+
+			if tokens >= 1 :
+				shard.buckets[key] = (tokens - 1, now)
+				wait = 0
+			else :
+				shard.buckets[key] = (tokens, now)
+				wait = (1 - tokens) / rate
+
+			if len(shard.buckets) > shard.max_keys :
+				shard.buckets.popitem(last=False)
+
+		return wait
+
+class CacheStore :
+	"""
+	Sliding window counters kept in a Django cache so that limits hold across processes. The window is estimated from
+	the current and previous fixed windows, which needs two cache operations per check rather than a list of timestamps.
+	"""
+
+	def __init__(self, cache) :
+		self.cache = cache
+
+	def _key(self, key, window) :
+		return 'backend.throttle.%s.%d' % (hashlib.sha1(key.encode('utf-8')).hexdigest(), window)
+
+	def _estimate(self, key, window, elapsed, period, current) :
+		previous = self.cache.get(self._key(key, window - 1), 0)
+		return previous * (period - elapsed) / period + current
+
+	def peek(self, key, limit, period) :
+		now = time.time()
+		window = int(now // period)
+		elapsed = now - window * period
+
+		current = self.cache.get(self._key(key, window), 0)
+		if self._estimate(key, window, elapsed, period, current + 1) <= limit :
+			return 0
+
+		return period - elapsed
+
+	def take(self, key, limit, period) :
+		now = time.time()
+		window = int(now // period)
+		elapsed = now - window * period
+
+		current_key = self._key(key, window)
+		self.cache.add(current_key, 0, timeout=period * 2)
+		try :
+			current = self.cache.incr(current_key)
+		except ValueError :
+			# expired between the add and the incr
+			self.cache.set(current_key, 1, timeout=period * 2)
+			current = 1
+
+		if self._estimate(key, window, elapsed, period, current) <= limit :
+			return 0
+
+		return period - elapsed
+
+_store = None
+_store_lock = threading.Lock()
+
+@receiver(setting_changed)
+def _reset(setting, **kwargs) :
+	global _store
+
+	if setting == 'THROTTLING' :
+		_store = None
+
+def get_store() :
+	global _store
+
+	if _store is None :
+		with _store_lock :
+			if _store is None :
+				alias = settings.THROTTLING['SHARED_CACHE']
+				_store = CacheStore(caches[alias]) if alias else BucketStore(settings.THROTTLING['SHARDS'], settings.THROTTLING['MAX_KEYS'])
+
+	return _store
+
+class BucketThrottle(BaseThrottle) :
+	scope = None
+
+	def __init__(self) :
+		self._wait = 0
+
+	def get_key(self, request) :
+		raise NotImplementedError()
+
+	def peek(self, store, key, limit, period) :
+		return store.peek(key, limit, period)
+
+	def take(self, store, key, limit, period) :
+		return store.take(key, limit, period)
+
+	def _limit(self, request) :
+		"""Returns (key, limit, period) for the request's bucket, or None when it is not limited"""
+		if not settings.THROTTLING['ENABLED'] :
+			return None
+
+		rate = parse_rate(settings.THROTTLING['RATES'][self.scope])
+		key = self.get_key(request) if rate is not None else None
+
+		if key is None :
+			return None
+
+		return ('%s:%s' % (self.scope, key),) + rate
+
+	def check(self, request) :
+		"""Returns the seconds until the request would be allowed, or 0 if it would be now, without spending a token"""
+		limit = self._limit(request)
+		return self.peek(get_store(), *limit) if limit is not None else 0
+
+	def spend(self, request) :
+		limit = self._limit(request)
+		self._wait = self.take(get_store(), *limit) if limit is not None else 0
+		return self._wait
+
+	def allow_request(self, request, view) :
+		return self.spend(request) == 0
+
+	def wait(self) :
+		return self._wait
+
+def _request_username(request) :
+	"""The username a login or registration is for, read from the JSON body without consuming it for the view"""
+	if not hasattr(request, '_throttle_username') :
+		try :
+			# DRF views pass their Request, the async views a plain HttpRequest
+			req = json.loads(getattr(request, '_request', request).body.decode('utf-8'))
+			username = req.get('username') if isinstance(req, dict) else None
+		except ValueError :
+			username = None
+
+		request._throttle_username = username.lower() if isinstance(username, str) and username else None
+
+	return request._throttle_username
+
+class UsernameRateThrottle(BucketThrottle) :
+	scope = 'username'
+
+	def get_key(self, request) :
+		return _request_username(request)
+
+class IPRateThrottle(BucketThrottle) :
+	scope = 'ip'
+
+	def get_key(self, request) :
+		# REMOTE_ADDR unless REST_FRAMEWORK's NUM_PROXIES says which X-Forwarded-For entry our own proxies added
+		return self.get_ident(request)
+
+class GlobalRateThrottle(BucketThrottle) :
+	"""
+	Limit on all password hashing requests. In process, the budget is split into GLOBAL_STRIPES buckets: a request takes
+	from its thread's stripe and only looks at the others when that one is empty, so threads rarely share a lock.
+	"""
+	scope = 'global'
+
+	def get_key(self, request) :
+		return 'all'
+
+	def _stripes(self, store, key, limit, period, operation) :
+		if not isinstance(store, BucketStore) :
+			return operation(key, limit, period)
+
+		stripes = max(1, min(settings.THROTTLING['GLOBAL_STRIPES'], limit))
+		first = threading.get_ident() % stripes
+		waits = []
+
+		for i in range(stripes) :
+			stripe = (first + i) % stripes
+			# spread the remainder so the stripes add up to the whole limit
+			wait = operation('%s:%d' % (key, stripe), limit // stripes + (1 if stripe < limit % stripes else 0), period)
+
+			if wait == 0 :
+				return 0
+			waits.append(wait)
+
+		return min(waits)
+
+	def peek(self, store, key, limit, period) :
+		return self._stripes(store, key, limit, period, store.peek)
+
+	def take(self, store, key, limit, period) :
+		return self._stripes(store, key, limit, period, store.take)
+
+def check_throttles(request, throttle_classes) :
+	"""
+	Runs throttles, returning None when the request may go ahead or else the seconds to wait. Tokens are only spent
+	once every throttle has a token for the request, so a request turned away by one limit does not count against the
+	others.
+	"""
+	throttles = [throttle_class() for throttle_class in throttle_classes]
+
+	waits = [wait for wait in (throttle.check(request) for throttle in throttles) if wait]
+	if not waits :
+		# another request may have taken the last token since it was checked
+		waits = [wait for wait in (throttle.spend(request) for throttle in throttles) if wait]
+
+	return max(waits) if waits else None
+
+def throttled_message(wait) :
+	return "Too many attempts, please try again in %d seconds" % wait
+
+class AuthThrottleMixin :
+	"""Throttles an auth view before it does any hashing, answering with the usual {"message": ...} body and Retry-After"""
+	throttle_classes = [UsernameRateThrottle, IPRateThrottle, GlobalRateThrottle]
+
+	def check_throttles(self, request) :
+		wait = check_throttles(request, self.throttle_classes)
+		if wait is not None :
+			self.throttled(request, wait)
+
+	def handle_exception(self, exc) :
+		if isinstance(exc, Throttled) :
+			wait = math.ceil(exc.wait or 1)
+			return Response({"message" : throttled_message(wait)}, status=STATUS_CODE_4xx.TOO_MANY_REQUESTS.value, headers={"Retry-After" : str(wait)})
+
+		return super().handle_exception(exc)
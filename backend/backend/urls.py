@@ -4,28 +4,42 @@
 #  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
 #
 
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, re_path
-from django.views.static import serve
-from rest_framework_simplejwt.views import TokenRefreshView
 
+from . import assets
+from . import async_views
+from . import media
+from . import metrics
 from . import views
-from . import settings
 
 NAMESPACE = 'api'
 
+if settings.ASYNC_VIEWS :
+	login_view, register_view, frontend_view = async_views.login, async_views.register, async_views.frontend
+else :
+	login_view, register_view, frontend_view = views.LoginView.as_view(), views.RegisterView.as_view(), views.FrontendView.as_view()
+
 urlpatterns = [
 	path(NAMESPACE + '/admin/', admin.site.urls, name="admin-page"),
 
 	path(NAMESPACE + '/', views.TestView.as_view(), name="api-test"),
+	path(NAMESPACE + '/batch/', views.BatchView.as_view(), name="batch"),
+	path(NAMESPACE + '/cache/stats/', views.CacheStatsView.as_view(), name="cache-stats"),
+	path(NAMESPACE + '/metrics', metrics.metrics_view, name="metrics"),
+	re_path(r'^' + NAMESPACE + r'/users/export\.(?P<extension>csv|ndjson)$', views.UserExportView.as_view(), name="users-export"),
 	
-	path(NAMESPACE + '/auth/login/', views.LoginView.as_view(), name="authentication-login"),
-	path(NAMESPACE + '/auth/register/', views.RegisterView.as_view(), name="authentication-register"),
-	path(NAMESPACE + '/auth/refresh_tokens/', TokenRefreshView.as_view(), name="authentication-refresh"),
+	path(NAMESPACE + '/auth/login/', login_view, name="authentication-login"),
+	path(NAMESPACE + '/auth/register/', register_view, name="authentication-register"),
+	path(NAMESPACE + '/auth/register/bulk/', views.RegisterBulkView.as_view(), name="authentication-register-bulk"),
+	path(NAMESPACE + '/auth/refresh_tokens/', views.RefreshTokensView.as_view(), name="authentication-refresh"),
+	path(NAMESPACE + '/auth/logout/', views.LogoutView.as_view(), name="authentication-logout"),
 
-	path('', views.FrontendView.as_view(), name="frontend-home"),
-	path('other', views.FrontendView.as_view(), name="frontend-other"),
-	path('login', views.FrontendView.as_view(), name="frontend-login"),
+	path('', frontend_view, name="frontend-home"),
+	path('other', frontend_view, name="frontend-other"),
+	path('login', frontend_view, name="frontend-login"),
 
-	re_path(r'^api/media/(?P<path>.*)$', serve, name="media-paths", kwargs={'document_root': settings.MEDIA_ROOT})
+	re_path(r'^api/media/(?P<path>.*)$', media.serve, name="media-paths"),
+	re_path(r'^static/(?P<path>.*)$', assets.serve, name="static-paths")
 ]
@@ -0,0 +1,115 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import copy
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from backend.cache import LRUCache
+
+def _without_password(user) :
+	# a field missing from an instance's __dict__ is deferred, read from the database when first accessed
+	user = copy.copy(user)
+	user.__dict__.pop('password', None)
+	return user
+
+class UserCache :
+	"""
+	Two tier cache of User rows for the lookups made on every login and authenticated request. The local tier is an LRU
+	inside this process, the optional shared tier is any Django cache (local memory, file based, ...) so that processes
+	can share loads. Saving or deleting a user clears both tiers through signals, other processes' local tiers catch up
+	within LOCAL_TTL seconds. Password hashes are kept out of the shared tier, users found there load theirs from the
+	database when it is first read.
+	"""
+
+	def __init__(self) :
+		self._local = None
+		self._lock = threading.Lock()
+		self.shared_hits = 0
+		self.shared_misses = 0
+
+	def _get_local(self) :
+		if self._local is None :
+			self._local = LRUCache(settings.USER_CACHE['LOCAL_SIZE'], ttl=settings.USER_CACHE['LOCAL_TTL'])
+
+		return self._local
+
+	def _get_shared(self) :
+		alias = settings.USER_CACHE['SHARED_CACHE']
+		return caches[alias] if alias else None
+
+	def _shared_key(self, key) :
+		if isinstance(key, tuple) :
+			return 'backend.user.%s.%s' % key
+
+		# hashed, as usernames may contain characters some cache backends do not allow in keys
+		return 'backend.user.' + hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+	def get_user(self, username) :
+		return self._get(username, username=username)
+
+	def get_user_by_id(self, user_id) :
+		return self._get(('id', user_id), pk=user_id)
+
+	def _get(self, key, **lookup) :
+		"""Returns the user found by lookup, cached under key, which is a username or an (field, value) pair"""
+		from backend.models import User
+
+		if not settings.USER_CACHE['ENABLED'] :
+			return User.objects.filter(**lookup).first()
+
+		local = self._get_local()
+		user = local.get(key)
+
+		if user is None :
+			shared = self._get_shared()
+
+			if shared is not None :
+				user = shared.get(self._shared_key(key))
+
+				with self._lock :
+					if user is None :
+						self.shared_misses += 1
+					else :
+						self.shared_hits += 1
+
+			if user is None :
+				user = User.objects.filter(**lookup).first()
+				if user is None :
+					return None
+
+				if shared is not None :
+					shared.set(self._shared_key(key), _without_password(user), settings.USER_CACHE['SHARED_TTL'])
+
+			local.set(key, user)
+
+		# callers may change the user they get back, so never hand out the cached instance itself
+		return copy.copy(user)
+
+	def invalidate(self, username, user_id=None) :
+		keys = [username] if user_id is None else [username, ('id', user_id)]
+
+		for key in keys :
+			if self._local is not None :
+				self._local.delete(key)
+
+			shared = self._get_shared()
+			if shared is not None :
+				shared.delete(self._shared_key(key))
+
+	def stats(self) :
+		local = self._get_local()
+
+		return {
+			"enabled" : settings.USER_CACHE['ENABLED'],
+			"local" : {"hits" : local.hits, "misses" : local.misses, "size" : len(local)},
+			"shared" : {"hits" : self.shared_hits, "misses" : self.shared_misses},
+		}
+
+user_cache = UserCache()
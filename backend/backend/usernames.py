@@ -0,0 +1,122 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import time
+import threading
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from backend.bloom import BloomFilter
+from backend.user_cache import user_cache
+
+# rows are stamped with date_joined before they commit, so each catch up re-reads a little history to not miss slow commits
+SYNC_OVERLAP = timedelta(minutes=1)
+
+class UsernameFilter :
+	"""
+	In-process Bloom filter of registered usernames, so that unknown usernames can be rejected without touching the database.
+
+	Registrations in this process are added straight away through the post_save signal. Registrations made by other
+	processes are picked up by catching up on recently joined users at most once every REFRESH_INTERVAL seconds, and
+	only when the filter is about to answer "does not exist". Until then get_user() loads those users all the same.
+	"""
+
+	def __init__(self) :
+		self._bloom = None
+		self._lock = threading.Lock()
+		self._synced_at = None
+		self._checked_at = 0.0
+
+	def warm(self) :
+		from backend.models import User
+
+		options = settings.USERNAME_FILTER
+		synced_at = timezone.now()
+
+		usernames = User.objects.values_list('username', flat=True)
+		bloom = BloomFilter(max(options['CAPACITY'], 2 * usernames.count()), options['ERROR_RATE'])
+
+		for username in usernames.iterator(chunk_size=2000) :
+			bloom.add(username)
+
+		with self._lock :
+			self._bloom = bloom
+			self._synced_at = synced_at
+			self._checked_at = time.monotonic()
+
+	def _catch_up(self) :
+		from backend.models import User
+
+		now = time.monotonic()
+		if now - self._checked_at < settings.USERNAME_FILTER['REFRESH_INTERVAL'] :
+			return False
+
+		self._checked_at = now
+		synced_at = timezone.now()
+
+		for username in User.objects.filter(date_joined__gte=self._synced_at - SYNC_OVERLAP).values_list('username', flat=True) :
+			self.add(username)
+
+		self._synced_at = synced_at
+		return True
+
+	def add(self, username) :
+		if self._bloom is None :
+			return
+
+		with self._lock :
+			self._bloom.add(username)
+
+		if self._bloom.count > self._bloom.capacity :
+			# past capacity the false positive rate climbs, start again with a bigger filter
+			self._bloom = None
+
+	def _check(self, username) :
+		"""Returns False when username is definitely not registered, None when it is missing but the filter is not due a catch up"""
+		if not settings.USERNAME_FILTER['ENABLED'] :
+			return True
+
+		bloom = self._bloom
+		if bloom is None :
+			self.warm()
+			bloom = self._bloom
+
+		if username in bloom :
+			return True
+
+		if not self._catch_up() :
+			return None
+
+		bloom = self._bloom
+		return bloom is None or username in bloom
+
+	def might_exist(self, username) :
+		"""Returns False only when the username is not registered, as far as the filter knows"""
+		return bool(self._check(username))
+
+	def get_user(self, username) :
+		"""
+		Loads username's user through the user cache unless the filter, having just caught up, has no record of it. Users
+		found while missing from the filter were registered by other processes since the last catch up and are added.
+		"""
+		known = self._check(username)
+		if known is False :
+			return None
+
+		user = user_cache.get_user(username)
+		if user is not None and known is None :
+			self.add(username)
+
+		return user
+
+	def reset(self) :
+		with self._lock :
+			self._bloom = None
+
+username_filter = UsernameFilter()
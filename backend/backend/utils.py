@@ -8,6 +8,9 @@ import enum
 
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from backend import registration_keys
+from backend.metrics import timed_function
+
 class STATUS_CODE_2xx(enum.Enum):
 	SUCCESS = 200
 	CREATED = 201
@@ -19,11 +22,15 @@ class STATUS_CODE_4xx(enum.Enum):
 	UNAUTHORIZED = 401
 	FORBIDDEN = 403
 	NOT_FOUND = 404
+	METHOD_NOT_ALLOWED = 405
 	GONE = 410
+	TOO_MANY_REQUESTS = 429
 
 class STATUS_CODE_5xx(enum.Enum) :
 	INTERNAL_SERVER_ERROR = 500
+	SERVICE_UNAVAILABLE = 503
 
+@timed_function('auth_step_duration_seconds', step='tokens')
 def get_tokens_for_user(user):
 	refresh = RefreshToken.for_user(user)
 
@@ -32,8 +39,9 @@ def get_tokens_for_user(user):
 		'access' : str(refresh.access_token)
 	}
 
-def is_secret_key_valid(secret_key) :
-	if secret_key == "123" or secret_key == "test_key" :
-		return True
+def format_error_messages(errors) :
+	# joins validation messages into a single sentence, dropping the trailing full stops
+	return ", and ".join([str(err).lower()[:-1] if i != 0 else str(err)[:-1] for i, err in enumerate(errors)])
 
-	return False
\ No newline at end of file
+def is_secret_key_valid(secret_key) :
+	return registration_keys.is_valid(secret_key)
\ No newline at end of file
@@ -0,0 +1,185 @@
+#
+#  Copyright Jim Carty © 2021: cartyjim1@gmail.com
+#
+#  This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
+#
+
+import os
+import mmap
+import heapq
+import struct
+import hashlib
+import tempfile
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils.translation import gettext as _
+
+from backend.bloom import BloomFilter
+
+# magic, version, bloom hash count, entry count, bloom offset, bloom size in bits
+HEADER = struct.Struct('<8sHHQQQ')
+MAGIC = b'BREACHED'
+VERSION = 1
+
+# entries are the first 8 bytes of the SHA-1 of each password, collisions are around 1 in 10^12 for 10 million passwords
+ENTRY_SIZE = 8
+
+def password_digest(password) :
+	return hashlib.sha1(password).digest()[:ENTRY_SIZE]
+
+class BreachedPasswordIndex :
+	"""
+	Read only view of an index written by build_index. The file is memory mapped, so lookups only touch the pages they
+	need and every worker process shares the same copy through the page cache.
+	"""
+
+	def __init__(self, path) :
+		with open(path, 'rb') as f :
+			self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		magic, version, num_hashes, self.count, bloom_offset, bloom_bits = HEADER.unpack_from(self.map)
+		if magic != MAGIC or version != VERSION :
+			raise ValueError("%s is not a breached password index" % path)
+
+		self.bloom = None
+		if bloom_bits :
+			bits = memoryview(self.map)[bloom_offset:bloom_offset + (bloom_bits + 7) // 8]
+			self.bloom = BloomFilter.from_buffer(bits, bloom_bits, num_hashes, self.count)
+
+	def __len__(self) :
+		return self.count
+
+	def __contains__(self, digest) :
+		# most passwords are not in the corpus, and the Bloom filter answers those without the binary search
+		if self.bloom is not None and digest.hex() not in self.bloom :
+			return False
+
+		data = self.map
+		low, high = 0, self.count
+
+		while low < high :
+			middle = (low + high) // 2
+			start = HEADER.size + middle * ENTRY_SIZE
+			entry = data[start:start + ENTRY_SIZE]
+
+			if entry < digest :
+				low = middle + 1
+			elif entry > digest :
+				high = middle
+			else :
+				return True
+
+		return False
+
+	def contains_password(self, password) :
+		return password_digest(password.encode('utf-8')) in self
+
+def _write_run(digests) :
+	digests.sort()
+	run = tempfile.TemporaryFile()
+	run.write(b''.join(digests))
+	run.seek(0)
+	return run
+
+def _read_run(run) :
+	while True :
+		entry = run.read(ENTRY_SIZE)
+		if not entry :
+			return
+		yield entry
+
+def build_index(lines, path, bloom_error_rate=0.001, run_size=1000000, hashed=False) :
+	"""
+	Writes an index of the passwords in lines (bytes, one password each, or hex SHA-1 hashes optionally followed by
+	":count" when hashed is set), returning the number of distinct entries. Lines are sorted in runs of run_size and
+	merged, so memory use does not grow with the size of the corpus.
+	"""
+	runs = []
+	digests = []
+	total = 0
+
+	for line in lines :
+		line = line.rstrip(b'\r\n')
+		if not line :
+			continue
+
+		if hashed :
+			digests.append(bytes.fromhex(line.split(b':', 1)[0].decode('ascii'))[:ENTRY_SIZE])
+		else :
+			digests.append(password_digest(line))
+
+		if len(digests) >= run_size :
+			runs.append(_write_run(digests))
+			total += len(digests)
+			digests = []
+
+	total += len(digests)
+	runs.append(_write_run(digests))
+
+	bloom = BloomFilter(total, bloom_error_rate) if bloom_error_rate else None
+	count = 0
+	previous = None
+
+	# written next to the old index and moved over it, so processes that have the old one mapped are unaffected
+	temporary = path + '.tmp'
+	with open(temporary, 'wb') as f :
+		f.write(b'\0' * HEADER.size)
+
+		for entry in heapq.merge(*[_read_run(run) for run in runs]) :
+			if entry == previous :
+				continue
+
+			f.write(entry)
+			if bloom is not None :
+				bloom.add(entry.hex())
+
+			previous = entry
+			count += 1
+
+		bloom_offset = HEADER.size + count * ENTRY_SIZE
+		if bloom is not None :
+			f.write(bloom.bits)
+
+		f.seek(0)
+		f.write(HEADER.pack(MAGIC, VERSION, bloom.num_hashes if bloom else 0, count, bloom_offset, bloom.num_bits if bloom else 0))
+
+	for run in runs :
+		run.close()
+
+	os.replace(temporary, path)
+	return count
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_index(path) :
+	"""Returns the index at path, opened once per process, or None if it has not been built"""
+	if path not in _indexes :
+		with _indexes_lock :
+			if path not in _indexes :
+				_indexes[path] = BreachedPasswordIndex(path) if os.path.isfile(path) else None
+
+	return _indexes[path]
+
+class BreachedPasswordValidator :
+	"""
+	Rejects passwords found in a breached password corpus, see the build_breached_index command. Does nothing until the
+	index has been built.
+	"""
+
+	def __init__(self, index_path=None) :
+		self.index_path = index_path
+
+	def validate(self, password, user=None) :
+		index = get_index(str(self.index_path or settings.BREACHED_PASSWORD_INDEX))
+
+		if index is not None and index.contains_password(password) :
+			raise ValidationError(
+				_("This password has appeared in a data breach."),
+				code='password_breached',
+			)
+
+	def get_help_text(self) :
+		return _("Your password can't be one that has appeared in a data breach.")
@@ -5,98 +5,241 @@
 #
 
 import json
-import traceback
+import logging
 
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
+from django.views import View
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView
 
+from backend import registration_keys
 from backend.models import User
 from backend.utils import (
 	get_tokens_for_user,
 	is_secret_key_valid,
+	format_error_messages,
 	STATUS_CODE_2xx,
 	STATUS_CODE_4xx,
 	STATUS_CODE_5xx
 )
+from backend.batch import parse_batch, run_batch, BatchError
+from backend.compression import choose_encoding
+from backend.export import parse_filters, export_stream, ExportError, CONTENT_TYPES
+from backend.hashing import HashPoolSaturated
+from backend.log import log_auth
+from backend.metrics import timed
+from backend.response_cache import CachedResponseMixin, Prerendered, stats as response_cache_stats
 from backend.serealizers import RegisterUserSerializer
+from backend.roster import parse_roster, register_roster, RosterError
+from backend.usernames import username_filter
+from backend.user_cache import user_cache
+from backend.spa import spa_shell
+from backend.revocation import revocation_store, RotatingTokenRefreshSerializer
+from backend.throttling import AuthThrottleMixin, IPRateThrottle, GlobalRateThrottle
+
+logger = logging.getLogger(__name__)
+
+INVALID_SECRET_KEY = "Secret key is not valid, please verify it your teacher or YES representative"
+NO_SEATS_LEFT = "There are no places left for this secret key, please contact your teacher or YES representative"
+USERNAME_TAKEN = "User with username already exists"
+REGISTRATION_FAILED = "User could not be created, please try again later"
+UNKNOWN_USERNAME = "User with supplied username does not exist, please register before logging in"
+INCORRECT_DETAILS = "Incorrect authentication details supplied, please ensure that the correct password was entered"
+SERVER_BUSY = "The server is busy, please try again in a moment"
+INVALID_REFRESH_TOKEN = "Refresh token is not valid, please log in again"
+
+# error responses whose bodies never change, rendered once rather than on every failed attempt
+INVALID_SECRET_KEY_RESPONSE = Prerendered({"message" : INVALID_SECRET_KEY}, STATUS_CODE_4xx.UNAUTHORIZED.value)
+NO_SEATS_LEFT_RESPONSE = Prerendered({"message" : NO_SEATS_LEFT}, STATUS_CODE_4xx.FORBIDDEN.value)
+USERNAME_TAKEN_RESPONSE = Prerendered({"message" : USERNAME_TAKEN}, STATUS_CODE_4xx.BAD_REQUEST.value)
+REGISTRATION_FAILED_RESPONSE = Prerendered({"message" : REGISTRATION_FAILED}, STATUS_CODE_4xx.BAD_REQUEST.value)
+UNKNOWN_USERNAME_RESPONSE = Prerendered({"message" : UNKNOWN_USERNAME}, STATUS_CODE_4xx.BAD_REQUEST.value)
+INCORRECT_DETAILS_RESPONSE = Prerendered({"message" : INCORRECT_DETAILS}, STATUS_CODE_4xx.UNAUTHORIZED.value)
+SERVER_BUSY_RESPONSE = Prerendered({"message" : SERVER_BUSY}, STATUS_CODE_5xx.SERVICE_UNAVAILABLE.value, {"Retry-After" : "1"})
+INVALID_REFRESH_TOKEN_RESPONSE = Prerendered({"message" : INVALID_REFRESH_TOKEN}, STATUS_CODE_4xx.UNAUTHORIZED.value)
+
+def serializer_error_message(serealizer) :
+	errors = []
+
+	if "username" in serealizer.errors :
+		errors += list(serealizer.errors["username"])
+	if "non_field_errors" in serealizer.errors : 
+		# if errors in password, index is strange due to django
+		errors = list(serealizer.errors["non_field_errors"])
+
+	return format_error_messages(errors)
 
 # API views
-class TestView(APIView):
+class TestView(CachedResponseMixin, APIView):
 	def get(self, request):
 		return Response({"blah" : "foo"}, status=STATUS_CODE_2xx.SUCCESS.value)
 
-class RegisterView(APIView):
+class CacheStatsView(APIView):
+	permission_classes = [IsAdminUser]
+
+	def get(self, request):
+		return Response({"users" : user_cache.stats(), "responses" : response_cache_stats()}, status=STATUS_CODE_2xx.SUCCESS.value)
+
+class BatchView(APIView):
+	def post(self, request) :
+		try :
+			entries = parse_batch(request.body)
+		except BatchError as e :
+			return Response({"message" : str(e)}, status=STATUS_CODE_4xx.BAD_REQUEST.value)
+
+		# paths in the batch are relative to the API root the batch itself was sent to
+		root = request.path_info[:-len('/batch/')]
+		return Response({"responses" : run_batch(request, entries, root)}, status=STATUS_CODE_2xx.SUCCESS.value)
+
+class UserExportView(APIView):
+	permission_classes = [IsAdminUser]
+
+	def get(self, request, extension) :
+		try :
+			filters = parse_filters(request.GET)
+		except ExportError as e :
+			return Response({"message" : str(e)}, status=STATUS_CODE_4xx.BAD_REQUEST.value)
+
+		gzip = choose_encoding(request, ['gzip']) == 'gzip'
+
+		response = StreamingHttpResponse(export_stream(extension, filters, gzip=gzip), content_type=CONTENT_TYPES[extension], status=STATUS_CODE_2xx.SUCCESS.value)
+		response['Content-Disposition'] = 'attachment; filename="users.%s"' % extension
+		response['Vary'] = 'Accept-Encoding'
+		if gzip :
+			response['Content-Encoding'] = 'gzip'
+
+		return response
+
+class RegisterView(AuthThrottleMixin, APIView):
 	def post(self, request) :
 		try :
 			req = json.loads(request.body.decode('utf-8'))
 
 			if not is_secret_key_valid(req["secret_key"]) :
-				return Response({"message": "Secret key is not valid, please verify it your teacher or YES representative"}, status=STATUS_CODE_4xx.UNAUTHORIZED.value)
+				log_auth('register', 'invalid_secret_key', req.get("username"), logging.WARNING)
+				return INVALID_SECRET_KEY_RESPONSE.response()
 
 			serealizer = RegisterUserSerializer(data=req)
-			
-			if not serealizer.is_valid() :
-				errors = []
 
-				if "username" in serealizer.errors :
-					errors += list(serealizer.errors["username"])
-				if "non_field_errors" in serealizer.errors : 
-					# if errors in password, index is strange due to django
-					errors = list(serealizer.errors["non_field_errors"])
-					
-				message = ", and ".join([str(err).lower()[:-1] if i != 0 else str(err)[:-1] for i, err in enumerate(errors)])
-				return Response({"message": message}, status=STATUS_CODE_4xx.BAD_REQUEST.value)
+			with timed('auth_step_duration_seconds', step='validate') :
+				valid = serealizer.is_valid()
 
-			serealizer.save()
+			if not valid :
+				log_auth('register', 'invalid', req.get("username"))
+				return Response({"message": serializer_error_message(serealizer)}, status=STATUS_CODE_4xx.BAD_REQUEST.value)
 
-			ret_user = User.objects.get(username=req["username"])
+			try :
+				with transaction.atomic() :
+					if not registration_keys.claim_seats(req["secret_key"]) :
+						log_auth('register', 'no_seats_left', req.get("username"), logging.WARNING)
+						return NO_SEATS_LEFT_RESPONSE.response()
+
+					with timed('auth_step_duration_seconds', step='create') :
+						ret_user = serealizer.save(cohort=registration_keys.cohort(req["secret_key"]))
+			except IntegrityError :
+				# registered by someone else since the username was validated
+				log_auth('register', 'username_taken', req.get("username"))
+				return USERNAME_TAKEN_RESPONSE.response()
 
 			tokens = get_tokens_for_user(ret_user)
+			log_auth('register', 'created', ret_user.username)
 
 			return Response({
 				"tokens" : tokens,
 				"username" : ret_user.username
 			}, status=STATUS_CODE_2xx.CREATED.value)
-		
+
+		except HashPoolSaturated :
+			log_auth('register', 'server_busy', None, logging.WARNING)
+			return SERVER_BUSY_RESPONSE.response()
+
+		except Exception :
+			logger.exception("Registration failed")
+			return REGISTRATION_FAILED_RESPONSE.response()
+
+class RegisterBulkView(AuthThrottleMixin, APIView):
+	throttle_classes = [IPRateThrottle, GlobalRateThrottle]
+
+	def post(self, request) :
+		try :
+			secret_key, rows = parse_roster(request)
+		except RosterError as e :
+			return Response({"message" : str(e)}, status=STATUS_CODE_4xx.BAD_REQUEST.value)
 		except Exception :
-			traceback.print_exc()
-			return Response({"message" : "User could not be created, please try again later"}, status=STATUS_CODE_4xx.BAD_REQUEST.value)
+			logger.exception("Roster could not be read")
+			return Response({"message" : "Roster could not be read, please supply JSON or CSV"}, status=STATUS_CODE_4xx.BAD_REQUEST.value)
+
+		if not is_secret_key_valid(secret_key) :
+			return INVALID_SECRET_KEY_RESPONSE.response()
+
+		# one JSON document per line, so clients can show progress while later chunks are still hashing
+		results = (json.dumps(result) + "\n" for result in register_roster(rows, secret_key))
+		return StreamingHttpResponse(results, content_type="application/x-ndjson", status=STATUS_CODE_2xx.SUCCESS.value)
 
-class LoginView(APIView):
+class LoginView(AuthThrottleMixin, APIView):
 	def put(self, request) :
 		try :
 			req = json.loads(request.body.decode('utf-8'))
 
-			try:
-				User.objects.get(username=req['username'])
-			except Exception :
-				return Response({"message" : "User with supplied username does not exist, please register before logging in"}, status=STATUS_CODE_4xx.BAD_REQUEST.value)
+			user = username_filter.get_user(req['username'])
+			if user is None :
+				log_auth('login', 'unknown_username', req['username'], logging.WARNING)
+				return UNKNOWN_USERNAME_RESPONSE.response()
 			
-			user = authenticate(username=req['username'], password=req['password'])
+			with timed('auth_step_duration_seconds', step='authenticate') :
+				user = authenticate(request, user=user, password=req['password'])
 
 			if user :
 				tokens = get_tokens_for_user(user)
+				log_auth('login', 'success', user.username)
 				return Response({
 					"tokens" : tokens,
 					"username" : user.username
 				}, status=STATUS_CODE_2xx.ACCEPTED.value)
 
 			else :
-				return Response({"message" : "Incorrect authentication details supplied, please ensure that the correct password was entered"}, status=STATUS_CODE_4xx.UNAUTHORIZED.value)
+				log_auth('login', 'incorrect_password', req['username'], logging.WARNING)
+				return INCORRECT_DETAILS_RESPONSE.response()
+
+		except HashPoolSaturated :
+			log_auth('login', 'server_busy', None, logging.WARNING)
+			return SERVER_BUSY_RESPONSE.response()
 
 		except Exception :
-			traceback.print_exc()
-			return Response({"message" : "Incorrect authentication details supplied, please ensure that the correct password was entered"}, status=STATUS_CODE_4xx.UNAUTHORIZED.value)
+			logger.exception("Login failed")
+			return INCORRECT_DETAILS_RESPONSE.response()
 
 
+class RefreshTokensView(TokenRefreshView):
+	serializer_class = RotatingTokenRefreshSerializer
+
+class LogoutView(APIView):
+	def post(self, request) :
+		try :
+			req = json.loads(request.body.decode('utf-8'))
+			refresh = RefreshToken(req['refresh'])
+		except (ValueError, KeyError, TypeError, TokenError) :
+			return INVALID_REFRESH_TOKEN_RESPONSE.response()
+
+		revocation_store.revoke(refresh[api_settings.JTI_CLAIM], refresh['exp'])
+		return Response({"message" : "Logged out"}, status=STATUS_CODE_2xx.SUCCESS.value)
 
 
 
 # Frontend View
-class FrontendView(APIView) :
+class FrontendView(View) :
 	def get(self, request):
+		if settings.SPA_SHELL_PRECOMPILED :
+			return spa_shell.response(request)
+
 		return render(request, 'index.html')
\ No newline at end of file
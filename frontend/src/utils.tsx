@@ -4,7 +4,7 @@
   This file is subject to the terms and conditions defined in file 'LICENSE.txt', which is part of this source code package.
 */
 
-import axios, { AxiosResponse } from 'axios';
+import axios, { AxiosResponse, Method } from 'axios';
 import { ok, err, Result } from 'neverthrow';
 import React, { ReactElement } from 'react';
 
@@ -48,7 +48,8 @@ interface RefreshTokensRESTSubmit {
 }
 
 interface RefreshTokensREST {
-	access: string
+	access: string,
+	refresh?: string // refresh tokens are rotated, each one can only be used once
 }
 
 /* Authentication REST types */
@@ -89,222 +90,248 @@ const ErrorMessageText: React.FC<ErrorMessageTextProps> = ({ statusText, message
 /* Message returned when neither new refresh tokens can be retrieved, nor the API can be successfully reached */
 const UnreachableErrorMessage: string = "API is not successfully accessible. Please re-login and try again, otherwise, please contact support";
 
-/* JWT Access token refresh function that is called whenever the access token expires */
-async function getNewAccessToken(): Promise<boolean> {
-	try {
-		const tokens: Tokens = JSON.parse(localStorage.tokens);
+/* Status texts for the results of batched calls, which only carry the status code */
+const StatusTexts: { [status: number]: string } = {
+	400: "Bad Request",
+	401: "Unauthorized",
+	403: "Forbidden",
+	404: "Not Found",
+	405: "Method Not Allowed",
+	429: "Too Many Requests",
+	500: "Internal Server Error",
+	503: "Service Unavailable"
+};
+
+/* Outcome of a single call, whether it was sent on its own or as part of a batch */
+interface CallOutcome {
+	status: number, // 0 when the API could not be reached at all
+	statusText: string,
+	data: any,
+	errorName?: string,
+	errorMessage?: string
+}
 
-		if (tokens.refresh !== "") {
-			const data: RefreshTokensRESTSubmit = {
-				refresh: tokens.refresh
-			};
+/* Call waiting to be sent, calls made in the same tick are sent together through the batch endpoint */
+interface QueuedCall {
+	method: Method,
+	address: string,
+	data?: unknown,
+	authentication: boolean,
+	resolve: (outcome: CallOutcome) => void
+}
+
+/* Batch endpoint REST types */
+const batchRESTLink: string = '/batch/';
+interface BatchRESTSubmit {
+	requests: {
+		method: Method,
+		path: string,
+		body?: unknown
+	}[]
+}
 
-			const result: Result<RefreshTokensREST, RESTError> = await resolvePOSTCall<RefreshTokensREST, RefreshTokensRESTSubmit>('/auth/refresh_tokens/', data, false, true);
+interface BatchREST {
+	responses: {
+		status: number,
+		headers: { [name: string]: string },
+		body: any
+	}[]
+}
 
-			result
-				.map(res => {
-					tokens.access = res.access;
-					localStorage.setItem("tokens", JSON.stringify(tokens));
+/* Same as the server's BATCH_REQUESTS MAX_REQUESTS, larger queues are sent as several batches */
+const maxBatchSize: number = 20;
 
-					return null; // necessary to silence warning
-				})
-				.mapErr(err => {
-					console.error(err.message);
-				});
+var queuedCalls: QueuedCall[] = [];
+var flushScheduled: boolean = false;
 
-			return true;
-		}
+/* Refresh in flight, shared by every call that finds its access token expired so that only one refresh is made */
+var refreshInFlight: Promise<boolean> | null = null;
 
-		return false;
-	} catch (error) {
-		return false;
-	}
+function getAuthenticationHeaders(): AuthenticationHeaders {
+	const tokens: Tokens = JSON.parse(localStorage.tokens);
+	return { headers: { "Authorization": `Bearer ${tokens.access}` } };
 }
 
-/* Helper function for making RESTful GET/retrieval calls */
-export async function resolveGETCall<MessageT>(address: string, authentication: boolean = false, recursiveCall: boolean = false): Promise<Result<MessageT, RESTError>> {
+/* Sends one call on its own */
+async function sendCall(method: Method, address: string, data: unknown, authentication: boolean): Promise<CallOutcome> {
 	try {
-		var res: AxiosResponse<MessageT>;
-
-		if (!authentication) {
-			res = await axios.get<MessageT>(config.apiURL + address);
-		} else {
-			const tokens: Tokens = JSON.parse(localStorage.tokens);
-			const headers: AuthenticationHeaders = { headers: { "Authorization": `Bearer ${tokens.access}` } };
-			res = await axios.get<MessageT>(config.apiURL + address, headers);
-		}
+		const headers = authentication ? getAuthenticationHeaders().headers : {};
+		const res: AxiosResponse = await axios.request({ method: method, url: config.apiURL + address, data: data, headers: headers });
 
-		return ok(res.data);
+		return { status: res.status, statusText: res.statusText, data: res.data };
 	} catch (error) {
-		if (recursiveCall) {
-			var retErr: RESTError;
-			const hasResponseMessage: boolean = error.response && error.response.data && error.response.data.message;
-
-			retErr = {
-				message: hasResponseMessage ? error.response.data.message : error.message,
-				type: hasResponseMessage ? "RESTError" : error.name,
-				status: hasResponseMessage ? error.response.status : 401,
-				statusText: hasResponseMessage ? error.response.statusText : "Unauthorized"
-			};
+		if (error.response) {
+			return { status: error.response.status, statusText: error.response.statusText, data: error.response.data };
+		}
 
-			retErr.message = <ErrorMessageText {...retErr} />;
+		return { status: 0, statusText: "", data: null, errorName: error.name, errorMessage: error.message };
+	}
+}
 
-			return err(retErr);
-		}
+/* Sends calls sharing the same authentication as one batch, or on its own if there is only one */
+async function sendCalls(calls: QueuedCall[]): Promise<void> {
+	if (calls.length === 1) {
+		const call: QueuedCall = calls[0];
+		call.resolve(await sendCall(call.method, call.address, call.data, call.authentication));
+		return;
+	}
 
-		const successfullyGotNewAccess: boolean = await getNewAccessToken();
+	const batch: BatchRESTSubmit = {
+		requests: calls.map(call => ({ method: call.method, path: call.address, body: call.data }))
+	};
 
-		if (successfullyGotNewAccess) {
-			return await resolveGETCall<MessageT>(address, authentication, true);
-		}
+	const outcome: CallOutcome = await sendCall('POST', batchRESTLink, batch, calls[0].authentication);
 
-		const unreachableErr: RESTError = {
-			message: UnreachableErrorMessage,
-			type: "RESTError",
-			status: 403,
-			statusText: "Forbidden"
-		};
-		return err(unreachableErr);
+	if (outcome.status !== 200) {
+		// the batch as a whole failed, most likely its access token expired, so every call fails the same way and retries
+		calls.forEach(call => call.resolve(outcome));
+		return;
 	}
-}
 
-/* Helper function for making RESTful POST/creation calls */
-export async function resolvePOSTCall<MessageT, PayloadT>(address: string, data: PayloadT, authentication: boolean = false, recursiveCall: boolean = false): Promise<Result<MessageT, RESTError>> {
-	try {
-		var res: AxiosResponse<MessageT>;
-
-		if (!authentication) {
-			res = await axios.post<MessageT>(config.apiURL + address, data);
-		} else {
-			const tokens: Tokens = JSON.parse(localStorage.tokens);
-			const headers: AuthenticationHeaders = { headers: { "Authorization": `Bearer ${tokens.access}` } };
-			res = await axios.post<MessageT>(config.apiURL + address, data, headers);
-		}
+	if (!outcome.data || !Array.isArray(outcome.data.responses) || outcome.data.responses.length !== calls.length) {
+		// not a batch this client understands, so fall back to sending the calls on their own
+		await Promise.all(calls.map(async call => call.resolve(await sendCall(call.method, call.address, call.data, call.authentication))));
+		return;
+	}
 
-		return ok(res.data);
-	} catch (error) {
-		if (recursiveCall) {
-			var retErr: RESTError;
-			const hasResponseMessage: boolean = error.response && error.response.data && error.response.data.message;
-
-			retErr = {
-				message: hasResponseMessage ? error.response.data.message : error.message,
-				type: hasResponseMessage ? "RESTError" : error.name,
-				status: hasResponseMessage ? error.response.status : 401,
-				statusText: hasResponseMessage ? error.response.statusText : "Unauthorized"
-			};
+	const responses: BatchREST['responses'] = outcome.data.responses;
+	calls.forEach((call, i) => call.resolve({
+		status: responses[i].status,
+		statusText: StatusTexts[responses[i].status] || "",
+		data: responses[i].body
+	}));
+}
+
+/* Sends every queued call, a batch for the authenticated calls and one for the others, so a stale token only fails the former */
+function flushCalls(): void {
+	const calls: QueuedCall[] = queuedCalls;
+	queuedCalls = [];
+	flushScheduled = false;
 
-			retErr.message = <ErrorMessageText {...retErr} />;
+	for (const authentication of [true, false]) {
+		const group: QueuedCall[] = calls.filter(call => call.authentication === authentication);
 
-			return err(retErr);
+		for (let i = 0; i < group.length; i += maxBatchSize) {
+			sendCalls(group.slice(i, i + maxBatchSize));
 		}
+	}
+}
 
-		const successfullyGotNewAccess: boolean = await getNewAccessToken();
+/* Queues a call to be sent with any others made in the same tick */
+function queueCall(method: Method, address: string, data: unknown, authentication: boolean): Promise<CallOutcome> {
+	return new Promise<CallOutcome>(resolve => {
+		queuedCalls.push({ method: method, address: address, data: data, authentication: authentication, resolve: resolve });
 
-		if (successfullyGotNewAccess) {
-			return await resolvePOSTCall<MessageT, PayloadT>(address, data, authentication, true);
+		if (!flushScheduled) {
+			flushScheduled = true;
+			setTimeout(flushCalls, 0);
 		}
+	});
+}
 
-		const unreachableErr: RESTError = {
-			message: UnreachableErrorMessage,
-			type: "RESTError",
-			status: 403,
-			statusText: "Forbidden"
-		};
-		return err(unreachableErr);
-	}
+/* Turns a failed call's outcome into the error handed back to pages */
+function getRESTError(outcome: CallOutcome): RESTError {
+	const hasResponseMessage: boolean = outcome.status !== 0 && outcome.data && outcome.data.message;
+
+	const retErr: RESTError = {
+		message: hasResponseMessage ? outcome.data.message : (outcome.errorMessage || outcome.statusText),
+		type: hasResponseMessage ? "RESTError" : (outcome.errorName || "Error"),
+		status: hasResponseMessage ? outcome.status : 401,
+		statusText: hasResponseMessage ? outcome.statusText : "Unauthorized"
+	};
+
+	retErr.message = <ErrorMessageText {...retErr} />;
+
+	return retErr;
 }
 
-/* Helper function for making RESTful PUT/update calls */
-export async function resolvePUTCall<MessageT, PayloadT>(address: string, data: PayloadT, authentication: boolean = false, recursiveCall: boolean = false): Promise<Result<MessageT, RESTError>> {
+/* JWT Access token refresh, sent on its own as the expired token would fail any batch it was part of */
+async function refreshAccessToken(): Promise<boolean> {
 	try {
-		var res: AxiosResponse<MessageT>;
-
-		if (!authentication) {
-			res = await axios.put<MessageT>(config.apiURL + address, data);
-		} else {
-			const tokens: Tokens = JSON.parse(localStorage.tokens);
-			const headers: AuthenticationHeaders = { headers: { "Authorization": `Bearer ${tokens.access}` } };
-			res = await axios.put<MessageT>(config.apiURL + address, data, headers);
-		}
+		const tokens: Tokens = JSON.parse(localStorage.tokens);
 
-		return ok(res.data);
-	} catch (error) {
-		if (recursiveCall) {
-			var retErr: RESTError;
-			const hasResponseMessage: boolean = error.response && error.response.data && error.response.data.message;
-
-			retErr = {
-				message: hasResponseMessage ? error.response.data.message : error.message,
-				type: hasResponseMessage ? "RESTError" : error.name,
-				status: hasResponseMessage ? error.response.status : 401,
-				statusText: hasResponseMessage ? error.response.statusText : "Unauthorized"
+		if (tokens.refresh !== "") {
+			const data: RefreshTokensRESTSubmit = {
+				refresh: tokens.refresh
 			};
 
-			retErr.message = <ErrorMessageText {...retErr} />;
+			const outcome: CallOutcome = await sendCall('POST', '/auth/refresh_tokens/', data, false);
 
-			return err(retErr);
-		}
+			if (outcome.status >= 200 && outcome.status < 300) {
+				const res: RefreshTokensREST = outcome.data;
 
-		const successfullyGotNewAccess: boolean = await getNewAccessToken();
+				tokens.access = res.access;
+				if (res.refresh) {
+					tokens.refresh = res.refresh;
+				}
+				localStorage.setItem("tokens", JSON.stringify(tokens));
+			} else {
+				console.error(getRESTError(outcome).message);
+			}
 
-		if (successfullyGotNewAccess) {
-			return await resolvePUTCall<MessageT, PayloadT>(address, data, authentication, true);
+			return true;
 		}
 
-		const unreachableErr: RESTError = {
-			message: UnreachableErrorMessage,
-			type: "RESTError",
-			status: 403,
-			statusText: "Forbidden"
-		};
-		return err(unreachableErr);
+		return false;
+	} catch (error) {
+		return false;
 	}
 }
 
-/* Helper function for making RESTful DELETE calls */
-export async function resolveDELETECall<MessageT>(address: string, authentication: boolean = false, recursiveCall: boolean = false): Promise<Result<MessageT, RESTError>> {
-	try {
-		var res: AxiosResponse<MessageT>;
-
-		if (!authentication) {
-			res = await axios.delete<MessageT>(config.apiURL + address);
-		} else {
-			const tokens: Tokens = JSON.parse(localStorage.tokens);
-			const headers: AuthenticationHeaders = { headers: { "Authorization": `Bearer ${tokens.access}` } };
-			res = await axios.delete<MessageT>(config.apiURL + address, headers);
-		}
+/* JWT Access token refresh function that is called whenever the access token expires, calls failing together share one refresh */
+function getNewAccessToken(): Promise<boolean> {
+	if (refreshInFlight === null) {
+		refreshInFlight = refreshAccessToken().finally(() => {
+			refreshInFlight = null;
+		});
+	}
 
-		return ok(res.data);
-	} catch (error) {
-		if (recursiveCall) {
-			var retErr: RESTError;
-			const hasResponseMessage: boolean = error.response && error.response.data && error.response.data.message;
-
-			retErr = {
-				message: hasResponseMessage ? error.response.data.message : error.message,
-				type: hasResponseMessage ? "RESTError" : error.name,
-				status: hasResponseMessage ? error.response.status : 401,
-				statusText: hasResponseMessage ? error.response.statusText : "Unauthorized"
-			};
+	return refreshInFlight;
+}
 
-			retErr.message = <ErrorMessageText {...retErr} />;
+/* Makes a call, refreshing the access token and retrying once if it fails */
+async function resolveCall<MessageT>(method: Method, address: string, data: unknown, authentication: boolean, recursiveCall: boolean): Promise<Result<MessageT, RESTError>> {
+	const outcome: CallOutcome = await queueCall(method, address, data, authentication);
 
-			return err(retErr);
-		}
+	if (outcome.status >= 200 && outcome.status < 300) {
+		return ok(outcome.data);
+	}
 
-		const successfullyGotNewAccess: boolean = await getNewAccessToken();
+	if (recursiveCall) {
+		return err(getRESTError(outcome));
+	}
 
-		if (successfullyGotNewAccess) {
-			return await resolveDELETECall<MessageT>(address, authentication, true);
-		}
+	const successfullyGotNewAccess: boolean = await getNewAccessToken();
 
-		const unreachableErr: RESTError = {
-			message: UnreachableErrorMessage,
-			type: "RESTError",
-			status: 403,
-			statusText: "Forbidden"
-		};
-		return err(unreachableErr);
+	if (successfullyGotNewAccess) {
+		return await resolveCall<MessageT>(method, address, data, authentication, true);
 	}
-}
\ No newline at end of file
+
+	const unreachableErr: RESTError = {
+		message: UnreachableErrorMessage,
+		type: "RESTError",
+		status: 403,
+		statusText: "Forbidden"
+	};
+	return err(unreachableErr);
+}
+
+/* Helper function for making RESTful GET/retrieval calls */
+export async function resolveGETCall<MessageT>(address: string, authentication: boolean = false, recursiveCall: boolean = false): Promise<Result<MessageT, RESTError>> {
+	return await resolveCall<MessageT>('GET', address, undefined, authentication, recursiveCall);
+}
+
+/* Helper function for making RESTful POST/creation calls */
+export async function resolvePOSTCall<MessageT, PayloadT>(address: string, data: PayloadT, authentication: boolean = false, recursiveCall: boolean = false): Promise<Result<MessageT, RESTError>> {
+	return await resolveCall<MessageT>('POST', address, data, authentication, recursiveCall);
+}
+
+/* Helper function for making RESTful PUT/update calls */
+export async function resolvePUTCall<MessageT, PayloadT>(address: string, data: PayloadT, authentication: boolean = false, recursiveCall: boolean = false): Promise<Result<MessageT, RESTError>> {
+	return await resolveCall<MessageT>('PUT', address, data, authentication, recursiveCall);
+}
+
+/* Helper function for making RESTful DELETE calls */
+export async function resolveDELETECall<MessageT>(address: string, authentication: boolean = false, recursiveCall: boolean = false): Promise<Result<MessageT, RESTError>> {
+	return await resolveCall<MessageT>('DELETE', address, undefined, authentication, recursiveCall);
+}